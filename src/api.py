@@ -3,6 +3,8 @@ from flask import request
 import asyncio
 import functools
 import typing
+from inspect import iscoroutinefunction
+from operator import attrgetter
 from bot.music_client import MusicClient
 
 
@@ -62,76 +64,109 @@ class APIHandler(Flask):
         self.add_url_rule("/command/repeat", view_func=self.repeat)
         self.add_url_rule("/command/no_loop", view_func=self.no_loop)
 
+    def _session(self):
+        """The session of the guild given by the `guild` id query parameter, or the
+        selected session."""
+        guild_id = request.args.get("guild", type=int)
+        if guild_id is None:
+            return self.client.session
+        return self.client.sessions.get(guild_id)
+
+    def _call(self, command: str, *args):
+        """Calls a command of the routed session on the client's event loop, e.g.
+        `song_skip` or `playlist.loop_mode`. Returns False if there is no such session."""
+        session = self._session()
+        if session is None:
+            return False
+        func = attrgetter(command)(session)
+        if iscoroutinefunction(func):
+            asyncio.run_coroutine_threadsafe(func(*args), self.client.loop)
+        else:
+            self.client.loop.call_soon_threadsafe(func, *args)
+        return True
+
     def get_channels(self):
-        return str(self.client.voice_channels)
+        return str(self.client.channels.channels())
 
     def leave_channel(self):
-        asyncio.run_coroutine_threadsafe(self.client.voice_leave(), self.client.loop)
+        if not self._call("voice_leave"):
+            return "No session for guild", 404
         return "Left Channel"
 
     def join_channel(self, channel_number):
         asyncio.run_coroutine_threadsafe(
-            self.client.voice_join(channel_number), self.client.loop
+            self.client.voice_join([str(channel_number)]), self.client.loop
         )
         return "Joined Channel"
 
     def pause(self):
-        asyncio.run_coroutine_threadsafe(self.client.audio_pause(), self.client.loop)
+        if not self._call("audio_pause"):
+            return "No session for guild", 404
         return "Paused"
 
     def resume(self):
-        asyncio.run_coroutine_threadsafe(self.client.audio_resume(), self.client.loop)
+        if not self._call("audio_resume"):
+            return "No session for guild", 404
         return "Resumed"
 
     def set_volume(self, volume_number: int):
-        asyncio.run_coroutine_threadsafe(
-            self.client.set_audio_volume(volume_number), self.client.loop
-        )
+        if not self._call("set_audio_volume", volume_number):
+            return "No session for guild", 404
         return "Volume has been set"
 
     def skip(self):
-        asyncio.run_coroutine_threadsafe(self.client.song_skip(), self.client.loop)
+        if not self._call("song_skip"):
+            return "No session for guild", 404
         return "Skipped song"
 
     def previous(self):
-        asyncio.run_coroutine_threadsafe(self.client.song_prev(), self.client.loop)
+        if not self._call("song_prev"):
+            return "No session for guild", 404
         return "Returning to Previous Song"
 
     def playlist_queue(self):
         songs = request.json["songs"]
-        self.client.playlist_queue(songs)
+        if not self._call("playlist_queue", songs):
+            return "No session for guild", 404
         return "Added songs to the playlist"
 
     def playlist_start(self):
-        asyncio.run_coroutine_threadsafe(self.client.playlist_start(), self.client.loop)
+        if not self._call("playlist_start"):
+            return "No session for guild", 404
         return "Starting Playlist..."
 
     def playlist_stop(self):
-        asyncio.run_coroutine_threadsafe(self.client.playlist_stop(), self.client.loop)
+        if not self._call("playlist_stop"):
+            return "No session for guild", 404
         return "Playlist Stopped!"
 
     def playlist_clear(self):
-        asyncio.run_coroutine_threadsafe(self.client.clear(), self.client.loop)
+        if not self._call("playlist.clear_all"):
+            return "No session for guild", 404
         return "Cleared List of Songs"
 
     def playlist_play(self):
-        asyncio.run_coroutine_threadsafe(self.client.playlist_play(), self.client.loop)
+        songs = request.json["songs"]
+        if not self._call("playlist_play", songs):
+            return "No session for guild", 404
         return "Playing New Playlist"
 
     def shuffle(self):
-        asyncio.run_coroutine_threadsafe(self.client.shuffle_mode(), self.client.loop)
+        if not self._call("playlist.shuffle_mode"):
+            return "No session for guild", 404
         return "Shuffled Songs"
 
     def loop_songs(self):
-        asyncio.run_coroutine_threadsafe(self.client.loop_mode(), self.client.loop)
+        if not self._call("playlist.loop_mode"):
+            return "No session for guild", 404
         return "Looping All Songs"
 
     def repeat(self):
-        asyncio.run_coroutine_threadsafe(self.client.repeat_mode(), self.client.loop)
+        if not self._call("playlist.repeat_mode"):
+            return "No session for guild", 404
         return "Repeating Song..."
 
     def no_loop(self):
-        asyncio.run_coroutine_threadsafe(
-            self.client.no_looping_mode(), self.client.loop
-        )
+        if not self._call("playlist.no_looping_mode"):
+            return "No session for guild", 404
         return "Normal Play Resuming"
@@ -0,0 +1,253 @@
+"""Persistent on-disk cache of the audio of frequently played songs."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import typing
+from collections import Counter, OrderedDict
+
+import utils
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+class AudioCache:
+    """Size-bounded LRU cache of downloaded song audio, addressed by content.
+
+    Songs are downloaded in the background once they were played `min_plays` times, then
+    played from the local file instead of streamed. Files are named by the SHA-256 of their
+    content, and moved into the cache atomically once complete, so a file in the cache is
+    never partially written. The least recently played songs are evicted once the files
+    exceed the byte budget.
+
+    The index of cached songs is a small JSON file, rewritten atomically when songs are
+    added and when the cache is closed, so it reloads quickly on startup.
+    """
+
+    INDEX_FILE = "index.json"
+    TEMP_DIR = "tmp"
+    MAX_TRACKED_PLAYS = 4096
+
+    def __init__(
+        self,
+        directory: str,
+        budget: int,
+        download: typing.Callable[[str, str], typing.Awaitable[tuple[str, dict]]],
+        *,
+        min_plays: int = 2,
+    ):
+        """|Blocking| Opens the cache in `directory`, loading its index.
+
+        Args:
+            directory (str): Directory to store the cached audio files and index in.
+            budget (int): Maximum total size of the cached audio files, in bytes.
+            download (Callable[[str, str], Awaitable[tuple[str, dict]]]): Coroutine function
+                downloading a song url into a directory, returning the downloaded file's
+                path and the song's info, or raising OSError if it failed.
+            min_plays (int, optional): Plays of a song before it is cached. Defaults to 2.
+        """
+
+        self.directory = directory
+        self.budget = budget
+        self.download = download
+        self.min_plays = min_plays
+        self.temp_dir = os.path.join(directory, self.TEMP_DIR)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        for name in os.listdir(self.temp_dir):  # Downloads interrupted by a restart.
+            os.remove(os.path.join(self.temp_dir, name))
+
+        # Canonical url -> (file name, size, title), from least to most recently played.
+        self._entries: OrderedDict[str, tuple[str, int, str]] = OrderedDict()
+        self._size: int = 0
+        self._plays: Counter = Counter()
+        self._downloads: dict[str, asyncio.Task] = {}
+        self._load_index()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached audio files, in bytes."""
+
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _load_index(self):
+        """|Blocking| Loads the index, ignoring songs whose file is missing."""
+
+        try:
+            with open(
+                os.path.join(self.directory, self.INDEX_FILE), encoding="utf-8"
+            ) as file:
+                entries = json.load(file)["entries"]
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError) as e:
+            _log.error("Ignoring corrupt audio cache index: '%s'", e)
+            return
+
+        files = set(os.listdir(self.directory))
+        for key, name, size, title in entries:
+            if name in files:
+                self._entries[key] = (name, size, title)
+                self._size += size
+        _log.info("Loaded audio cache of %s songs.", len(self._entries))
+
+    def lookup(self, key: str) -> tuple[str, str] | None:
+        """Retrieves the local file of a song, marking it as recently played.
+
+        Args:
+            key (str): Canonical url of the song.
+
+        Returns:
+            tuple[str, str] | None: Path of the song's audio file and its title,
+            or None if the song is not cached.
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        name, size, title = entry
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            del self._entries[key]
+            self._size -= size
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return path, title
+
+    def record_play(self, key: str, url: str):
+        """Counts a play of a song, downloading it in the background once it was played
+        `min_plays` times.
+
+        Args:
+            key (str): Canonical url of the song.
+            url (str): URL to download the song from.
+        """
+
+        if key in self._entries or key in self._downloads:
+            return
+        if key not in self._plays and len(self._plays) >= self.MAX_TRACKED_PLAYS:
+            self._forget_plays()
+        self._plays[key] += 1
+        if self._plays[key] >= self.min_plays:
+            del self._plays[key]
+            task = asyncio.get_running_loop().create_task(self._add(key, url))
+            self._downloads[key] = task
+            task.add_done_callback(lambda _: self._downloads.pop(key, None))
+
+    def _forget_plays(self):
+        """Stops counting the plays of the least played quarter of the songs tracked,
+        the oldest tracked first among songs played as many times."""
+
+        least_played = sorted(self._plays, key=self._plays.__getitem__)
+        for key in least_played[: len(least_played) // 4 or 1]:
+            del self._plays[key]
+
+    async def _add(self, key: str, url: str):
+        """|coro| Downloads a song into the cache, evicting songs to stay within budget."""
+
+        # Downloaded into a directory of its own, so partial files are removed with it.
+        directory = await asyncio.to_thread(tempfile.mkdtemp, dir=self.temp_dir)
+        try:
+            path, data = await self.download(url, directory)
+            name, size = await asyncio.to_thread(self._store, path)
+        except Exception as e:  # noqa: BLE001 - the song is streamed instead.
+            _log.error("Failed to cache audio of '%s': '%s'", url, e)
+            return
+        finally:
+            await asyncio.to_thread(shutil.rmtree, directory, ignore_errors=True)
+
+        if key in self._entries:
+            return
+        self._entries[key] = (name, size, data.get("title"))
+        self._size += size
+        removed = self._evict()
+        await asyncio.to_thread(self._remove, removed)
+        await self.save()
+        _log.debug("Cached audio of '%s'.", url)
+
+    def _store(self, path: str) -> tuple[str, int]:
+        """|Blocking| Moves a downloaded file into the cache, named by its content's hash."""
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(1 << 20):
+                digest.update(chunk)
+        name = digest.hexdigest() + os.path.splitext(path)[1]
+        size = os.path.getsize(path)
+        os.replace(path, os.path.join(self.directory, name))
+        return name, size
+
+    def _evict(self) -> list[str]:
+        """Evicts the least recently played songs until the cache is within budget.
+
+        Returns:
+            list[str]: Names of files no longer used by any cached song.
+        """
+
+        evicted = []
+        while self._size > self.budget and self._entries:
+            _, (name, size, _) = self._entries.popitem(last=False)
+            self._size -= size
+            evicted.append(name)
+        in_use = {name for name, _, _ in self._entries.values()}
+        return [name for name in evicted if name not in in_use]
+
+    def _remove(self, names: list[str]):
+        """|Blocking| Deletes files from the cache."""
+
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    async def save(self):
+        """|coro| Atomically rewrites the index on a worker thread."""
+
+        entries = [[key, *entry] for key, entry in self._entries.items()]
+        await asyncio.to_thread(self._write_index, entries)
+
+    def _write_index(self, entries: list):
+        """|Blocking| Atomically rewrites the index file."""
+
+        path = os.path.join(self.directory, self.INDEX_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"entries": entries}, file, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    async def close(self):
+        """|coro| Cancels downloads in progress, then saves the index."""
+
+        for task in list(self._downloads.values()):
+            task.cancel()
+        await self.save()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache's song count, size in bytes, and hit/miss counters."""
+
+        return {
+            "songs": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
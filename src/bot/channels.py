@@ -0,0 +1,133 @@
+"""Registry of the voice channels the `MusicClient` can join."""
+
+import typing
+from itertools import islice
+
+import discord
+
+
+class ChannelRegistry:
+    """Voice channels of every guild, indexed by guild, by channel id and by name.
+
+    Kept up to date incrementally from channel and guild events, instead of rescanning
+    every guild. Re-adding a guild (e.g. on a reconnect) replaces its channels, so they
+    are not duplicated, and the channels of the other guilds keep their positions.
+    """
+
+    def __init__(self):
+        self._guilds: dict[int, dict[int, discord.VoiceChannel]] = {}
+        self._by_id: dict[int, discord.VoiceChannel] = {}
+        # Casefolded name -> channel ids with that name, in order of registration.
+        self._by_name: dict[str, dict[int, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> typing.Iterator[discord.VoiceChannel]:
+        for channels in self._guilds.values():
+            yield from channels.values()
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._by_id
+
+    def add_guild(self, guild: discord.Guild):
+        """Registers the voice channels of a guild, replacing any registered before."""
+
+        self.remove_guild(guild, keep_position=True)
+        for channel in guild.voice_channels:
+            self.add(channel)
+
+    def remove_guild(self, guild: discord.Guild, keep_position: bool = False):
+        """Unregisters the voice channels of a guild."""
+
+        for channel in list(self._guilds.get(guild.id, {}).values()):
+            self.remove(channel)
+        if not keep_position:
+            self._guilds.pop(guild.id, None)
+
+    def add(self, channel: discord.abc.GuildChannel):
+        """Registers a voice channel, or updates it if registered. Ignores other channels."""
+
+        if not isinstance(channel, discord.VoiceChannel):
+            return
+        if channel.id in self._by_id:
+            self.update(channel, channel)
+            return
+        self._guilds.setdefault(channel.guild.id, {})[channel.id] = channel
+        self._by_id[channel.id] = channel
+        self._by_name.setdefault(channel.name.casefold(), {})[channel.id] = None
+
+    def remove(self, channel: discord.abc.GuildChannel):
+        """Unregisters a voice channel, if registered."""
+
+        registered = self._by_id.pop(channel.id, None)
+        if registered is None:
+            return
+        self._guilds[registered.guild.id].pop(channel.id, None)
+        self._unindex_name(registered)
+
+    def _unindex_name(self, channel: discord.VoiceChannel):
+        name = channel.name.casefold()
+        named = self._by_name[name]
+        del named[channel.id]
+        if not named:
+            del self._by_name[name]
+
+    def update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        """Updates a voice channel that changed, e.g. was renamed, keeping its position."""
+
+        registered = self._by_id.get(before.id)
+        if registered is None or not isinstance(after, discord.VoiceChannel):
+            self.remove(before)
+            self.add(after)
+            return
+        self._unindex_name(registered)
+        self._by_id[after.id] = self._guilds[after.guild.id][after.id] = after
+        self._by_name.setdefault(after.name.casefold(), {})[after.id] = None
+
+    def get(self, channel_id: int) -> discord.VoiceChannel | None:
+        """Retrieves a voice channel by its id."""
+
+        return self._by_id.get(channel_id)
+
+    def at(self, index: int) -> discord.VoiceChannel | None:
+        """Retrieves a voice channel by its index in `channels`, skipping whole guilds
+        rather than building the list."""
+
+        if index < 0:
+            return None
+        for channels in self._guilds.values():
+            if index < len(channels):
+                return next(islice(channels.values(), index, None))
+            index -= len(channels)
+        return None
+
+    def find(
+        self, name: str, guild_id: int | None = None
+    ) -> discord.VoiceChannel | None:
+        """Retrieves a voice channel by its name, ignoring case.
+
+        Args:
+            name (str): Name of the channel.
+            guild_id (int, optional): Prefer a channel of this guild, if several channels
+                have the name. Defaults to None, retrieving the first registered.
+
+        Returns:
+            discord.VoiceChannel | None: The channel, or None if no channel has the name.
+        """
+
+        named = self._by_name.get(name.strip().casefold())
+        if not named:
+            return None
+        if guild_id is not None:
+            for channel_id in named:
+                if self._by_id[channel_id].guild.id == guild_id:
+                    return self._by_id[channel_id]
+        return self._by_id[next(iter(named))]
+
+    def channels(self, guild_id: int | None = None) -> list[discord.VoiceChannel]:
+        """Returns the voice channels of a guild, or of every guild, by index."""
+
+        if guild_id is None:
+            return list(self)
+        return list(self._guilds.get(guild_id, {}).values())
@@ -0,0 +1,166 @@
+"""Event bus publishing the state changes of the `MusicClient`'s sessions.
+
+Sessions publish an event when a song starts or ends, the queue changes, a playlist mode
+is toggled, the volume changes, or the Bot joins or leaves a voice channel:
+
+- `track_start`: `title`, `url` of the song now playing.
+- `track_end`: `error` of the audio player, if any.
+- `queue`: `mutation` of the playlist, and the queue's `length`.
+- `mode`: `shuffle`, `loop` and `repeat` flags of the playlist.
+- `volume`: `volume` in percent.
+- `voice`: `channel` and `channel_id` joined, both None once left.
+
+Every event also has its `type`, the id of its `guild`, and a `seq` number that increases
+with every event published.
+"""
+
+import asyncio
+import collections
+import typing
+
+
+class Subscription:
+    """Bounded queue of the events published to one subscriber.
+
+    Publishing never waits on a subscriber. Once `maxsize` events are pending, the oldest
+    pending event is dropped for each event published. With the `COALESCE` policy, an
+    event replaces the pending event of the same type and guild instead, merging its
+    fields into it, so a subscriber that is behind receives the latest state once.
+    """
+
+    COALESCE = "coalesce"
+    DROP_OLDEST = "drop_oldest"
+    POLICIES = (COALESCE, DROP_OLDEST)
+
+    def __init__(self, bus: "EventBus", maxsize: int = 256, policy: str = COALESCE):
+        """Creates a subscription to the events of `bus`, see `EventBus.subscribe`.
+
+        Raises:
+            ValueError: If the policy is unknown, or `maxsize` is not positive.
+        """
+
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"Unknown policy '{policy}', expected one of {self.POLICIES}"
+            )
+        if maxsize < 1:
+            raise ValueError("A subscription must hold at least 1 event")
+        self.bus = bus
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped: int = 0  # Events dropped, as the subscription was full.
+        self.coalesced: int = 0  # Events merged into a pending event.
+        self.closed = False
+        self._pending: collections.OrderedDict[typing.Hashable, dict] = (
+            collections.OrderedDict()
+        )
+        self._waiter: asyncio.Future = None
+
+    def __len__(self) -> int:
+        """Events pending."""
+
+        return len(self._pending)
+
+    def put(self, event: dict):
+        """Queues an event for the subscriber, without waiting."""
+
+        if self.closed:
+            return
+        if self.policy == self.COALESCE:
+            key = (event["type"], event["guild"])
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.update(event)
+                self._pending.move_to_end(key)
+                self.coalesced += 1
+                self._wake()
+                return
+        else:
+            key = event["seq"]
+        if len(self._pending) >= self.maxsize:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._pending[key] = dict(event)  # A copy, as coalescing updates it.
+        self._wake()
+
+    def get_nowait(self) -> list[dict]:
+        """Returns every pending event, oldest first, emptying the subscription."""
+
+        events = list(self._pending.values())
+        self._pending.clear()
+        return events
+
+    async def get(self) -> list[dict]:
+        """|coro| Returns every pending event, waiting for one if none are pending.
+
+        Returns:
+            list[dict]: Events, oldest first. Empty once the subscription is closed.
+        """
+
+        while not self._pending and not self.closed:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self.get_nowait()
+
+    def close(self):
+        """Unsubscribes from the bus, waking a `get` in progress."""
+
+        self.closed = True
+        self.bus.subscriptions.discard(self)
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class EventBus:
+    """Publishes events to every subscription.
+
+    Events are published on the event loop, by the sessions, and cost a single check when
+    nothing is subscribed.
+    """
+
+    def __init__(self):
+        self.subscriptions: set[Subscription] = set()
+        self.seq: int = 0  # Number of the last event published.
+
+    def subscribe(
+        self, maxsize: int = 256, policy: str = Subscription.COALESCE
+    ) -> Subscription:
+        """Subscribes to the events published from now on, until the subscription is
+        closed.
+
+        Args:
+            maxsize (int, optional): Events pending, past which the oldest are dropped.
+                Defaults to 256.
+            policy (str, optional): `Subscription.COALESCE` to merge events of the same
+                type and guild, or `Subscription.DROP_OLDEST` to keep every event.
+                Defaults to `Subscription.COALESCE`.
+
+        Raises:
+            ValueError: If the policy is unknown, or `maxsize` is not positive.
+        """
+
+        subscription = Subscription(self, maxsize, policy)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def publish(self, kind: str, guild: int, **fields: typing.Any):
+        """Publishes an event of a guild to every subscription.
+
+        Args:
+            kind (str): Type of the event, e.g. `volume`.
+            guild (int): Id of the guild the event happened in.
+            **fields: Fields of the event, e.g. `volume=50`.
+        """
+
+        if not self.subscriptions:
+            return
+        self.seq += 1
+        event = {"type": kind, "guild": guild, "seq": self.seq, **fields}
+        for subscription in list(self.subscriptions):
+            subscription.put(event)
@@ -0,0 +1,251 @@
+"""Extraction of song info by youtube_dl in a pool of worker processes.
+
+youtube_dl's extraction is CPU heavy Python, which competes for the GIL with discord.py's
+audio player thread when it runs on a thread. Running it in worker processes keeps the
+audio player smooth while songs are extracted.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+
+import utils
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+# Fields of the extracted info the Bot uses, the rest is not sent back from the workers.
+# Includes the fields of `YTDLSource.ytdl_format_options["outtmpl"]`.
+INFO_FIELDS = (
+    "id",
+    "title",
+    "url",
+    "ext",
+    "extractor",
+    "duration",
+    "acodec",
+    "abr",
+    "webpage_url",
+)
+
+_ytdl = None  # The YoutubeDL instance of a worker process.
+
+
+def _init_worker(ytdl_options: dict):
+    """Creates the YoutubeDL instance of a worker process."""
+
+    global _ytdl
+    import youtube_dl
+
+    youtube_dl.utils.bug_reports_message = lambda: ""
+    _ytdl = youtube_dl.YoutubeDL(ytdl_options)
+
+
+def _extract_info(url: str, download: bool) -> dict:
+    """Extracts the info of a song in a worker process, trimmed to the `INFO_FIELDS`."""
+
+    data = _ytdl.extract_info(url, download=download)
+    if "entries" in data:
+        # take first item from a playlist
+        data = data["entries"][0]
+    return {field: data.get(field) for field in INFO_FIELDS}
+
+
+def _serve(connection, initializer, initargs: tuple, function):
+    """Runs a worker process: initialises it, then calls `function` on every request
+    received over `connection`, sending back its result or error."""
+
+    initializer(*initargs)
+    connection.send(None)  # Ready.
+    while True:
+        try:
+            args = connection.recv()
+        except EOFError:
+            return  # The extractor closed.
+        try:
+            reply = (True, function(*args))
+        except Exception as e:  # noqa: BLE001 - sent back to be raised by `extract`.
+            reply = (False, e)
+        try:
+            connection.send(reply)
+        except Exception as e:  # noqa: BLE001 - e.g. an error that cannot be pickled.
+            connection.send((False, ExtractionError(repr(e))))
+
+
+class ExtractionError(Exception):
+    """Raised if a worker process hung or crashed while extracting a song."""
+
+
+class _Worker:
+    """A worker process, extracting one song at a time, over a pipe."""
+
+    def __init__(self, context, initializer, initargs: tuple, function):
+        """|Blocking| Starts the worker process, see `_serve`."""
+
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve,
+            args=(child, initializer, initargs, function),
+            name="extraction-worker",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    def call(self, args: tuple, timeout: float) -> tuple:
+        """|Blocking| Sends a request to the worker, then waits for its reply.
+
+        Only the call itself is timed, not the worker starting up.
+
+        Raises:
+            TimeoutError: If the worker did not reply within `timeout` seconds.
+            EOFError: If the worker exited.
+
+        Returns:
+            tuple: Whether the call succeeded, then its result or error.
+        """
+
+        if not self.ready:
+            self.connection.recv()
+            self.ready = True
+        self.connection.send(args)
+        if not self.connection.poll(timeout):
+            raise TimeoutError
+        return self.connection.recv()
+
+    def kill(self):
+        """Kills the worker process. Its pipe is closed once no thread holds it."""
+
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class ProcessPoolExtractor:
+    """Bounded pool of warm worker processes that extract song info with youtube_dl.
+
+    Each extraction waits for an idle worker, then is sent to it. Only the extraction
+    itself is timed: a worker that takes longer than `timeout` to extract a song is
+    assumed to be hung, and is killed. A worker that crashes, or whose extraction is
+    cancelled, is also discarded. Other workers carry on with their extractions, and a
+    fresh worker is started in place of the discarded one when next needed.
+    """
+
+    # Run in the worker processes, so they are passed by reference to module level
+    # functions, rather than bound to the extractor.
+    worker_initializer = staticmethod(_init_worker)
+    worker_function = staticmethod(_extract_info)
+
+    def __init__(
+        self, ytdl_options: dict, *, max_workers: int = 2, timeout: float = 30.0
+    ):
+        """Creates a pool of worker processes, started as they are first needed.
+
+        Args:
+            ytdl_options (dict): Options for the YoutubeDL instance of each worker.
+            max_workers (int, optional): Number of worker processes. Defaults to 2.
+            timeout (float, optional): Seconds an extraction may take before its worker
+                is assumed to be hung. Defaults to 30.0.
+        """
+
+        self.ytdl_options = ytdl_options
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.restarts: int = 0  # Workers discarded, as they hung or crashed.
+        # Spawned, as forking the Bot's process would copy its threads' locks.
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: list[_Worker] = []
+        self._workers: set[_Worker] = set()
+        self._slots = asyncio.Semaphore(max_workers)
+
+    def _spawn(self) -> _Worker:
+        """|Blocking| Starts a new worker process."""
+
+        worker = _Worker(
+            self._context,
+            self.worker_initializer,
+            (self.ytdl_options,),
+            self.worker_function,
+        )
+        self._workers.add(worker)
+        return worker
+
+    def warm(self):
+        """|Blocking| Starts every worker process now, instead of on the first
+        extractions."""
+
+        while len(self._workers) < self.max_workers:
+            self._idle.append(self._spawn())
+
+    def _discard(self, worker: _Worker, reason: str):
+        """Kills a worker that can no longer be trusted with extractions."""
+
+        _log.warning("Extraction worker %s, replacing it.", reason)
+        self.restarts += 1
+        if worker is not None:  # Else it failed to start.
+            self._workers.discard(worker)
+            worker.kill()
+
+    async def extract(self, url: str, download: bool = False) -> dict:
+        """|coro| Extracts the info of a song in a worker process.
+
+        Args:
+            url (str): URL of the song.
+            download (bool, optional): Download the song too. Defaults to False.
+
+        Raises:
+            ExtractionError: if the worker hung or crashed. The worker is replaced.
+            Exception: any error raised by youtube_dl in the worker.
+
+        Returns:
+            dict: The song's info, trimmed to the `INFO_FIELDS`.
+        """
+
+        async with self._slots:  # Waiting for an idle worker is not timed.
+            worker = self._idle.pop() if self._idle else None
+            cancelled = False
+            lock = threading.Lock()  # Hands a spawned worker over, unless cancelled.
+
+            def call() -> tuple[_Worker, tuple]:
+                nonlocal worker
+                if worker is None:
+                    spawned = self._spawn()
+                    with lock:
+                        if cancelled:  # No one is left to return it to the pool.
+                            self._discard(spawned, "was cancelled while starting")
+                            raise asyncio.CancelledError
+                        worker = spawned
+                return worker, worker.call((url, download), self.timeout)
+
+            try:
+                worker, (ok, result) = await asyncio.to_thread(call)
+            except TimeoutError as e:
+                self._discard(worker, "hung")
+                raise ExtractionError(
+                    f"Extraction timed out after {self.timeout}s"
+                ) from e
+            except (EOFError, OSError) as e:
+                self._discard(worker, "crashed")
+                raise ExtractionError("Extraction worker crashed") from e
+            except asyncio.CancelledError:
+                with lock:
+                    cancelled = True
+                if worker is not None:  # Still extracting, so its reply is unwanted.
+                    self._discard(worker, "was cancelled")
+                raise
+            self._idle.append(worker)
+
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        """Kills the worker processes."""
+
+        for worker in self._workers:
+            worker.kill()
+        self._workers.clear()
+        self._idle.clear()
@@ -0,0 +1,79 @@
+"""Bounded history of the songs the `Playlist` has played."""
+
+import typing
+
+
+class PlayHistory:
+    """Fixed capacity ring buffer of recently played song urls.
+
+    Pushing a url onto a full history overwrites the oldest url, so memory stays constant
+    however long the Bot runs. Pushing, popping and indexing are all O(1).
+    Index 0 is the oldest url in the history, and index -1 the most recently pushed.
+    """
+
+    def __init__(self, capacity: int):
+        """Preallocates a history of `capacity` urls.
+
+        Args:
+            capacity (int): Maximum number of urls the history remembers.
+
+        Raises:
+            ValueError: if `capacity` is not a positive integer.
+        """
+
+        if capacity <= 0:
+            raise ValueError("PlayHistory capacity must be positive")
+
+        self.capacity = capacity
+        self._ring: list = [None] * capacity
+        self._start: int = 0
+        self._len: int = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for i in range(self._len):
+            yield self._ring[(self._start + i) % self.capacity]
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("PlayHistory index out of range")
+        return self._ring[(self._start + index) % self.capacity]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r}, capacity={self.capacity})"
+
+    def append(self, url: str):
+        """Pushes a url onto the history, overwriting the oldest url if it is full."""
+
+        end = (self._start + self._len) % self.capacity
+        self._ring[end] = url
+        if self._len < self.capacity:
+            self._len += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+    def pop(self) -> str:
+        """Removes and returns the most recently pushed url.
+
+        Raises:
+            IndexError: if the history is empty.
+        """
+
+        if self._len <= 0:
+            raise IndexError("pop from an empty PlayHistory")
+
+        self._len -= 1
+        end = (self._start + self._len) % self.capacity
+        url, self._ring[end] = self._ring[end], None
+        return url
+
+    def clear(self):
+        """Forgets every url in the history."""
+
+        self._ring = [None] * self.capacity
+        self._start = 0
+        self._len = 0
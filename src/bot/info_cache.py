@@ -0,0 +1,129 @@
+"""In-process cache of the song info extracted by youtube_dl."""
+
+import re
+import time
+import typing
+from collections import OrderedDict
+
+
+# Signed stream urls embed their expiry as `expire=<unix time>`, or `/expire/<unix time>/`.
+_EXPIRE = re.compile(r"[?&/]expire[=/](\d+)")
+
+
+class InfoCache:
+    """LRU cache of youtube_dl info dicts, keyed by canonical song url.
+
+    Each entry expires with the signed stream url in its info, which is only valid for a
+    few hours. An entry expires early enough for the song to be streamed in full before
+    its stream url does. Info without a signed expiry is kept for `default_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 512,
+        *,
+        default_ttl: float = 3600.0,
+        margin: float = 60.0,
+        clock: typing.Callable[[], float] = time.time,
+    ):
+        """Creates an empty cache.
+
+        Args:
+            max_size (int, optional): Maximum number of entries, the least recently used
+                entry is evicted past it. Defaults to 512.
+            default_ttl (float, optional): Seconds to keep info without a signed expiry.
+                Defaults to 3600.0.
+            margin (float, optional): Seconds to expire entries before the song could no
+                longer be streamed in full. Defaults to 60.0.
+            clock (Callable[[], float], optional): Unix time source. Defaults to `time.time`.
+        """
+
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.margin = margin
+        self.clock = clock
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.expirations: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        """Checks whether a song has unexpired info cached, without counting a hit or miss,
+        or marking it as recently used."""
+
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def _expires_at(self, data: dict) -> float:
+        """Unix time at which `data` should no longer be used to start streaming."""
+
+        match = _EXPIRE.search(data.get("url") or "")
+        if match is None:
+            return self.clock() + self.default_ttl
+        return int(match.group(1)) - (data.get("duration") or 0) - self.margin
+
+    def get(self, key: str) -> dict | None:
+        """Retrieves the cached info of a song, marking it as recently used.
+
+        Args:
+            key (str): Canonical url of the song.
+
+        Returns:
+            dict | None: The song's info, or None if it is not cached or expired.
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, data = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: dict):
+        """Caches the info of a song, evicting the least recently used songs if full.
+        Info whose stream url expires too soon to be streamed is not cached.
+
+        Args:
+            key (str): Canonical url of the song.
+            data (dict): Info extracted by youtube_dl for the song.
+        """
+
+        expires_at = self._expires_at(data)
+        if expires_at <= self.clock():
+            return
+
+        self._entries[key] = (expires_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Removes every entry from the cache. Counters are kept."""
+
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the cache's size and hit/miss/eviction/expiration counters."""
+
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,181 @@
+"""Read-ahead buffering of audio sources, decoupling FFMPEG from the voice send loop."""
+
+import logging
+import threading
+
+import discord
+from discord.opus import Encoder
+
+import utils
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+OPUS_SILENCE = b"\xf8\xff\xfe"  # A 20ms Opus frame of silence.
+
+
+class JitterBuffer(discord.AudioSource):
+    """Reads frames of an audio source ahead of time on a background thread.
+
+    discord.py's audio player reads a frame every 20ms on its own thread, so a stall in
+    the FFMPEG pipe would otherwise delay or drop voice frames. The reader thread keeps a
+    ring of up to `depth` frames filled instead. Once the ring is full, the reader waits
+    until it drains to the `high_watermark`, so it reads in bursts instead of waking
+    every frame.
+
+    Playback starts once `low_watermark` frames are buffered. If the ring runs dry before
+    the original source ended, it is counted as an underrun, and frames of silence are
+    played until `low_watermark` frames are buffered again, instead of ending the song.
+    """
+
+    def __init__(
+        self,
+        original: discord.AudioSource,
+        *,
+        depth: int = 50,
+        low_watermark: int = 10,
+        high_watermark: int = 40,
+    ):
+        """Starts reading ahead from an audio source.
+
+        Args:
+            original (discord.AudioSource): Audio source to buffer.
+            depth (int, optional): Frames the ring holds. Defaults to 50, i.e. one second.
+            low_watermark (int, optional): Frames buffered before playback (re)starts.
+                Defaults to 10.
+            high_watermark (int, optional): Frames the ring drains to before the reader
+                refills it. Defaults to 40.
+
+        Raises:
+            ValueError: if a watermark does not fit within `depth`.
+        """
+
+        self.original = original
+        self._closed = False
+        self._ready = threading.Condition()
+        try:
+            self.validate(depth, low_watermark, high_watermark)
+        except ValueError:
+            self.cleanup()  # Not played, so the audio player would never clean it up.
+            raise
+
+        self.depth = depth
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self._silence = (
+            OPUS_SILENCE if original.is_opus() else bytes(Encoder.FRAME_SIZE)
+        )
+
+        self._frames: list[bytes] = [None] * depth
+        self._head = 0
+        self._count = 0
+        self._ended = False
+        self._buffering = True
+
+        self.frames: int = 0
+        self.silent_frames: int = 0
+        self.underruns: int = 0
+
+        self._reader = threading.Thread(
+            target=self._read_ahead, name="jitter-buffer", daemon=True
+        )
+        self._reader.start()
+
+    @staticmethod
+    def validate(depth: int, low_watermark: int, high_watermark: int):
+        """Validates the depth and watermarks of a buffer, see `__init__`.
+
+        Raises:
+            ValueError: if a watermark does not fit within `depth`.
+        """
+
+        if not 0 < low_watermark <= depth or not 0 <= high_watermark < depth:
+            raise ValueError(
+                f"Invalid watermarks {low_watermark}/{high_watermark} for depth {depth}."
+            )
+
+    @property
+    def level(self) -> int:
+        """Number of frames buffered."""
+
+        return self._count
+
+    @property
+    def prebuffering(self) -> bool:
+        """Whether no frame of the original source was played yet, so the frames read are
+        silence while the buffer fills."""
+
+        return self.frames == 0 and not self._ended
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def _read_ahead(self):
+        """Reader thread, filling the ring until the original source ends."""
+
+        ready = self._ready
+        while True:
+            with ready:
+                if self._count >= self.depth:
+                    ready.wait_for(
+                        lambda: self._count <= self.high_watermark or self._closed
+                    )
+                if self._closed:
+                    return
+
+            try:
+                frame = self.original.read()
+            except Exception as e:  # noqa: BLE001 - ends the song, not the thread.
+                _log.error("Audio source failed while reading ahead: '%s'", e)
+                frame = b""
+
+            with ready:
+                if not frame:
+                    self._ended = True
+                    return
+                self._frames[(self._head + self._count) % self.depth] = frame
+                self._count += 1
+
+    def read(self) -> bytes:
+        with self._ready:
+            if self._buffering:
+                if self._count < self.low_watermark and not self._ended:
+                    self.silent_frames += 1
+                    return self._silence
+                self._buffering = False
+
+            if self._count == 0:
+                if self._ended:
+                    return b""
+                self.underruns += 1
+                self.silent_frames += 1
+                self._buffering = True
+                return self._silence
+
+            frame = self._frames[self._head]
+            self._frames[self._head] = None
+            self._head = (self._head + 1) % self.depth
+            self._count -= 1
+            self.frames += 1
+            if self._count == self.high_watermark:
+                self._ready.notify()
+            return frame
+
+    def cleanup(self):
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        self.original.cleanup()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the buffered level, and counters of frames played, silent frames
+        played while buffering, and underruns."""
+
+        return {
+            "level": self._count,
+            "frames": self.frames,
+            "silent_frames": self.silent_frames,
+            "underruns": self.underruns,
+        }
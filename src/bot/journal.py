@@ -0,0 +1,197 @@
+"""Persistence of the `Playlist` state across restarts of the Bot."""
+
+import asyncio
+import json
+import logging
+import os
+
+import utils
+from .playlist import Playlist
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+class PlaylistJournal:
+    """Append-only journal of `Playlist` mutations, compacted into periodic snapshots.
+
+    Every journaled Playlist method call is recorded in memory as it happens, then written
+    to the journal file in batches on a worker thread, so recording never blocks the
+    event loop. Once `compact_every` records were written, the Playlist's state is written
+    as a snapshot and the journal is truncated.
+
+    Records and snapshots carry a sequence number, so records already covered by a
+    snapshot are skipped if the Bot stopped between writing a snapshot and truncating
+    the journal.
+    """
+
+    SNAPSHOT_FILE = "playlist.snapshot.json"
+    JOURNAL_FILE = "playlist.journal"
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        flush_interval: float = 1.0,
+        compact_every: int = 10_000,
+    ):
+        """Creates a journal that persists to files in `directory`.
+
+        Args:
+            directory (str): Directory to store the journal and snapshot files in.
+            flush_interval (float, optional): Seconds between writes of recorded mutations.
+                Defaults to 1.0.
+            compact_every (int, optional): Number of records written before the journal
+                is compacted into a snapshot. Defaults to 10,000.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, self.JOURNAL_FILE)
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+
+        self.playlist: Playlist = None
+        self.online: bool = True
+        self._seq: int = 0
+        self._pending: list = []
+        self._since_snapshot: int = 0
+        self._lock = asyncio.Lock()
+
+    def record(self, name: str, args: tuple, kwargs: dict):
+        """Records a call of a Playlist method, to be written on the next flush.
+
+        Args:
+            name (str): Name of the Playlist method called.
+            args (tuple): Positional arguments of the call.
+            kwargs (dict): Keyword arguments of the call.
+        """
+
+        self._seq += 1
+        self._pending.append((self._seq, name, args, kwargs))
+
+    def attach(self, playlist: Playlist):
+        """Starts recording the mutations of `playlist`. The next flush writes a snapshot,
+        as the state the Playlist was attached in (e.g. its shuffle seed) is not journaled.
+        """
+
+        self.playlist = playlist
+        playlist.journal = self
+        self._since_snapshot = self.compact_every
+
+    def restore(self, playlist: Playlist) -> int:
+        """|Blocking| Rebuilds the state of `playlist` from the snapshot and journal files.
+        Should be called before the journal is attached to the Playlist.
+
+        Args:
+            playlist (Playlist): Playlist to restore the persisted state into.
+
+        Returns:
+            int: Number of journal records replayed on top of the snapshot.
+        """
+
+        snapshot_seq = 0
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as file:
+                snapshot = json.load(file)
+            playlist.load_snapshot(snapshot["playlist"])
+            snapshot_seq = snapshot["seq"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            _log.error("Ignoring corrupt playlist snapshot: '%s'", e)
+        self._seq = snapshot_seq
+
+        replayed = 0
+        try:
+            with open(self.journal_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        seq, name, args, kwargs = json.loads(line)
+                    except ValueError:
+                        _log.warning("Stopped replay at a truncated journal record.")
+                        break
+                    if seq <= snapshot_seq:
+                        continue
+                    try:
+                        getattr(playlist, name)(*args, **kwargs)
+                    except Playlist.ExhaustedException:
+                        pass
+                    self._seq = seq
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+
+        self._since_snapshot = replayed
+        _log.info(
+            "Restored playlist of %s songs, replaying %s journal records.",
+            len(playlist.song_queue),
+            replayed,
+        )
+        return replayed
+
+    async def flush(self, compact: bool = False):
+        """|coro| Writes the recorded mutations to the journal on a worker thread.
+        Compacts the journal into a snapshot if enough records were written, or if `compact`.
+
+        Args:
+            compact (bool, optional): Force a snapshot to be written. Defaults to False.
+        """
+
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            self._since_snapshot += len(batch)
+            if self.playlist is not None and (
+                compact or self._since_snapshot >= self.compact_every
+            ):
+                # Captured on the event loop, so it is consistent with the journal, but
+                # only serialised on the worker thread.
+                state, seq = self.playlist.capture(), self._seq
+                self._since_snapshot = 0
+                await asyncio.to_thread(self._write_snapshot, state, seq)
+            elif batch:
+                await asyncio.to_thread(self._append, batch)
+
+    def _append(self, batch: list):
+        """|Blocking| Appends records to the journal file."""
+
+        lines = [json.dumps(record, separators=(",", ":")) + "\n" for record in batch]
+        with open(self.journal_path, "a", encoding="utf-8") as file:
+            file.writelines(lines)
+
+    def _write_snapshot(self, state: dict, seq: int):
+        """|Blocking| Atomically replaces the snapshot file, then truncates the journal.
+
+        Args:
+            state (dict): State of the Playlist, as captured by `Playlist.capture`.
+            seq (int): Sequence number of the last record the state includes.
+        """
+
+        state = Playlist.snapshot_of(state)
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"seq": seq, "playlist": state}, file, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+        _log.debug("Compacted playlist journal into a snapshot @ record %s.", seq)
+
+    async def start(self):
+        """|coro| Periodically flushes the journal until it is closed."""
+
+        while self.online:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                _log.error("Failed to write playlist journal: '%s'", e)
+
+    async def close(self):
+        """|coro| Stops the journal, writing a final snapshot of the Playlist."""
+
+        self.online = False
+        await self.flush(compact=True)
@@ -0,0 +1,228 @@
+"""In-memory latency histograms of the playback pipeline.
+
+Stages of the pipeline are timed into the histograms of `LATENCY`, which the `stats`
+command reports:
+
+- `command`: a Console command, from input to completion.
+- `extract`: youtube_dl extracting the info of a song.
+- `from_url`: opening a song's audio source, extraction included.
+- `ffmpeg_spawn`: starting FFMPEG on a song.
+- `after_hop`: the audio player's `after` callback, until `stream_next` runs on the loop.
+- `first_frame`: the audio player starting, until it reads the song's first frame.
+- `time_to_first_audio`: a song being requested (e.g. `skip`), until its first frame.
+
+Songs a `TrackMixer` advances to are read by the audio player already running, so both
+are timed from the read their first frame was mixed into. The silence a `JitterBuffer`
+plays while it fills is not a song's first frame.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+
+import discord
+
+from .jitter import JitterBuffer
+
+
+class LatencyHistogram:
+    """Histogram of durations, in log spaced buckets.
+
+    Recording is O(log buckets) and memory is fixed, however many durations are recorded.
+    Percentiles are estimated by interpolating within the bucket they fall in, so they are
+    accurate to within a bucket (about 41% of the duration).
+
+    Recording takes no lock, as it is on hot paths: durations recorded by two threads at
+    the same instant may rarely be miscounted, which is fine for stats. The `count` is
+    derived from the buckets, so it always agrees with them.
+    """
+
+    # Upper bounds of the buckets in seconds, from 0.5ms to 32s, doubling every 2 buckets.
+    BOUNDS = tuple(0.0005 * 2 ** (index / 2) for index in range(33))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # The last bucket is unbounded.
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    @property
+    def count(self) -> int:
+        """Number of durations recorded."""
+
+        return sum(self.counts)
+
+    def record(self, seconds: float):
+        """Records a duration. Can be called from any thread."""
+
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Estimates the duration under which `q` percent of the durations fall.
+
+        Args:
+            q (float): Percentile, between 0 and 100.
+
+        Returns:
+            float: The estimated duration in seconds, 0.0 if none were recorded.
+        """
+
+        return self._percentile(list(self.counts), q)
+
+    def _percentile(self, counts: list[int], q: float) -> float:
+        """Estimates a percentile from a copy of the `counts`, see `percentile`."""
+
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q / 100 * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.BOUNDS[index - 1] if index else 0.0
+                upper = self.BOUNDS[index] if index < len(self.BOUNDS) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(estimate, self.max)
+            seen += count
+        return self.max
+
+    def stats(self) -> dict[str, float]:
+        """Returns the number of durations, and their mean, p50, p95, p99 and max."""
+
+        counts = list(self.counts)
+        count = sum(counts)
+        return {
+            "count": count,
+            "mean": self.total / count if count else 0.0,
+            "p50": self._percentile(counts, 50),
+            "p95": self._percentile(counts, 95),
+            "p99": self._percentile(counts, 99),
+            "max": self.max,
+        }
+
+
+class LatencyRecorder:
+    """Named latency histograms, created as they are first recorded into."""
+
+    def __init__(self):
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """Returns the histogram of a stage, creating it if needed."""
+
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def record(self, name: str, seconds: float):
+        """Records the duration of a stage. Can be called from any thread."""
+
+        self.histogram(name).record(seconds)
+
+    @contextlib.contextmanager
+    def time(self, name: str):
+        """Records the duration of the block it wraps, even if the block raised."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Returns the stats of every histogram, by stage."""
+
+        return {name: self.histograms[name].stats() for name in sorted(self.histograms)}
+
+    def report(self) -> list[str]:
+        """Returns a line per stage, with its stats in milliseconds."""
+
+        lines = []
+        for name, stats in self.stats().items():
+            lines.append(
+                f"{name}: n={stats['count']}"
+                + "".join(
+                    f" {key}={stats[key] * 1000:.1f}ms"
+                    for key in ("mean", "p50", "p95", "p99", "max")
+                )
+            )
+        return lines
+
+    def reset(self):
+        """Forgets every recorded duration."""
+
+        with self._lock:
+            self.histograms = {}
+
+
+LATENCY = LatencyRecorder()
+
+
+def _prebuffering(source: discord.AudioSource) -> bool:
+    """Whether `source` plays the silence of a `JitterBuffer` filling before its song's
+    first frame, looking through the mixer and transformers wrapping the buffer."""
+
+    while source is not None:
+        if isinstance(source, JitterBuffer):
+            return source.prebuffering
+        source = getattr(source, "current", None) or getattr(source, "original", None)
+    return False
+
+
+class FirstFrameTimer(discord.AudioSource):
+    """Audio source recording how long the audio player took to read its first frame,
+    and counting the frames it read."""
+
+    def __init__(
+        self,
+        original: discord.AudioSource,
+        requested_at: float | None = None,
+        recorder: LatencyRecorder = LATENCY,
+    ):
+        """Wraps the audio source handed to the audio player.
+
+        Args:
+            original (discord.AudioSource): Audio source to play.
+            requested_at (float, optional): `time.perf_counter()` of the song being
+                requested, to record its time to first audio. Defaults to None.
+            recorder (LatencyRecorder, optional): Defaults to `LATENCY`.
+        """
+
+        self.original = original
+        self.requested_at = requested_at
+        self.recorder = recorder
+        self.started_at = time.perf_counter()
+        self.frames: int = 0
+        self._timed = False
+        self._reading_at: float = self.started_at  # When the last read began.
+
+    def restart(self):
+        """Times the frame being read as the first frame of a new song, e.g. as the
+        wrapped `TrackMixer` advanced to its next song during the read. Must be called
+        from the audio player's thread."""
+
+        self.started_at = self.requested_at = self._reading_at
+        self._timed = False
+
+    def read(self) -> bytes:
+        self._reading_at = time.perf_counter()
+        data = self.original.read()
+        self.frames += 1
+        if not self._timed and not _prebuffering(self.original):
+            self._timed = True
+            now = time.perf_counter()
+            self.recorder.record("first_frame", now - self.started_at)
+            if self.requested_at is not None:
+                self.recorder.record("time_to_first_audio", now - self.requested_at)
+        return data
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.original.cleanup()
@@ -0,0 +1,166 @@
+"""Gapless and crossfaded transitions between consecutive songs."""
+
+import threading
+import typing
+
+import discord
+import numpy as np
+from discord.opus import Encoder
+
+from .gain import GainTransformer
+
+
+class TrackMixer(discord.AudioSource):
+    """PCM audio source playing a song, then the next song queued into it without a gap.
+
+    The audio player keeps reading from the same TrackMixer across songs, so the next song
+    starts on the frame after the current one ends, instead of after the audio player is
+    restarted. The next song is queued ahead of time, already opened and buffering, so the
+    transition does not wait on its extraction.
+
+    With `crossfade_frames`, songs whose duration is known are faded out over their last
+    frames while the next song is faded in, mixing both in vectorised code. Songs of an
+    unknown duration hand over gaplessly when they end.
+
+    If no next song is queued when a song ends, the TrackMixer ends too.
+    """
+
+    SAMPLES = GainTransformer.SAMPLES
+    FRAMES_PER_SECOND = 1000 // Encoder.FRAME_LENGTH
+
+    def __init__(
+        self,
+        track: discord.AudioSource,
+        *,
+        crossfade_frames: int = 0,
+        on_advance: typing.Callable[[discord.AudioSource], None] | None = None,
+    ):
+        """Starts mixing from a first song.
+
+        Args:
+            track (discord.AudioSource): PCM audio source of the first song.
+            crossfade_frames (int, optional): Frames to crossfade consecutive songs over.
+                Defaults to 0, handing over gaplessly.
+            on_advance (Callable[[discord.AudioSource], None], optional): Called with the
+                next song when it starts playing. Called from the audio player's thread.
+        """
+
+        self.current = track
+        self.crossfade_frames = crossfade_frames
+        self.on_advance = on_advance
+        self._next: discord.AudioSource = None
+        self._outgoing: discord.AudioSource = None
+        self._position = 0  # Frames read from the current song.
+        self._fade_left = 0
+        self._fade_total = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # Position of each sample within its frame, as in `GainTransformer`.
+        positions = np.arange(self.SAMPLES, dtype=np.float32) // Encoder.CHANNELS + 1
+        self._positions = positions / Encoder.SAMPLES_PER_FRAME
+        self._fade_in = np.empty(self.SAMPLES, dtype=np.float32)
+        self._mixed = np.zeros(self.SAMPLES, dtype=np.float32)
+        self._out = np.empty(self.SAMPLES, dtype=np.int16)
+
+    @property
+    def next(self) -> discord.AudioSource | None:
+        """The song queued to play after the current song, if any."""
+
+        return self._next
+
+    def queue(self, track: discord.AudioSource):
+        """Queues the song to play after the current song, replacing any queued song.
+        The song is cleaned up instead if the TrackMixer has ended."""
+
+        with self._lock:
+            replaced, self._next = self._next, track
+            if self._closed:
+                replaced, self._next = track, None
+        if replaced is not None:
+            replaced.cleanup()
+
+    def discard_next(self):
+        """Cleans up the queued song, if any, e.g. as the playlist changed."""
+
+        with self._lock:
+            track, self._next = self._next, None
+        if track is not None:
+            track.cleanup()
+
+    def _frames_left(self) -> int | None:
+        """Frames left of the current song, if its duration is known."""
+
+        duration = getattr(self.current, "data", {}).get("duration")
+        if not duration:
+            return None
+        return int(duration * self.FRAMES_PER_SECOND) - self._position
+
+    def read(self) -> bytes:
+        advanced = None
+        finished = []
+        with self._lock:
+            if (
+                self._next is not None
+                and self._outgoing is None
+                and self.crossfade_frames
+            ):
+                frames_left = self._frames_left()
+                if frames_left is not None and frames_left <= self.crossfade_frames:
+                    self._outgoing, self.current = self.current, self._next
+                    self._next, self._position = None, 0
+                    self._fade_left = self._fade_total = max(frames_left, 1)
+                    advanced = self.current
+
+            data = self.current.read()
+            self._position += 1
+            if not data and self._outgoing is None and self._next is not None:
+                finished.append(self.current)
+                self.current, self._next, self._position = self._next, None, 1
+                advanced = self.current
+                data = self.current.read()
+
+            if self._outgoing is not None:
+                outgoing = self._outgoing.read()
+                if outgoing and self._fade_left > 0:
+                    data = self._crossfade(outgoing, data)
+                    self._fade_left -= 1
+                else:
+                    finished.append(self._outgoing)
+                    self._outgoing = None
+
+        for track in finished:
+            track.cleanup()
+        if advanced is not None and self.on_advance is not None:
+            self.on_advance(advanced)
+        return data
+
+    def _crossfade(self, outgoing: bytes, incoming: bytes) -> bytes:
+        """Mixes a frame of the outgoing song fading out with the incoming song fading in."""
+
+        done = self._fade_total - self._fade_left
+        start, step = done / self._fade_total, 1 / self._fade_total
+        fade_in = self._fade_in
+        np.multiply(self._positions, step, out=fade_in)
+        fade_in += start
+
+        mixed = self._mixed
+        mixed.fill(0)
+        samples = np.frombuffer(outgoing, dtype=np.int16)
+        mixed[: len(samples)] = samples * (1 - fade_in[: len(samples)])
+        samples = np.frombuffer(incoming, dtype=np.int16)
+        mixed[: len(samples)] += samples * fade_in[: len(samples)]
+
+        np.rint(mixed, out=mixed)
+        np.clip(mixed, -32768, 32767, out=mixed)
+        np.copyto(self._out, mixed, casting="unsafe")
+        return self._out.tobytes()
+
+    def cleanup(self):
+        with self._lock:
+            self._closed = True
+            tracks = [self.current, self._next, self._outgoing]
+            self._next = self._outgoing = None
+        for track in tracks:
+            if track is not None:
+                track.cleanup()
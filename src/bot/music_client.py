@@ -3,18 +3,23 @@ the streaming of music playlists in a Discord server."""
 
 import functools
 import logging
-import time
+import os
 import typing
 from inspect import iscoroutinefunction
 
 import asyncio
 import discord
-from async_timeout import timeout
 from discord import Intents
 
 import utils
+from .channels import ChannelRegistry
+from .events import EventBus
+from .jitter import JitterBuffer
+from .latency import LATENCY
+from .mixer import TrackMixer
 from .yt_source import YTDLSource
 from .playlist import Playlist
+from .session import GuildSession
 
 
 _log = logging.getLogger(__name__)
@@ -23,233 +28,425 @@ _log.setLevel(logging.INFO)
 
 
 class MusicClient(discord.Client):
-    """Discord Client that manages the streaming of music into voice channels."""
+    """Discord Client that manages the streaming of music into voice channels.
 
-    def __init__(self, *, intents: Intents, **options: typing.Any):
+    Streams into each guild through its own `GuildSession`. Controls are routed to the
+    selected session, which is the session of the guild last joined, or selected with
+    `select_guild`.
+    """
+
+    def __init__(
+        self,
+        *,
+        intents: Intents,
+        history_depth: int = Playlist.DEFAULT_HISTORY_DEPTH,
+        prefetch_depth: int = 2,
+        crossfade_frames: int = 0,
+        state_dir: str | None = None,
+        **options: typing.Any,
+    ):
         super().__init__(intents=intents, **options)
-        self.voice_channels = []
-        self.voice_client = None
-        self.player = None
-        self.playlist = Playlist()
-        self.volume = 0.5
+        self.channels = ChannelRegistry()
+        self.events = EventBus()
+        self.history_depth = history_depth
+        self.prefetch_depth = prefetch_depth
+        self.crossfade_frames = crossfade_frames
+        self.state_dir = state_dir
+        self.sessions: dict[int, GuildSession] = {}
+        self.selected: GuildSession = None
+        # Persisted playlists restored by `setup_hook`, until their session is created.
+        self._restored: dict[int, tuple] = {}
 
     @staticmethod
-    def __requires_voice_connected(func: typing.Callable):
-        """Validate the Bot is in a voice channel before invoking the wrapped method."""
+    def __routed(func: typing.Callable):
+        """Invoke the wrapped method with the selected session, if any."""
 
-        log_message = "%s() requires the Bot to be connected a Voice Channel."
+        log_message = "%s() requires a guild to be selected, with `guild <index>`."
 
         @functools.wraps(func)
-        async def validator_async(self, *args, **kwargs):
-            if self.voice_client is not None:
-                return await func(self, *args, **kwargs)
+        async def router_async(self, *args, **kwargs):
+            session = self.session
+            if session is not None:
+                return await func(self, session, *args, **kwargs)
 
             _log.warning(log_message, func.__name__)
             return None
 
         @functools.wraps(func)
-        def validator(self, *args, **kwargs):
-            if self.voice_client is not None:
-                return func(self, *args, **kwargs)
+        def router(self, *args, **kwargs):
+            session = self.session
+            if session is not None:
+                return func(self, session, *args, **kwargs)
 
             _log.warning(log_message, func.__name__)
             return None
 
-        return validator_async if iscoroutinefunction(func) else validator
+        return router_async if iscoroutinefunction(func) else router
+
+    @property
+    def session(self) -> GuildSession | None:
+        """The selected session, defaulting to the session of the only guild."""
+        if self.selected is None and len(self.guilds) == 1:
+            self.selected = self.get_session(self.guilds[0])
+        return self.selected
+
+    @property
+    def playlist(self) -> Playlist | None:
+        """The playlist of the selected session."""
+        return self.session.playlist if self.session is not None else None
+
+    def get_session(self, guild: discord.Guild) -> GuildSession:
+        """Retrieves the session of a guild, creating it on first use."""
+        session = self.sessions.get(guild.id)
+        if session is None:
+            restored = self._restored.pop(guild.id, ())
+            session = self.sessions[guild.id] = GuildSession(self, guild, *restored)
+            session.start()
+        return session
+
+    async def setup_hook(self):
+        """|coro| Restores the persisted playlists on a worker thread, before connecting
+        to Discord."""
+        if self.state_dir:
+            self._restored = await asyncio.to_thread(self._restore_playlists)
+
+    def _restore_playlists(self) -> dict[int, tuple]:
+        """|Blocking| Restores the playlist of every guild persisted in the `state_dir`."""
+        try:
+            names = os.listdir(self.state_dir)
+        except FileNotFoundError:
+            return {}
+        return {
+            int(name): GuildSession.restore_playlist(self, int(name))
+            for name in names
+            if name.isdigit()
+        }
 
     def load_voice_channels(self):
-        """Initialise the list of voice channels in server.
+        """Register the voice channels of every guild, replacing those registered before.
         Used to know which channels are available for the MusicClient
         to join.
         """
         for guild in self.guilds:
-            for channel in guild.voice_channels:
-                self.voice_channels.append(channel)
+            self.channels.add_guild(guild)
 
     async def on_ready(self):
         """|event| Client has connectet to Discord."""
         self.load_voice_channels()
+        if self.state_dir:  # Start the sessions of the restored playlists.
+            for guild in self.guilds:
+                self.get_session(guild)
         _log.info("MusicClient is ready for Console Commands.")
 
+    async def on_guild_join(self, guild: discord.Guild):
+        """|event| Client joined a guild."""
+        self.channels.add_guild(guild)
+
+    async def on_guild_available(self, guild: discord.Guild):
+        """|event| A guild became available, e.g. after an outage."""
+        self.channels.add_guild(guild)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        """|event| Client left, or was removed from, a guild."""
+        self.channels.remove_guild(guild)
+        session = self.sessions.pop(guild.id, None)
+        if session is not None:
+            if session is self.selected:
+                self.selected = None
+            await session.close()
+
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        """|event| A channel was created in a guild."""
+        self.channels.add(channel)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        """|event| A channel was deleted from a guild."""
+        self.channels.remove(channel)
+
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        """|event| A channel of a guild changed, e.g. was renamed."""
+        self.channels.update(before, after)
+
     async def quit(self):
         """Stops the MusicClient and shuts it down."""
         _log.debug("Shutting down the MusicClient.")
-        if self.voice_client:
-            await self.voice_leave()
+        connected = any(session.voice_client for session in self.sessions.values())
+        await asyncio.gather(*(session.close() for session in self.sessions.values()))
+        if connected:
             _log.debug("Leaving time for player's callback to resolve.")
-            time.sleep(2)
+            await asyncio.sleep(2)
         await self.close()
+        YTDLSource.close_process_pool()
+        await YTDLSource.close_audio_cache()
         _log.info("Bot has shutdown.")
 
-    # Audio Streaming Logic
-    @__requires_voice_connected
-    async def _stream_youtube_url(self, url: str):
-        """|coro| Streams a song from YouTube in the connected voice channel.
-
-        Will attempt to validate the Bot's state before playing the requested song,
-        to avoid crashing the Bot service, this may result in songs being skipped/
-        play requests being ignored.
-
-        Callbacks to `stream_next` to cycle through the playlist.
-
-        Args:
-            url (str): YouTube URL of the song to stream.
-        """
-        async with timeout(10):
-            self.player = await YTDLSource.from_url(
-                url=url, loop=self.voice_client.loop, stream=True
+    # Guild Controls
+    def get_guilds(self):
+        """Display guilds by index, marking the selected guild."""
+        _log.info("Retrieving guilds")
+        for index, guild in enumerate(self.guilds):
+            session = self.sessions.get(guild.id)
+            marker = "*" if session is not None and session is self.selected else " "
+            print(f"[{index}]{marker} {guild}")
+
+    def select_guild(self, guild_index: int):
+        """Select the guild whose session controls are routed to, by index."""
+        if not 0 <= guild_index < len(self.guilds):
+            _log.warning(
+                "Invalid guild index '%s'. Current guilds available: %s.",
+                guild_index,
+                len(self.guilds),
             )
-            if self.player:
-                if self.voice_client.is_playing():
-                    _log.error(
-                        "Audio Player requested to play audio, "
-                        + "while already playing audio.\nLikely a usage error, "
-                        + "or async event-loop failure. Was the Bot shutting down?"
-                    )
-                    return
-                _log.info('Now Playing: "%s".', self.player.title)
-                self.player.volume = self.volume
-                self.voice_client.play(
-                    self.player,
-                    after=lambda e: asyncio.run_coroutine_threadsafe(
-                        self.stream_next(e), self.loop
-                    ),
-                )
-            else:  # Skip to the next song if the AudioSource yielded nothing.
-                _log.warning("Skipping Bad URL '%s'.", url)
-                await self.stream_next()
-
-    @__requires_voice_connected
-    async def stream_next(self, error=None):
-        """Callback function of bot#play which is used to play through the
-        songs in queue."""
-        if error:
-            _log.error("Player error: %s", error)
-        else:
-            try:
-                url = self.playlist.next()
-                await self._stream_youtube_url(url)
-            except Playlist.ExhaustedException:
-                _log.info("Playlist exhausted.")
+            return
+        self.selected = self.get_session(self.guilds[guild_index])
+        _log.info("Selected '%s'.", self.selected)
 
     # Voice Channel Controls
     def get_voice_channels(self):
-        """Display voice channels of server by index."""
+        """Display voice channels of every guild by index, with their ids."""
         _log.info("Retrieving voice channels")
-        for index, channel in enumerate(self.voice_channels):
-            print(f"[{index}] - {channel}")
+        for index, channel in enumerate(self.channels):
+            print(f"[{index}] - {channel} ({channel.guild}) <{channel.id}>")
+
+    def find_channel(self, query: str) -> discord.VoiceChannel | None:
+        """Find a voice channel by id, then by name, then by index, so a channel whose
+        name is a number is found by its name before the channel at that index.
 
-    async def voice_join(self, channel_index: int):
-        """Join voice channel by index in server."""
-        if not 0 <= channel_index < len(self.voice_channels):
+        Names prefer a channel of the selected guild, if several channels have the name.
+        """
+        channel = None
+        if query.isdigit():
+            channel = self.channels.get(int(query))
+        if channel is None:
+            guild_id = self.selected.guild.id if self.selected is not None else None
+            channel = self.channels.find(query, guild_id)
+        if channel is None and query.isdigit():
+            channel = self.channels.at(int(query))
+        return channel
+
+    async def voice_join(self, args: list[str]):
+        """Join voice channel by id, name or index, selecting the session of its guild.
+        An id is matched first, then a name, then an index, see `find_channel`."""
+        query = " ".join(args)
+        channel = self.find_channel(query)
+        if channel is None:
             _log.warning(
-                "Invalid channel index '%s'. Current voice channels available: %s.",
-                channel_index,
-                len(self.voice_channels),
-            )
-        elif self.voice_client is not None:
-            _log.debug(
-                "Bot is in a voice channel already,"
-                + " moving bot to new channel instead of joining."
-            )
-            await self.voice_client.move_to(self.voice_channels[channel_index])
-        else:
-            _log.debug("Joining voice channel.")
-            self.voice_client = await discord.VoiceChannel.connect(
-                self.voice_channels[channel_index]
+                "No voice channel '%s'. Current voice channels available: %s.",
+                query,
+                len(self.channels),
             )
-            _log.info("Joined '%s'.", self.voice_channels[channel_index])
-
-    @__requires_voice_connected
-    async def voice_leave(self):
-        """Leave current voice channel."""
-        await self.voice_client.disconnect()
-        self.voice_client = None
-        _log.info("Disconnected from voice channel.")
+            return
+        self.selected = self.get_session(channel.guild)
+        await self.selected.voice_join(channel)
+
+    @__routed
+    async def voice_leave(self, session: GuildSession):
+        """Leave the selected session's voice channel."""
+        await session.voice_leave()
+
+    def get_cache_stats(self):
+        """Display the counters of the song info cache, and of coalesced extractions."""
+        _log.info("Retrieving song info cache stats")
+        for name, value in YTDLSource.info_cache.stats().items():
+            print(f"{name}: {value}")
+        for name, value in YTDLSource.extractions.stats().items():
+            print(f"extraction {name}: {value}")
+        if YTDLSource.audio_cache is not None:
+            for name, value in YTDLSource.audio_cache.stats().items():
+                print(f"audio cache {name}: {value}")
+
+    def get_latency_stats(self):
+        """Display the latency percentiles of each stage of the playback pipeline."""
+        _log.info("Retrieving playback latency stats")
+        for line in LATENCY.report():
+            print(line)
+
+    def get_state(self) -> list[dict]:
+        """Display the state of every session, as published by `events`."""
+        _log.info("Retrieving session states")
+        states = [session.state() for session in self.sessions.values()]
+        for state in states:
+            print(", ".join(f"{name}: {value}" for name, value in state.items()))
+        return states
+
+    @__routed
+    def get_buffer_stats(self, session: GuildSession):
+        """Display the jitter buffer stats of the selected session."""
+        session.get_buffer_stats()
 
     # Playlist Controls
-    def playlist_queue(self, urls: list[str]):
-        """Add songs to the playlist."""
-        for url in urls:
-            self.playlist.add(url)
-        _log.info("Added songs to queue.")
-
-    @__requires_voice_connected
-    async def playlist_start(self):
-        """Starts the playlist."""
-        _log.info("Starting playlist.")
-        await self.stream_next()
-
-    @__requires_voice_connected
-    def playlist_stop(self):
-        """Stops the playlist."""
-        self.playlist.clear_all()
-        self.voice_client.stop()
-        _log.info("Stopped and cleared the playlist.")
-
-    async def playlist_play(self, urls: list[str]):
-        """Overrides the Playlist with new songs, playing them"""
-        self.playlist.clear_all()
-        self.playlist_queue(urls)
-        await self.song_skip()
+    @__routed
+    def get_history(self, session: GuildSession):
+        """Display the selected session's recently played songs."""
+        session.get_history()
 
-    # Audio Controls
-    @__requires_voice_connected
-    def audio_pause(self):
-        """Pauses the audio streaming."""
-        self.voice_client.pause()
-        _log.info("Paused the audio.")
-
-    @__requires_voice_connected
-    def audio_resume(self):
-        """Resumes the audio streaming."""
-        self.voice_client.resume()
-        _log.info("Resumed the audio.")
-
-    def set_audio_volume(self, volume: int):
-        """Set the MusicClient's audio volume level."""
-        volume = float(volume)
-        volume /= 100
-        if not 0.0 <= volume <= 1.0:
-            _log.warning(
-                "Ignoring request to set `bot.volume_level` to '%s' percent.",
-                int(volume * 100),
-            )
+    @__routed
+    def playlist_queue(self, session: GuildSession, urls: list[str]):
+        """Add songs to the selected session's playlist."""
+        session.playlist_queue(urls)
+
+    @__routed
+    async def playlist_import(self, session: GuildSession, args: list[str]):
+        """Add the songs of a queue file to the selected session's playlist.
+
+        Args:
+            args (list[str]): Path of the queue file, split by spaces, optionally
+                preceded by `--unique` to skip songs that are already queued.
+        """
+        unique = args[0].casefold() == "--unique"
+        path = " ".join(args[1:] if unique else args)
+        if not path:
+            _log.warning("Expected the path of a queue file to import.")
             return
-        if self.player is not None:
-            self.player.volume = volume
-            _log.debug("Adjusted active player's volume.")
-        self.volume = volume
-        _log.info("Volume @ %s.", f"{int(volume * 100)}%")
+        await session.playlist_import(path, unique)
+
+    @__routed
+    async def playlist_start(self, session: GuildSession):
+        """Starts the selected session's playlist."""
+        await session.playlist_start()
+
+    @__routed
+    def playlist_stop(self, session: GuildSession):
+        """Stops the selected session's playlist."""
+        session.playlist_stop()
+
+    @__routed
+    async def playlist_play(self, session: GuildSession, urls: list[str]):
+        """Overrides the selected session's playlist with new songs, playing them."""
+        await session.playlist_play(urls)
+
+    @__routed
+    def playlist_clear(self, session: GuildSession):
+        """Clears the selected session's playlist."""
+        session.playlist.clear_all()
+
+    # Playlist Mode Controls
+    @__routed
+    def playlist_shuffle(self, session: GuildSession):
+        """Shuffles the selected session's playlist."""
+        session.playlist.shuffle_mode()
+
+    @__routed
+    def playlist_seed(self, session: GuildSession, seed: int):
+        """Seeds the shuffle of the selected session's playlist."""
+        session.playlist.seed_shuffle(seed)
+
+    @__routed
+    def playlist_loop(self, session: GuildSession):
+        """Loops the selected session's playlist."""
+        session.playlist.loop_mode()
+
+    @__routed
+    def playlist_repeat(self, session: GuildSession):
+        """Repeats the selected session's current song."""
+        session.playlist.repeat_mode()
+
+    @__routed
+    def playlist_normal(self, session: GuildSession):
+        """Stops looping the selected session's playlist."""
+        session.playlist.no_looping_mode()
 
-    # Song Controls
-    @__requires_voice_connected
-    async def song_skip(self):
-        """Play the next song in the playlist."""
-        if self.voice_client.is_playing():
-            _log.info("Skipped current song.")
-            self.voice_client.stop()  # Triggers the callback fn 'stream_next'
-        else:
-            _log.info("Playing next song.")
-            await self.stream_next()
-
-    @__requires_voice_connected
-    async def song_prev(self):
-        """Play the previous song in the playlist."""
-        try:
-            self.playlist.add(url=self.playlist.prev(), index=0)
-            _log.info("Playing previous song.")
-            await self.song_skip()
-        except Playlist.ExhaustedException:
-            _log.warning("No previous song. Playlist's RecentlyPlayed list is empty.")
+    # Audio Controls
+    @__routed
+    def audio_pause(self, session: GuildSession):
+        """Pauses the selected session's audio."""
+        session.audio_pause()
 
+    @__routed
+    def audio_resume(self, session: GuildSession):
+        """Resumes the selected session's audio."""
+        session.audio_resume()
 
-def build_client() -> MusicClient:
+    @__routed
+    def set_audio_volume(self, session: GuildSession, volume: int):
+        """Set the selected session's audio volume level."""
+        session.set_audio_volume(volume)
+
+    # Song Controls
+    @__routed
+    async def song_skip(self, session: GuildSession):
+        """Play the next song in the selected session's playlist."""
+        await session.song_skip()
+
+    @__routed
+    async def song_prev(self, session: GuildSession):
+        """Play the previous song in the selected session's playlist."""
+        await session.song_prev()
+
+
+def build_client(
+    history_depth: int = Playlist.DEFAULT_HISTORY_DEPTH,
+    prefetch_depth: int = 2,
+    extract_processes: int = 0,
+    audio_cache_dir: str | None = None,
+    audio_cache_bytes: int = 0,
+    opus: bool = False,
+    buffer_frames: int = 50,
+    buffer_watermarks: tuple[int, int] | None = None,
+    crossfade: float = 0.0,
+    state_dir: str | None = None,
+    shard_id: int | None = None,
+    shard_count: int | None = None,
+) -> MusicClient:
     """Builds a MusicClient with necessary correct discord intents.
 
+    Args:
+        history_depth (int, optional): Number of recently played songs the playlist
+            remembers. Defaults to `Playlist.DEFAULT_HISTORY_DEPTH`.
+        prefetch_depth (int, optional): Number of upcoming songs to resolve in the
+            background while a song plays. Defaults to 2.
+        extract_processes (int, optional): Number of worker processes to extract songs in.
+            Defaults to 0, extracting songs on threads.
+        audio_cache_dir (str, optional): Directory to cache the audio of frequently played
+            songs in. Defaults to None, streaming every song.
+        audio_cache_bytes (int, optional): Maximum size of the audio cache, in bytes.
+        opus (bool, optional): Send Opus audio from FFMPEG, instead of PCM audio that is
+            scaled and encoded in Python. FFMPEG applies the volume, from the next song
+            if it is changed.
+            Defaults to False.
+        buffer_frames (int, optional): Depth of the `JitterBuffer` reading PCM audio ahead
+            of the audio player, in 20ms frames. Defaults to 50, 0 disables buffering.
+        buffer_watermarks (tuple[int, int], optional): Low and high watermarks of the
+            `JitterBuffer`. Defaults to 1/5 and 4/5 of `buffer_frames`.
+        crossfade (float, optional): Seconds to crossfade consecutive songs over.
+            Defaults to 0.0, playing songs gaplessly.
+        state_dir (str, optional): Directory to persist the playlist of each guild in,
+            restoring it when the guild's session is created. Defaults to None.
+        shard_id (int, optional): Shard of the guilds the client serves, if sharded.
+        shard_count (int, optional): Total number of shards, if sharded.
+
+    Raises:
+        ValueError: if the `buffer_watermarks` do not fit within `buffer_frames`.
+
     Returns:
         MusicClient: MusicClient that can be started with `.start(token=token)`.
     """
     intents = discord.Intents.default()
     intents.message_content = True
-    return MusicClient(intents=intents)
+    if extract_processes > 0:
+        YTDLSource.use_process_pool(extract_processes)
+    if audio_cache_dir:
+        YTDLSource.use_audio_cache(audio_cache_dir, audio_cache_bytes)
+    YTDLSource.opus = opus
+    if buffer_frames > 0:
+        low, high = buffer_watermarks or (
+            max(buffer_frames // 5, 1),
+            buffer_frames * 4 // 5,
+        )
+        JitterBuffer.validate(buffer_frames, low, high)
+        YTDLSource.buffer_options = {
+            "depth": buffer_frames,
+            "low_watermark": low,
+            "high_watermark": high,
+        }
+    return MusicClient(
+        intents=intents,
+        history_depth=history_depth,
+        prefetch_depth=prefetch_depth,
+        crossfade_frames=int(crossfade * TrackMixer.FRAMES_PER_SECOND),
+        state_dir=state_dir,
+        shard_id=shard_id,
+        shard_count=shard_count,
+    )
@@ -1,9 +1,15 @@
 """Tools for managing the playlist of the bot."""
 
+import functools
 import logging
-from random import randrange
+import typing
+from collections import Counter
+from itertools import chain, islice
+from random import Random
 
 import utils
+from .history import PlayHistory
+from .song_queue import SongQueue
 
 
 _log = logging.getLogger(__name__)
@@ -11,40 +17,164 @@ _log.addHandler(utils.HANDLER)
 _log.setLevel(logging.INFO)
 
 
+def _journaled(func: typing.Callable):
+    """Records successful calls of the wrapped Playlist mutation to the Playlist's `journal`,
+    then notifies the Playlist's `listeners` with the name of the mutation.
+
+    Mutations called by another mutation are not recorded, as replaying the outer call
+    repeats them.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self._journaling or (self.journal is None and not self.listeners):
+            return func(self, *args, **kwargs)
+
+        self._journaling = True
+        try:
+            result = func(self, *args, **kwargs)
+        finally:
+            self._journaling = False
+        if self.journal is not None:
+            self.journal.record(func.__name__, args, kwargs)
+        for listener in self.listeners:
+            listener(func.__name__)
+        return result
+
+    return wrapper
+
+
 class Playlist:
     """Data structure that manages the storage and retrieval of song urls.
 
     Support for queuing songs and retrieving them in a queued, shuffled, looped, or repeated
     fashion. Supports cycling backwards using `prev()` method.
+
+    Shuffling is an incremental Fisher-Yates shuffle over the `song_queue`: the order of a song
+    is only drawn when it is about to be played, or when it is peeked at with `upcoming()`.
+    Songs drawn so far sit at the front of the queue in play order, and undrawn songs after them.
+    Songs re-queued by loop mode are held back until the current round of the shuffle is over.
     """
 
-    def __init__(self):
+    DEFAULT_HISTORY_DEPTH = 256
+
+    def __init__(
+        self, seed: int | None = None, history_depth: int = DEFAULT_HISTORY_DEPTH
+    ):
         """Initialises a `song_queue` of urls, a `recently_played_stack` of popped urls, and flags
         `shuffle`, `loop`, `repeat` to manipulate the retrieval behaviour.
+
+        The `song_queue` is a `SongQueue`, so adding or popping a song is cheap even when
+        thousands of songs are queued. The `recently_played_stack` is a `PlayHistory`, which
+        only remembers the last `history_depth` songs played.
+
+        Args:
+            seed (int, optional): Seed for the shuffle order, to reproduce a shuffle.
+                Defaults to a random seed.
+            history_depth (int, optional): Number of recently played songs to remember.
+                Defaults to `DEFAULT_HISTORY_DEPTH`.
         """
 
-        self.song_queue: list = []
+        self.song_queue: SongQueue = SongQueue()
+        self._index: Counter = Counter()  # Canonical urls of the songs in `song_queue`.
         self.current_song = None
-        self.recently_played_stack: list = []
+        self.recently_played_stack: PlayHistory = PlayHistory(history_depth)
 
         self.shuffle: bool = False
         self.repeat: bool = False
         self.loop: bool = False
 
+        self._random = Random(seed)
+        # Songs at the front of the queue already in shuffled order.
+        self._shuffled: int = 0
+        # Songs at the front of the queue in this round of the shuffle.
+        self._round: int = 0
+
+        self.journal = None  # `PlaylistJournal` recording mutations, if persisted.
+        # Notified of mutations, with the mutation's name.
+        self.listeners: list[typing.Callable[[str], None]] = []
+        self._journaling: bool = False
+
     class ExhaustedException(Exception):
         """Thrown if there are no more songs in the list the Playlist
         is trying to retrieve from.
         """
 
-    def add(self, url: str, index: int = 0):
+    @_journaled
+    def add(self, url: str, index: int | None = None):
         """Add a song url to the playlist's queue.
 
         Args:
             url (str): URL to add to the Playlist.
-            index (int, optional): Index to add the URL at. Defaults to 0.
+            index (int, optional): Index to add the URL at. Defaults to the end of the queue.
         """
 
+        self._index[utils.canonical_url(url)] += 1
+        if not self.shuffle:
+            if index is None:
+                self.song_queue.append(url)
+            else:
+                self.song_queue.insert(index, url)
+            return
+
+        # Songs added while shuffling join the current round, and are only placed in the
+        # shuffled order if they are explicitly inserted into it, e.g. by `prev()`.
+        if index is None:
+            if self._round <= 0:  # Join the next round, not the held back songs.
+                self._round = len(self.song_queue)
+                self._shuffled = 0
+            self.song_queue.insert(self._round, url)
+            self._round += 1
+            return
+        index = min(index, self._round)
         self.song_queue.insert(index, url)
+        self._round += 1
+        if index < self._shuffled or index == 0:
+            self._shuffled += 1
+
+    @_journaled
+    def extend(self, urls: list[str], unique: bool = False) -> int:
+        """Add many song urls to the end of the playlist's queue, in bulk.
+
+        Args:
+            urls (list[str]): URLs to add to the Playlist.
+            unique (bool, optional): Skip URLs of songs already in the queue, compared by
+                their `utils.canonical_url`. Defaults to False.
+
+        Returns:
+            int: Number of URLs added.
+        """
+
+        added = []
+        for url in urls:
+            key = utils.canonical_url(url)
+            if unique and key in self._index:
+                continue
+            self._index[key] += 1
+            added.append(url)
+
+        if self.shuffle and self._round < len(self.song_queue):
+            # Songs held back for the next round must stay after the current round.
+            for offset, url in enumerate(added):
+                self.song_queue.insert(self._round + offset, url)
+        else:
+            self.song_queue.extend(added)
+        if self.shuffle:
+            self._round += len(added)
+        return len(added)
+
+    def contains(self, url: str) -> bool:
+        """Checks whether a song is queued, comparing urls by their `utils.canonical_url`."""
+
+        return utils.canonical_url(url) in self._index
+
+    def _unindex(self, url: str):
+        """Removes a url that left the `song_queue` from the index of queued songs."""
+
+        key = utils.canonical_url(url)
+        self._index[key] -= 1
+        if self._index[key] <= 0:
+            del self._index[key]
 
     def _pop(self, index: int = 0) -> str:
         """Removes and returns an element from the Playlist.
@@ -62,16 +192,19 @@ class Playlist:
         song_url: str = self.song_queue.pop(index)
         if self.loop:
             self.song_queue.append(song_url)
+        else:
+            self._unindex(song_url)
         if self.current_song is not None:
             self.recently_played_stack.append(self.current_song)
         self.current_song = song_url
         return song_url
 
+    @_journaled
     def next(self) -> str:
         """Retrieves the next song in the Playlist.
         Behaviour is modified by Playlist's `shuffle` `loop` `repeat` flags.
 
-        - `shuffle`: pop a random song from `song_queue`.
+        - `shuffle`: pop the next song of the shuffled order of `song_queue`.
         - `loop`:  pop a song from `song_queue` and append it back to the queue.
         - `repeat`: always return `current_song`, ignore the `song_queue`. If no
         'current_song' pop one from `song_queue`.
@@ -85,22 +218,76 @@ class Playlist:
 
         if self.repeat:
             if not self.current_song:
-                self.current_song = self._pop()
+                if len(self.song_queue) <= 0:
+                    raise self.ExhaustedException
+                self.current_song = self._pop_next()
 
             return self.current_song
 
         if (len(self.song_queue)) <= 0:
             raise self.ExhaustedException
 
-        if self.shuffle:
-            rand_song_index = randrange(0, len(self.song_queue))
-            return self._pop(rand_song_index)
+        return self._pop_next()
+
+    def _pop_next(self) -> str:
+        """Pops the song at the front of the queue, drawing it from the shuffle if shuffling."""
 
+        if self.shuffle:
+            self._draw(1)
+            self._shuffled -= 1
+            self._round -= 1
         return self._pop()
 
+    @_journaled
+    def _draw(self, count: int):
+        """Draws the shuffled order of the next `count` songs of the current round, if not drawn
+        already. Starts the next round of the shuffle if the current one is over.
+
+        Each draw is a single Fisher-Yates step: a random undrawn song is swapped into the next
+        position of the shuffled order. Journaled itself, so peeking at songs drawn already
+        is not.
+        """
+
+        if self._round <= 0:
+            self._round = len(self.song_queue)
+            self._shuffled = 0
+
+        queue = self.song_queue
+        for position in range(self._shuffled, min(count, self._round)):
+            swap = self._random.randrange(position, self._round)
+            if swap != position:
+                queue[position], queue[swap] = queue[swap], queue[position]
+            self._shuffled = position + 1
+
+    def upcoming(self, count: int) -> list[str]:
+        """Peeks at the next songs the Playlist will retrieve, without retrieving them.
+
+        In shuffle mode, the order of the peeked songs is drawn, so `next()` will retrieve
+        them in the same order. Only songs in the current round of a shuffle are peeked.
+
+        Args:
+            count (int): Maximum number of songs to peek at.
+
+        Returns:
+            list[str]: Urls of the upcoming songs, in the order they will be retrieved.
+        """
+
+        if self.repeat and self.current_song:
+            return [self.current_song]
+        if self.shuffle and len(self.song_queue) > 0:
+            if self._round <= 0 or self._shuffled < min(count, self._round):
+                self._draw(count)
+            count = min(count, self._round)
+        return list(islice(self.song_queue, count))
+
+    @_journaled
     def prev(self) -> str:
         """Retrieves the previous song from the Playlist.
 
+        The `current_song` is put back at the front of the `song_queue` (it is already queued
+        in loop mode), and is not pushed to the `recently_played_stack`, so calling `prev()`
+        repeatedly steps further back through the history.
+
         Raises:
             ExhaustedException: if there is no previous song in `recently_played_stack`.
 
@@ -111,8 +298,21 @@ class Playlist:
         if len(self.recently_played_stack) <= 0:
             raise self.ExhaustedException
 
-        return self.recently_played_stack.pop(0)
+        self.requeue_current()
+        return self.recently_played_stack.pop()
+
+    @_journaled
+    def requeue_current(self):
+        """Puts the `current_song` back at the front of the `song_queue`, so it is retrieved
+        next, without pushing it to the `recently_played_stack`. In loop mode the song is
+        already queued, so it is only unset as the `current_song`.
+        """
+
+        if self.current_song is not None and not self.loop:
+            self.add(self.current_song, index=0)
+        self.current_song = None
 
+    @_journaled
     def no_looping_mode(self):
         """Toggles looping modes off. Songs will not repeat again."""
 
@@ -120,12 +320,37 @@ class Playlist:
         self.repeat = False
         _log.info("Loop/Repeat Mode: OFF")
 
-    def shuffle_mode(self):
-        """Toggles shuffle mode. Shuffling pops songs in a random order."""
+    @_journaled
+    def shuffle_mode(self, seed: int | None = None):
+        """Toggles shuffle mode. Shuffling pops songs in a random order.
+
+        Args:
+            seed (int, optional): Seed for the shuffle order, if turning shuffle mode on.
+                Defaults to continuing the current random sequence.
+        """
 
         self.shuffle = not self.shuffle
+        if self.shuffle:
+            if seed is not None:
+                self._random.seed(seed)
+            self._shuffled = 0
+            self._round = len(self.song_queue)
         _log.info("Shuffle Mode: %s", "ON" if self.shuffle else "OFF")
 
+    @_journaled
+    def seed_shuffle(self, seed: int):
+        """Reseeds the shuffle order. Songs that were not retrieved yet are reshuffled,
+        so the same seed on the same queue reproduces the same shuffle.
+
+        Args:
+            seed (int): Seed for the shuffle order.
+        """
+
+        self._random.seed(seed)
+        self._shuffled = 0
+        _log.info("Shuffle Seed: %s", seed)
+
+    @_journaled
     def loop_mode(self):
         """Toggles loop all mode. Looping will append songs to the queue after they are popped off.
         Will unset repeat mode if it was enabled.
@@ -139,28 +364,92 @@ class Playlist:
 
         _log.info("Loop Mode: %s", "ON" if self.loop else "OFF")
 
+    @_journaled
     def repeat_mode(self):
         """Toggles repeat mode. Repeating returns the currently popped song repeatedly."""
 
         self.repeat = not self.repeat
         _log.info("Repeat Mode: %s", "ON" if self.repeat else "OFF")
 
+    @_journaled
     def clear(self):
         """Removes all songs from the Playlist."""
 
         self.song_queue.clear()
+        self._index.clear()
         self.current_song = None
+        self._shuffled = self._round = 0
         _log.info("Cleared playlist.")
 
+    @_journaled
     def clear_all(self):
         """Removes all songs from the Playlist, including the history
         of recently retrieved songs."""
 
         self.song_queue.clear()
+        self._index.clear()
         self.current_song = None
+        self._shuffled = self._round = 0
         self.recently_played_stack.clear()
         _log.info("Cleared playlist and history.")
 
+    def snapshot(self) -> dict:
+        """Captures the full state of the Playlist, to be restored by `load_snapshot`.
+
+        Returns:
+            dict: JSON serialisable state of the Playlist.
+        """
+
+        return self.snapshot_of(self.capture())
+
+    @staticmethod
+    def snapshot_of(state: dict) -> dict:
+        """Converts a state captured by `capture` into a snapshot, see `snapshot`."""
+
+        return dict(state, queue=list(chain.from_iterable(state["queue"])))
+
+    def capture(self) -> dict:
+        """Captures the full state of the Playlist, copying the blocks of its queue rather
+        than each url, so it is cheap even for very large queues. Converted into a
+        snapshot by `snapshot_of`, e.g. on a worker thread.
+
+        Returns:
+            dict: State of the Playlist, holding the blocks of urls of its queue.
+        """
+
+        return {
+            "queue": self.song_queue.copy_blocks(),
+            "current_song": self.current_song,
+            "history": list(self.recently_played_stack),
+            "shuffle": self.shuffle,
+            "repeat": self.repeat,
+            "loop": self.loop,
+            "shuffled": self._shuffled,
+            "round": self._round,
+            "random": self._random.getstate(),
+        }
+
+    def load_snapshot(self, state: dict):
+        """Restores the state of the Playlist captured by `snapshot`.
+
+        Args:
+            state (dict): State of a Playlist, as returned by `snapshot`.
+        """
+
+        self.song_queue = SongQueue(state["queue"])
+        self._index = Counter(map(utils.canonical_url, state["queue"]))
+        self.current_song = state["current_song"]
+        self.recently_played_stack.clear()
+        for url in state["history"]:
+            self.recently_played_stack.append(url)
+        self.shuffle = state["shuffle"]
+        self.repeat = state["repeat"]
+        self.loop = state["loop"]
+        self._shuffled = state["shuffled"]
+        self._round = state["round"]
+        version, internal_state, gauss_next = state["random"]
+        self._random.setstate((version, tuple(internal_state), gauss_next))
+
 
 if __name__ == "__main__":
     # Randomness is hard to automatically test.
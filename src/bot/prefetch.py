@@ -0,0 +1,83 @@
+"""Background resolution of the songs the `Playlist` will play next."""
+
+import asyncio
+import logging
+import typing
+
+import utils
+from .playlist import Playlist
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+class Prefetcher:
+    """Resolves the next songs of a Playlist in the background, while a song plays.
+
+    Listens to the Playlist's mutations, restarting the prefetch whenever the upcoming
+    songs may have changed. Songs are peeked with `Playlist.upcoming`, so a shuffled order
+    is drawn ahead of time and the prefetched songs are the ones retrieved next.
+    """
+
+    def __init__(
+        self,
+        playlist: Playlist,
+        resolve: typing.Callable[[str], typing.Awaitable],
+        depth: int = 2,
+    ):
+        """Creates a Prefetcher listening to the mutations of `playlist`.
+
+        Args:
+            playlist (Playlist): Playlist to prefetch the upcoming songs of.
+            resolve (Callable[[str], Awaitable]): Coroutine function resolving a song url,
+                e.g. caching its extracted info.
+            depth (int, optional): Number of upcoming songs to resolve. 0 disables
+                prefetching. Defaults to 2.
+        """
+
+        self.playlist = playlist
+        self.resolve = resolve
+        self.depth = depth
+        self._task: asyncio.Task = None
+        playlist.listeners.append(self.on_mutation)
+
+    def on_mutation(self, mutation: str):
+        """Restarts the prefetch when the Playlist changes. Peeking does not change it,
+        and retrieving the next song is left to the owner to refresh once that song
+        started playing, so the prefetch does not compete with its extraction.
+        """
+
+        if mutation not in ("next", "_draw"):
+            self.refresh()
+
+    def refresh(self):
+        """Cancels the running prefetch, and starts prefetching the current upcoming songs.
+        Does nothing outside of a running event loop, e.g. while the Playlist is restored.
+        """
+
+        self.cancel()
+        if self.depth <= 0:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._prefetch())
+
+    def cancel(self):
+        """Cancels the running prefetch, if any."""
+
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _prefetch(self):
+        """|coro| Resolves the upcoming songs one at a time, in play order."""
+
+        for url in self.playlist.upcoming(self.depth):
+            # Shielded, so a resolution in progress still completes if the prefetch is
+            # cancelled, instead of its result being thrown away.
+            await asyncio.shield(self.resolve(url))
+            _log.debug("Prefetched '%s'.", url)
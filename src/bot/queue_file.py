@@ -0,0 +1,56 @@
+"""Reading of song urls from queue files, to import them into the `Playlist`."""
+
+import json
+import os
+import typing
+
+
+def read_queue_file(path: str) -> typing.Iterator[str]:
+    """|Blocking| Lazily reads the song urls in a queue file, in order.
+
+    The format is chosen by the file extension:
+
+    - `.m3u`/`.m3u8`: one url per line, `#` lines (M3U directives and comments) are skipped.
+    - `.json`: a list of urls, or of objects with a `"url"` key.
+    - Anything else: one url per line.
+
+    Blank lines are skipped. Line based files are streamed; JSON files are parsed whole.
+
+    Args:
+        path (str): Path of the queue file.
+
+    Raises:
+        OSError: if the file cannot be read.
+        ValueError: if a JSON file is malformed.
+        TypeError: if a JSON file does not contain a list.
+
+    Yields:
+        str: Song url.
+    """
+
+    extension = os.path.splitext(path)[1].casefold()
+    if extension == ".json":
+        yield from _read_json(path)
+        return
+
+    skip_directives = extension in (".m3u", ".m3u8")
+    with open(path, encoding="utf-8-sig") as file:
+        for line in file:
+            line = line.strip()
+            if not line or (skip_directives and line.startswith("#")):
+                continue
+            yield line
+
+
+def _read_json(path: str) -> typing.Iterator[str]:
+    """|Blocking| Reads the song urls in a JSON queue file."""
+
+    with open(path, encoding="utf-8-sig") as file:
+        entries = json.load(file)
+    if not isinstance(entries, list):
+        raise TypeError("JSON queue file must contain a list of urls")
+
+    for entry in entries:
+        url = entry.get("url") if isinstance(entry, dict) else entry
+        if isinstance(url, str) and url.strip():
+            yield url.strip()
@@ -0,0 +1,528 @@
+"""Contains `GuildSession`, the music player state of the `MusicClient` in one guild."""
+
+import concurrent.futures
+import functools
+import logging
+import os
+import time
+import typing
+from inspect import iscoroutinefunction
+from itertools import islice
+
+import asyncio
+import discord
+from async_timeout import timeout
+
+import utils
+from .jitter import JitterBuffer
+from .journal import PlaylistJournal
+from .latency import LATENCY, FirstFrameTimer
+from .mixer import TrackMixer
+from .playlist import Playlist
+from .prefetch import Prefetcher
+from .queue_file import read_queue_file
+from .yt_source import YTDLSource
+
+if typing.TYPE_CHECKING:
+    from .music_client import MusicClient
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+class GuildSession:
+    """Streams music into a voice channel of one guild.
+
+    Holds the voice client, player, playlist, volume and prefetch state of its guild, so
+    the `MusicClient` streams into many guilds at once. Extracted song info and cached
+    audio are shared by every session, through `YTDLSource`. State changes are published
+    to the client's `events`.
+    """
+
+    IMPORT_CHUNK_SIZE = 5000
+    # Playlist mutations published as a `mode` event, rather than a `queue` event.
+    MODE_MUTATIONS = (
+        "shuffle_mode",
+        "seed_shuffle",
+        "loop_mode",
+        "repeat_mode",
+        "no_looping_mode",
+    )
+
+    def __init__(
+        self,
+        client: "MusicClient",
+        guild: discord.Guild,
+        playlist: Playlist | None = None,
+        journal: PlaylistJournal | None = None,
+    ):
+        """Creates the session of a guild.
+
+        If the client persists playlists, the guild's playlist should be restored
+        beforehand with `restore_playlist`, off the event loop. Otherwise it is restored
+        here, blocking.
+
+        Args:
+            client (MusicClient): Client streaming into the guild.
+            guild (discord.Guild): Guild of the session.
+            playlist (Playlist, optional): Playlist of the guild, see `restore_playlist`.
+            journal (PlaylistJournal, optional): Journal persisting `playlist`.
+        """
+
+        self.client = client
+        self.guild = guild
+        self.voice_client: discord.VoiceClient = None
+        self.player = None
+        self.mixer: TrackMixer = None
+        self.volume = 0.5
+        if playlist is None:
+            playlist, journal = self.restore_playlist(client, guild.id)
+        self.playlist = playlist
+        self.journal = journal
+        self.prefetcher = Prefetcher(
+            self.playlist, YTDLSource.prefetch, client.prefetch_depth
+        )
+        self.playlist.listeners.append(self._on_playlist_mutation)
+        self._queue_task: asyncio.Task = None
+        self._queued_url: str = None  # Upcoming song queued into the mixer.
+        self._queued_track: YTDLSource = None
+        self._restream_url: str = None  # Song to stream once the audio player stops.
+        self._stopping = False  # The audio player was stopped, to stream another song.
+        self._journal_task: concurrent.futures.Future = None
+        self._requested_at: float = None  # When the song to stream next was requested.
+        self._source: FirstFrameTimer = None  # Source the audio player is reading.
+        self._frames_sent: int = 0  # Frames read from the previous sources.
+
+    def __str__(self) -> str:
+        return str(self.guild)
+
+    @staticmethod
+    def restore_playlist(
+        client: "MusicClient", guild_id: int
+    ) -> tuple[Playlist, PlaylistJournal | None]:
+        """|Blocking| Creates the playlist of a guild, restored from and persisted to its
+        journal if the client persists playlists.
+
+        Returns:
+            tuple[Playlist, PlaylistJournal | None]: The playlist, and its journal if any.
+        """
+
+        playlist = Playlist(history_depth=client.history_depth)
+        if not client.state_dir:
+            return playlist, None
+        journal = PlaylistJournal(os.path.join(client.state_dir, str(guild_id)))
+        journal.restore(playlist)
+        journal.attach(playlist)
+        playlist.requeue_current()  # Resume from the song that was playing.
+        return playlist, journal
+
+    @property
+    def frames_sent(self) -> int:
+        """Frames of audio the audio player has read from the session, for every song."""
+        if self._source is None:
+            return self._frames_sent
+        return self._frames_sent + self._source.frames
+
+    def state(self) -> dict:
+        """Returns the state published by the session's events, see `bot.events`."""
+        channel = getattr(self.voice_client, "channel", None)
+        return {
+            "guild": self.guild.id,
+            "seq": self.client.events.seq,
+            "title": getattr(self.player, "title", None),
+            "length": len(self.playlist.song_queue),
+            "shuffle": self.playlist.shuffle,
+            "loop": self.playlist.loop,
+            "repeat": self.playlist.repeat,
+            "volume": round(self.volume * 100),
+            "channel": getattr(channel, "name", None),
+            "channel_id": getattr(channel, "id", None),
+        }
+
+    def _publish(self, kind: str, **fields):
+        """Publishes an event of the session's guild to the client's subscribers."""
+        self.client.events.publish(kind, self.guild.id, **fields)
+
+    @staticmethod
+    def __requires_voice_connected(func: typing.Callable):
+        """Validate the session is in a voice channel before invoking the wrapped method."""
+
+        log_message = "%s() requires the Bot to be connected a Voice Channel."
+
+        @functools.wraps(func)
+        async def validator_async(self, *args, **kwargs):
+            if self.voice_client is not None:
+                return await func(self, *args, **kwargs)
+
+            _log.warning(log_message, func.__name__)
+            return None
+
+        @functools.wraps(func)
+        def validator(self, *args, **kwargs):
+            if self.voice_client is not None:
+                return func(self, *args, **kwargs)
+
+            _log.warning(log_message, func.__name__)
+            return None
+
+        return validator_async if iscoroutinefunction(func) else validator
+
+    def start(self):
+        """Starts persisting the playlist on the client's event loop, if the client
+        persists playlists. Can be called from any thread."""
+        if self.journal is not None and self._journal_task is None:
+            self._journal_task = asyncio.run_coroutine_threadsafe(
+                self.journal.start(), self.client.loop
+            )
+
+    async def close(self):
+        """|coro| Leaves the voice channel, and writes a final snapshot of the playlist."""
+        self.prefetcher.cancel()
+        self._cancel_queue_next()
+        if self.voice_client:
+            await self.voice_leave()
+        if self.journal is not None:
+            await self.journal.close()
+
+    # Audio Streaming Logic
+    @__requires_voice_connected
+    async def _stream_youtube_url(self, url: str):
+        """|coro| Streams a song from YouTube in the connected voice channel.
+
+        Will attempt to validate the Bot's state before playing the requested song,
+        to avoid crashing the Bot service, this may result in songs being skipped/
+        play requests being ignored.
+
+        PCM songs are played through a `TrackMixer`, which the next song is queued into
+        while the song plays, so it follows without a gap. If the mixer ends without a
+        next song, e.g. as it was not extracted in time, it callbacks to `stream_next`
+        to cycle through the playlist. Either the mixer or the callback advances the
+        playlist past a song, never both.
+
+        Args:
+            url (str): YouTube URL of the song to stream.
+        """
+        async with timeout(10):
+            self.player = await YTDLSource.from_url(
+                url=url, loop=self.voice_client.loop, stream=True, volume=self.volume
+            )
+            if self.player:
+                if self.voice_client.is_playing():
+                    _log.error(
+                        "Audio Player requested to play audio, "
+                        + "while already playing audio.\nLikely a usage error, "
+                        + "or async event-loop failure. Was the Bot shutting down?"
+                    )
+                    return
+                _log.info('[%s] Now Playing: "%s".', self, self.player.title)
+                self._publish("track_start", title=self.player.title, url=url)
+                YTDLSource.record_play(url)
+                source = self.mixer = None
+                self._queued_url = self._queued_track = None
+                if isinstance(self.player, YTDLSource):
+                    source = self.mixer = TrackMixer(
+                        self.player, crossfade_frames=self.client.crossfade_frames
+                    )
+                self._frames_sent = self.frames_sent
+                played = self._source = FirstFrameTimer(
+                    source or self.player, self._requested_at
+                )
+                if source is not None:
+                    source.on_advance = functools.partial(self._mixer_advanced, played)
+                self.voice_client.play(
+                    played,
+                    after=lambda e: asyncio.run_coroutine_threadsafe(
+                        self._played(played, e, time.perf_counter()), self.client.loop
+                    ),
+                )
+                self._requested_at = self._restream_url = None
+                self._stopping = False
+                self.prefetcher.refresh()
+                self._queue_next()
+            else:  # Skip to the next song if the AudioSource yielded nothing.
+                _log.warning("Skipping Bad URL '%s'.", url)
+                await self.stream_next()
+
+    @__requires_voice_connected
+    async def stream_next(self, error=None):
+        """Callback function of bot#play which is used to play through the
+        songs in queue."""
+        if error:
+            _log.error("Player error: %s", error)
+        else:
+            try:
+                url = self.playlist.next()
+                self._requested_at = self._requested_at or time.perf_counter()
+                await self._stream_youtube_url(url)
+            except Playlist.ExhaustedException:
+                self._requested_at = None
+                _log.info("[%s] Playlist exhausted.", self)
+
+    async def _played(self, source: FirstFrameTimer, error, called_at: float):
+        """|coro| Callback of the audio player, when `source` ended or was stopped, called
+        on the audio player's thread at `called_at`. Ignored if another source is playing
+        since."""
+        if source is not self._source:
+            return
+        LATENCY.record("after_hop", time.perf_counter() - called_at)
+        self._publish("track_end", error=str(error) if error else None)
+        self._requested_at = self._requested_at or called_at
+        self._stopping = False
+        url, self._restream_url = self._restream_url, None
+        if url is not None and not error:
+            await self._stream_youtube_url(url)
+        else:
+            await self.stream_next(error)
+
+    def _queue_next(self):
+        """Starts queueing the upcoming song into the mixer, if it changed, replacing
+        the queued song."""
+        upcoming = self.playlist.upcoming(1)
+        url = upcoming[0] if upcoming and self.mixer is not None else None
+        if url == self._queued_url:
+            return
+        self._cancel_queue_next()
+        if self.mixer is not None:
+            self.mixer.discard_next()
+        self._queued_url = self._queued_track = None
+        if url is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._queued_url = url
+        self._queue_task = loop.create_task(self._queue_upcoming(self.mixer, url))
+
+    def _cancel_queue_next(self):
+        """Cancels queueing the upcoming song into the mixer, if in progress."""
+        if self._queue_task is not None and not self._queue_task.done():
+            self._queue_task.cancel()
+        self._queue_task = None
+
+    async def _queue_upcoming(self, mixer: TrackMixer, url: str):
+        """|coro| Opens the upcoming song `url`, and queues it into `mixer` to play next."""
+        track = await YTDLSource.from_url(
+            url=url, loop=self.client.loop, stream=True, volume=self.volume
+        )
+        if track is None:
+            return  # Skipped by `stream_next` once the mixer ends.
+        if mixer is not self.mixer or not isinstance(track, YTDLSource):
+            track.cleanup()
+            return
+        self._queued_track = track
+        mixer.queue(track)
+        _log.debug('Queued "%s" to play next.', track.title)
+
+    def _mixer_advanced(self, played: FirstFrameTimer, track: YTDLSource):
+        """Callback of the mixer `played` wraps, on the audio player's thread, when it
+        started playing the song queued into it."""
+        played.restart()  # Times the song's first frame.
+        self.client.loop.call_soon_threadsafe(self._advanced, played.original, track)
+
+    def _advanced(self, mixer: TrackMixer, track: YTDLSource):
+        """Callback of `mixer`, when it started playing the song queued into it.
+
+        Ignored if the audio player was stopped since, or `mixer` was replaced, as the
+        playlist is then advanced by `_played`. If the playlist changed while the song was
+        queued, the song is discarded, and the playlist's next song streamed instead.
+        """
+        if mixer is not self.mixer or self._stopping or self.voice_client is None:
+            return
+        queued = (self._queued_track, self._queued_url)
+        self._queued_url = self._queued_track = None
+        try:
+            url = self.playlist.next()
+        except Playlist.ExhaustedException:
+            url = None
+        if queued != (track, url):
+            _log.warning("Playlist changed while '%s' was queued.", queued[1])
+            self.mixer = None
+            self._restream_url = url
+            self._stopping = True
+            self.voice_client.stop()  # Triggers the callback fn '_played'
+            return
+        YTDLSource.record_play(url)
+        self.player = track
+        if track.volume != self.volume:
+            track.volume = self.volume
+        _log.info('[%s] Now Playing: "%s".', self, track.title)
+        self._publish("track_end", error=None)
+        self._publish("track_start", title=track.title, url=url)
+        self.prefetcher.refresh()
+        self._queue_next()
+
+    def _on_playlist_mutation(self, mutation: str):
+        """Publishes the Playlist's change, and requeues the song to play next into the
+        mixer."""
+        if mutation in self.MODE_MUTATIONS:
+            playlist = self.playlist
+            self._publish(
+                "mode",
+                shuffle=playlist.shuffle,
+                loop=playlist.loop,
+                repeat=playlist.repeat,
+            )
+        elif mutation != "_draw":
+            self._publish(
+                "queue", mutation=mutation, length=len(self.playlist.song_queue)
+            )
+        if mutation not in ("next", "_draw"):
+            self._queue_next()
+
+    # Voice Channel Controls
+    async def voice_join(self, channel: discord.VoiceChannel):
+        """Join a voice channel of the guild, moving to it if already in a channel."""
+        if self.voice_client is not None:
+            _log.debug(
+                "Bot is in a voice channel already,"
+                + " moving bot to new channel instead of joining."
+            )
+            await self.voice_client.move_to(channel)
+        else:
+            _log.debug("Joining voice channel.")
+            self.voice_client = await discord.VoiceChannel.connect(channel)
+        _log.info("Joined '%s'.", channel)
+        self._publish("voice", channel=channel.name, channel_id=channel.id)
+
+    @__requires_voice_connected
+    async def voice_leave(self):
+        """Leave current voice channel."""
+        await self.voice_client.disconnect()
+        self.voice_client = None
+        _log.info("[%s] Disconnected from voice channel.", self)
+        self._publish("voice", channel=None, channel_id=None)
+
+    def get_buffer_stats(self):
+        """Display the level and underrun counters of the playing song's jitter buffer."""
+        buffer = getattr(self.player, "original", None)
+        if not isinstance(buffer, JitterBuffer):
+            _log.info("The playing song is not buffered.")
+            return
+        _log.info("Retrieving jitter buffer stats")
+        for name, value in buffer.stats().items():
+            print(f"{name}: {value}")
+
+    # Playlist Controls
+    def get_history(self):
+        """Display recently played songs, most recent first."""
+        _log.info("Retrieving play history")
+        history = self.playlist.recently_played_stack
+        for index in range(len(history)):
+            print(f"[{index}] - {history[-1 - index]}")
+
+    def playlist_queue(self, urls: list[str]):
+        """Add songs to the playlist."""
+        self.playlist.extend(urls)
+        _log.info("Added songs to queue.")
+
+    async def playlist_import(self, path: str, unique: bool = False):
+        """Add the songs of a queue file to the playlist.
+
+        The file is read on a worker thread, and its songs added in chunks, yielding to
+        the event loop between chunks so playback is not stalled.
+
+        Args:
+            path (str): Path of the queue file.
+            unique (bool, optional): Skip songs that are already queued. Defaults to
+                False.
+        """
+        songs = read_queue_file(path)
+        added = read = 0
+        try:
+            while chunk := await asyncio.to_thread(
+                lambda: list(islice(songs, self.IMPORT_CHUNK_SIZE))
+            ):
+                read += len(chunk)
+                added += self.playlist.extend(chunk, unique=unique)
+                await asyncio.sleep(0)
+        except (OSError, TypeError, ValueError) as e:
+            _log.error(
+                "Failed to import queue file '%s', after adding %s songs: %s",
+                path,
+                added,
+                e,
+            )
+            return
+        _log.info(
+            "Imported %s songs from '%s', skipped %s duplicates.",
+            added,
+            path,
+            read - added,
+        )
+
+    @__requires_voice_connected
+    async def playlist_start(self):
+        """Starts the playlist."""
+        _log.info("Starting playlist.")
+        self._requested_at = time.perf_counter()
+        await self.stream_next()
+
+    @__requires_voice_connected
+    def playlist_stop(self):
+        """Stops the playlist."""
+        self.playlist.clear_all()
+        self._stopping = True
+        self.voice_client.stop()
+        _log.info("Stopped and cleared the playlist.")
+
+    async def playlist_play(self, urls: list[str]):
+        """Overrides the Playlist with new songs, playing them"""
+        self.playlist.clear_all()
+        self.playlist_queue(urls)
+        await self.song_skip()
+
+    # Audio Controls
+    @__requires_voice_connected
+    def audio_pause(self):
+        """Pauses the audio streaming."""
+        self.voice_client.pause()
+        _log.info("Paused the audio.")
+
+    @__requires_voice_connected
+    def audio_resume(self):
+        """Resumes the audio streaming."""
+        self.voice_client.resume()
+        _log.info("Resumed the audio.")
+
+    def set_audio_volume(self, volume: int):
+        """Set the session's audio volume level."""
+        volume = float(volume)
+        volume /= 100
+        if not 0.0 <= volume <= 1.0:
+            _log.warning(
+                "Ignoring request to set `bot.volume_level` to '%s' percent.",
+                int(volume * 100),
+            )
+            return
+        if self.player is not None:
+            self.player.volume = volume
+            _log.debug("Adjusted active player's volume.")
+        self.volume = volume
+        _log.info("Volume @ %s.", f"{int(volume * 100)}%")
+        self._publish("volume", volume=round(volume * 100))
+
+    # Song Controls
+    @__requires_voice_connected
+    async def song_skip(self):
+        """Play the next song in the playlist."""
+        self._requested_at = time.perf_counter()
+        if self.voice_client.is_playing():
+            _log.info("Skipped current song.")
+            self._stopping = True
+            self.voice_client.stop()  # Triggers the callback fn 'stream_next'
+        else:
+            _log.info("Playing next song.")
+            await self.stream_next()
+
+    @__requires_voice_connected
+    async def song_prev(self):
+        """Play the previous song in the playlist."""
+        try:
+            self.playlist.add(url=self.playlist.prev(), index=0)
+            _log.info("Playing previous song.")
+            await self.song_skip()
+        except Playlist.ExhaustedException:
+            _log.warning("No previous song. Playlist's RecentlyPlayed list is empty.")
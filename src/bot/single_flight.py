@@ -0,0 +1,65 @@
+"""Coalescing of concurrent calls for the same work into a single call."""
+
+import asyncio
+import typing
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time. Callers asking for a key whose call is
+    already in flight await that call's result, instead of starting another call.
+
+    Cancelling a caller does not cancel the shared call, as other callers may be awaiting
+    it. A call with no callers left runs to completion, so its side effects (e.g. caching
+    its result) still happen.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[typing.Hashable, asyncio.Task] = {}
+        self.calls: int = 0
+        self.coalesced: int = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(
+        self, key: typing.Hashable, func: typing.Callable[[], typing.Awaitable]
+    ) -> typing.Any:
+        """|coro| Calls `func`, or joins the call in flight for `key`, returning its result.
+
+        Args:
+            key (Hashable): Identifies the work `func` does.
+            func (Callable[[], Awaitable]): Coroutine function doing the work.
+
+        Raises:
+            Exception: any error raised by the call, to every caller awaiting it.
+
+        Returns:
+            Any: The result of the call.
+        """
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: typing.Hashable, task: asyncio.Task):
+        """Forgets a finished call, so the next call for its key starts afresh."""
+
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved, in case every caller was cancelled.
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of calls made, calls coalesced, and calls in flight."""
+
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
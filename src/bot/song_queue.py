@@ -0,0 +1,219 @@
+"""Indexable sequence used by the `Playlist` to store queued song urls."""
+
+import typing
+from itertools import chain, islice
+
+
+class SongQueue:
+    """Sequence of song urls that stays fast for very large queues.
+
+    Urls are stored in blocks of at most `BLOCK_SIZE` elements. A Fenwick tree over the
+    block lengths locates any index in O(log n), so inserting or removing at an arbitrary
+    index (e.g. picking a random song to shuffle) is O(log n). Operations on either end of
+    the queue only touch the first or last block.
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self, urls: typing.Iterable[str] = ()):
+        """Initialises an empty queue, then appends any `urls` given.
+
+        Args:
+            urls (Iterable[str], optional): Urls to queue initially. Defaults to none.
+        """
+
+        self._blocks: list[list[str]] = []
+        self._tree: list[int] = [0]
+        self._len: int = 0
+        self._empty_blocks: int = 0
+        self.extend(urls)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return chain.from_iterable(self._blocks)
+
+    def __getitem__(self, index: int) -> str:
+        block, offset = self._locate(self._normalise(index))
+        return self._blocks[block][offset]
+
+    def __setitem__(self, index: int, url: str):
+        block, offset = self._locate(self._normalise(index))
+        self._blocks[block][offset] = url
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def copy_blocks(self) -> list[list[str]]:
+        """Returns a copy of the blocks of urls, in order. Copying the blocks is much
+        cheaper than iterating over every url, as each block is copied at once."""
+
+        return [block.copy() for block in self._blocks]
+
+    # Fenwick tree over the block lengths.
+    def _rebuild(self):
+        """Rebuilds the Fenwick tree after blocks were added or removed."""
+
+        size = len(self._blocks)
+        tree = [0] * (size + 1)
+        for i, block in enumerate(self._blocks, start=1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._empty_blocks = sum(1 for block in self._blocks if not block)
+
+    def _update(self, block: int, delta: int):
+        """Adjusts the recorded length of a block by `delta`."""
+
+        size = len(self._blocks)
+        i = block + 1
+        while i <= size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        """Finds the block holding `index`, and the offset of `index` within that block.
+
+        Args:
+            index (int): A valid, non-negative, index into the queue.
+
+        Returns:
+            tuple[int, int]: The block index and the offset within the block.
+        """
+
+        first = len(self._blocks[0])
+        if index < first:
+            return 0, index
+        last_start = self._len - len(self._blocks[-1])
+        if index >= last_start:
+            return len(self._blocks) - 1, index - last_start
+
+        position = 0
+        step = 1 << (len(self._blocks).bit_length() - 1)
+        while step:
+            candidate = position + step
+            if candidate < len(self._tree) and self._tree[candidate] <= index:
+                position = candidate
+                index -= self._tree[candidate]
+            step >>= 1
+        return position, index
+
+    def _normalise(self, index: int) -> int:
+        """Converts a negative index to a positive one, validating it is in range."""
+
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("SongQueue index out of range")
+        return index
+
+    def _trim(self):
+        """Drops empty blocks from the ends of the queue, and compacts the blocks if
+        too many emptied out in the middle."""
+
+        dropped = False
+        while self._blocks and not self._blocks[0]:
+            del self._blocks[0]
+            dropped = True
+        while self._blocks and not self._blocks[-1]:
+            self._blocks.pop()
+            dropped = True
+        if self._empty_blocks * 2 > len(self._blocks):
+            self._blocks = [block for block in self._blocks if block]
+            dropped = True
+        if dropped:
+            self._rebuild()
+
+    # Sequence mutations.
+    def append(self, url: str):
+        """Adds a url to the end of the queue."""
+
+        if not self._blocks or len(self._blocks[-1]) >= self.BLOCK_SIZE:
+            self._blocks.append([url])
+            self._rebuild()
+        else:
+            self._blocks[-1].append(url)
+            self._update(len(self._blocks) - 1, 1)
+        self._len += 1
+
+    def appendleft(self, url: str):
+        """Adds a url to the front of the queue."""
+
+        if not self._blocks or len(self._blocks[0]) >= self.BLOCK_SIZE:
+            self._blocks.insert(0, [url])
+            self._rebuild()
+        else:
+            self._blocks[0].insert(0, url)
+            self._update(0, 1)
+        self._len += 1
+
+    def extend(self, urls: typing.Iterable[str]):
+        """Adds many urls to the end of the queue, in order."""
+
+        urls = iter(urls)
+        if self._blocks:
+            last = self._blocks[-1]
+            last.extend(islice(urls, self.BLOCK_SIZE - len(last)))
+        while block := list(islice(urls, self.BLOCK_SIZE)):
+            self._blocks.append(block)
+        self._len = sum(len(block) for block in self._blocks)
+        self._rebuild()
+
+    def insert(self, index: int, url: str):
+        """Inserts a url before `index`. Follows the semantics of `list.insert`."""
+
+        if index < 0:
+            index = max(index + self._len, 0)
+        if index == 0:
+            self.appendleft(url)
+            return
+        if index >= self._len:
+            self.append(url)
+            return
+
+        block, offset = self._locate(index)
+        self._blocks[block].insert(offset, url)
+        self._len += 1
+        if len(self._blocks[block]) > self.BLOCK_SIZE:
+            full = self._blocks[block]
+            half = len(full) // 2
+            self._blocks[block : block + 1] = [full[:half], full[half:]]
+            self._rebuild()
+        else:
+            self._update(block, 1)
+
+    def pop(self, index: int = -1) -> str:
+        """Removes and returns the url at `index`. Defaults to the last url.
+
+        Raises:
+            IndexError: if the queue is empty or `index` is out of range.
+        """
+
+        block, offset = self._locate(self._normalise(index))
+        url = self._blocks[block].pop(offset)
+        self._len -= 1
+        self._update(block, -1)
+        if not self._blocks[block]:
+            self._empty_blocks += 1
+            self._trim()
+        return url
+
+    def popleft(self) -> str:
+        """Removes and returns the url at the front of the queue.
+
+        Raises:
+            IndexError: if the queue is empty.
+        """
+
+        return self.pop(0)
+
+    def clear(self):
+        """Removes all urls from the queue."""
+
+        self._blocks.clear()
+        self._tree = [0]
+        self._len = 0
+        self._empty_blocks = 0
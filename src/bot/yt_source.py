@@ -2,11 +2,20 @@
 
 import asyncio
 import logging
+import os
+import weakref
 
 import discord
 import youtube_dl
 
 import utils
+from .audio_cache import AudioCache
+from .extractor import ProcessPoolExtractor
+from .gain import GainTransformer
+from .info_cache import InfoCache
+from .jitter import JitterBuffer
+from .latency import LATENCY
+from .single_flight import SingleFlight
 
 
 _log = logging.getLogger(__name__)
@@ -17,7 +26,7 @@ _log.setLevel(logging.ERROR)
 youtube_dl.utils.bug_reports_message = lambda: ""
 
 
-class YTDLSource(discord.PCMVolumeTransformer):
+class YTDLSource(GainTransformer):
     """FFMPEG audio source extracted via the YTDL lib."""
 
     ytdl_format_options = {
@@ -39,6 +48,13 @@ class YTDLSource(discord.PCMVolumeTransformer):
     }
 
     ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+    info_cache = InfoCache()
+    extractor: ProcessPoolExtractor = None  # Extracts on the default executor if unset.
+    extractions = SingleFlight()
+    audio_cache: AudioCache = None  # Streams every song if unset.
+    opus = False  # Send Opus to Discord from FFMPEG, see `YTDLOpusSource`.
+    buffer_options: dict = None  # `JitterBuffer` options, reads FFMPEG inline if unset.
+    ffmpeg_sources = weakref.WeakSet()  # Every FFMPEG audio source not yet collected.
 
     def __init__(self, source, *, data, volume=0.5):
         super().__init__(source, volume)
@@ -48,21 +64,213 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.url = data.get("url")
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False):
-        """Return an FFMPEG audio source from the YouTube url."""
+    async def extract(cls, url, *, loop=None, stream=False):
+        """Return the info youtube_dl extracts for the YouTube url, or None if it failed.
+
+        When streaming, the extracted info is cached in `info_cache`, so replaying a song
+        goes straight to FFMPEG until its stream url expires. Concurrent extractions of
+        the same song are coalesced into one by `extractions`.
+        """
         loop = loop or asyncio.get_event_loop()
+        key = utils.canonical_url(url)
+        data = cls.info_cache.get(key) if stream else None
+        if data is not None:
+            return data
+
+        return await cls.extractions.do(
+            (key, stream), lambda: cls._extract(url, key, loop=loop, stream=stream)
+        )
+
+    @classmethod
+    async def _extract(cls, url, key, *, loop, stream):
+        """Extract the info of the YouTube url, caching it if streaming."""
         try:
-            data = await loop.run_in_executor(
-                executor=None,
-                func=lambda: cls.ytdl.extract_info(url, download=not stream),
-            )
+            with LATENCY.time("extract"):
+                if cls.extractor is not None:
+                    data = await cls.extractor.extract(url, download=not stream)
+                else:
+                    data = await loop.run_in_executor(
+                        executor=None,
+                        func=lambda: cls.ytdl.extract_info(url, download=not stream),
+                    )
         except Exception as e:
-            _log.error("URL extraction failed: '%s'", e.args[0])
+            _log.error("URL extraction failed: '%s'", e)
             return None  # Catch any download/stream error.
 
         if "entries" in data:
             # take first item from a playlist
             data = data["entries"][0]
+        if stream:
+            cls.info_cache.put(key, data)
+        return data
+
+    @classmethod
+    def use_process_pool(cls, max_workers: int, timeout: float = 30.0):
+        """Extract songs in a warm pool of `max_workers` processes, instead of on threads.
+
+        Keeps youtube_dl's CPU heavy extraction from competing for the GIL with the audio
+        player's thread. Extractions taking longer than `timeout` seconds are abandoned.
+        """
+        cls.extractor = ProcessPoolExtractor(
+            cls.ytdl_format_options, max_workers=max_workers, timeout=timeout
+        )
+        cls.extractor.warm()
+
+    @classmethod
+    def close_process_pool(cls):
+        """Shut down the extraction process pool, if it is used."""
+        if cls.extractor is not None:
+            cls.extractor.close()
+            cls.extractor = None
+
+    @classmethod
+    def use_audio_cache(cls, directory: str, budget: int):
+        """|Blocking| Play frequently played songs from files downloaded into `directory`,
+        keeping at most `budget` bytes of files."""
+        cls.audio_cache = AudioCache(directory, budget, cls.download_to)
+
+    @classmethod
+    async def close_audio_cache(cls):
+        """Save the audio cache's index, if it is used."""
+        if cls.audio_cache is not None:
+            await cls.audio_cache.close()
+
+    @classmethod
+    def ffmpeg_processes(cls) -> int:
+        """Returns the number of FFMPEG processes running."""
+        running = 0
+        for source in list(cls.ffmpeg_sources):
+            process = getattr(source, "_process", None)
+            if process and process.poll() is None:
+                running += 1
+        return running
+
+    @classmethod
+    async def download_to(cls, url, directory):
+        """Download the YouTube url into `directory`, returning the file's path and info.
+
+        Raises:
+            OSError: If the song could not be downloaded.
+        """
+        options = dict(
+            cls.ytdl_format_options, outtmpl=os.path.join(directory, "%(id)s.%(ext)s")
+        )
+
+        def download():
+            ytdl = youtube_dl.YoutubeDL(options)
+            try:
+                data = ytdl.extract_info(url, download=True)
+            except youtube_dl.utils.YoutubeDLError as e:
+                raise OSError(f"Failed to download '{url}': {e}") from e
+            if "entries" in data:
+                # take first item from a playlist
+                data = data["entries"][0]
+            return ytdl.prepare_filename(data), data
+
+        return await asyncio.to_thread(download)
+
+    @classmethod
+    async def prefetch(cls, url, *, loop=None):
+        """Extract and cache the info of the YouTube url for streaming, if not cached already."""
+        key = utils.canonical_url(url)
+        if key not in cls.info_cache and not (
+            cls.audio_cache is not None and key in cls.audio_cache
+        ):
+            await cls.extract(url, loop=loop, stream=True)
+
+    @classmethod
+    def record_play(cls, url):
+        """Count a play of the YouTube url towards caching its audio, as it starts
+        playing."""
+        if cls.audio_cache is not None:
+            cls.audio_cache.record_play(utils.canonical_url(url), url)
+
+    @classmethod
+    async def from_url(cls, url, *, loop=None, stream=False, volume=0.5):
+        """Return an FFMPEG audio source from the YouTube url.
+
+        When streaming, songs in the `audio_cache` are played from their local file.
+        In `opus` mode, a `YTDLOpusSource` is returned instead.
+        """
+        with LATENCY.time("from_url"):
+            return await cls._from_url(url, loop=loop, stream=stream, volume=volume)
+
+    @classmethod
+    async def _from_url(cls, url, *, loop, stream, volume):
+        """Return an FFMPEG audio source from the YouTube url, see `from_url`."""
+        if stream and cls.audio_cache is not None:
+            key = utils.canonical_url(url)
+            cached = cls.audio_cache.lookup(key)
+            if cached is not None:
+                path, title = cached
+                data = {"title": title, "url": path, "webpage_url": url}
+                return await cls._build(path, data=data, volume=volume)
+
+        data = await cls.extract(url, loop=loop, stream=stream)
+        if data is None:
+            return None
 
         filename = data["url"] if stream else cls.ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **cls.ffmpeg_options), data=data)
+        return await cls._build(filename, data=data, volume=volume)
+
+    @classmethod
+    async def _build(cls, filename, *, data, volume):
+        """Return the audio source playing `filename`, probing its codec in `opus` mode.
+        PCM audio is read ahead of the audio player by a `JitterBuffer`, if configured.
+        """
+        if cls.opus:
+            codec = data.get("acodec")
+            if codec is None:  # Local files have no extracted info to read it from.
+                # Never raises, a failed probe finds no codec.
+                codec, _ = await discord.FFmpegOpusAudio.probe(filename)
+                if codec is None:
+                    _log.error("Codec probe of '%s' failed, decoding to PCM.", filename)
+            if codec is not None:
+                with LATENCY.time("ffmpeg_spawn"):
+                    source = YTDLOpusSource(
+                        filename, data=data, volume=volume, codec=codec
+                    )
+                cls.ffmpeg_sources.add(source)
+                return source
+        with LATENCY.time("ffmpeg_spawn"):
+            source = discord.FFmpegPCMAudio(filename, **cls.ffmpeg_options)
+        cls.ffmpeg_sources.add(source)
+        if cls.buffer_options is not None:
+            source = JitterBuffer(source, **cls.buffer_options)
+        return cls(source, data=data, volume=volume)
+
+
+class YTDLOpusSource(discord.FFmpegOpusAudio):
+    """FFMPEG Opus audio source, sent to Discord without decoding it to PCM in Python.
+
+    The volume is applied by FFMPEG, which encodes the scaled audio to Opus. Opus streams
+    played at full volume are passed through FFMPEG without being re-encoded. FFMPEG is
+    given the volume when it starts, so a volume set while a song plays applies from the
+    next song.
+    """
+
+    def __init__(self, filename, *, data, volume=0.5, codec=None):
+        self.data = data
+        self.title = data.get("title")
+        self.url = data.get("url")
+        self._volume = volume
+        super().__init__(filename, **self.ffmpeg_args(codec, volume))
+
+    @staticmethod
+    def ffmpeg_args(codec: str | None, volume: float = 1.0) -> dict:
+        """Returns the arguments of `FFmpegOpusAudio` playing a stream of `codec` at
+        `volume`, so that Opus streams at full volume are copied rather than re-encoded."""
+        options = YTDLSource.ffmpeg_options["options"]
+        if volume != 1.0:
+            return {"codec": None, "options": f"{options} -filter:a volume={volume:g}"}
+        return {"codec": codec if codec == "opus" else None, "options": options}
+
+    @property
+    def volume(self) -> float:
+        """Volume of the source, applied by FFMPEG from the next song if changed."""
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = value
+        _log.info("Volume applies to Opus audio from the next song.")
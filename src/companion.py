@@ -1,10 +1,16 @@
-"""Socket logic to communicate with a companion app over a TCP Socket."""
+"""Socket logic to communicate with companion apps over TCP connections."""
 
+import asyncio
+import collections
+import json
 import logging
-import socket
+import typing
 
 import utils
-from console import Console
+from bot.events import EventBus, Subscription
+from bot.latency import LATENCY
+from console import Command, Console
+from framing import LineFramer, encode_lines
 
 
 _log = logging.getLogger(__name__)
@@ -12,163 +18,553 @@ _log.addHandler(utils.HANDLER)
 _log.setLevel(logging.INFO)
 
 
-class Server:
-    """Simple single client server over a socket that sends/receives
-    messages in lines (terminated by '/n') of Strings."""
+class Connection(asyncio.BufferedProtocol):
+    """Connection of a companion, that sends/receives messages in lines (terminated by
+    '\\n') of Strings.
 
-    def __init__(self, hostname: str, port: int):
-        """Creates a simple single client server over a socket that sends/receives
-        messages in lines (terminated by '/n') of Strings.
+    Bytes are received straight into the connection's `LineFramer`, and every line they
+    complete is queued for `receive_line`. Reading is paused while `MAX_PENDING_LINES`
+    lines are queued. Lines sent during an iteration of the event loop are written
+    together at its end, and sending waits while the companion is behind on receiving.
+    """
 
-            Args:
-                hostname (str): Hostname of the server socket.
-                port (int): Port to open the server socket on.
-        """
+    MAX_PENDING_LINES = 1024
+
+    def __init__(self, server: "Server"):
+        """Creates the connection of a companion to `server`, made by the event loop."""
+
+        self.server = server
+        self.framer = LineFramer(server.read_limit)
+        self.lines: collections.deque[bytes] = collections.deque()
+        self.transport: asyncio.Transport = None
+        self.address = None
+        self.closed = False
+        self._reading_paused = False
+        self._readable: asyncio.Future = None
+        self._drained: asyncio.Future = None
+        self._outgoing: list[bytes] = []
+
+    # Protocol callbacks, called by the event loop.
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self.address = transport.get_extra_info("peername")
+        transport.set_write_buffer_limits(high=self.server.write_limit)
+        self.server.connected(self)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        try:
+            lines = self.framer.buffer_updated(nbytes)
+        except ValueError as e:
+            _log.warning("Companion %s sent too long a line: %s", self.address, e)
+            self.transport.close()
+            return
+        if not lines:
+            return
+        self.lines.extend(lines)
+        if len(self.lines) >= self.MAX_PENDING_LINES and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        self._wake(self._readable)
+
+    def eof_received(self) -> bool:
+        return False  # Closes the transport.
+
+    def connection_lost(self, exc: Exception):
+        self.closed = True
+        self._wake(self._readable)
+        self._wake(self._drained)
+
+    def pause_writing(self):
+        self._drained = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        self._wake(self._drained)
+        self._drained = None
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    # Connection API.
+    async def receive_line(self) -> str:
+        """|coro| Receive the next string terminated by a newline character.
 
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(
-            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1
-        )  # Allow reused afterwards
-        self.server_socket.bind((hostname, port))
-        self.server_socket.listen(1)
-        self.client_socket, self.address = None, None
-        self.buffer = []
+        Raises:
+            Server.ConnectionBrokenException: If the connection was terminated, or was
+            idle for the server's `idle_timeout` seconds, before a full line was received.
 
-    class ConnectionBrokenException(Exception):
-        """Explicit exception raised when the connection to the client
-        is broken.
+        Returns:
+            str: Decoded string message sent from the companion.
         """
 
-    @utils.to_thread
-    def connect(self):
-        """Awaits a client connection."""
-        (self.client_socket, self.address) = self.server_socket.accept()
-
-    def disconnect(self):
-        """Disconnects the client and server sockets."""
+        while not self.lines:
+            if self.closed:
+                raise Server.ConnectionBrokenException("Connection closed")
+            self._readable = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._readable, self.server.idle_timeout)
+            except TimeoutError as e:
+                raise Server.ConnectionBrokenException("Connection idle") from e
 
-        self.server_socket.shutdown(socket.SHUT_RDWR)
-        self.server_socket.close()
-        if self.client_socket:
-            self.client_socket.shutdown(socket.SHUT_RDWR)
-            self.client_socket.close()
+        line = self.lines.popleft()
+        if self._reading_paused and len(self.lines) < self.MAX_PENDING_LINES // 2:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        return line.decode()
 
-    def receive_line(self) -> str:
-        """Receive the next string terminated by a newline character.
+    async def send_lines(self, messages: list[str]):
+        """|coro| Sends messages over the connection to the companion, in one write.
 
-        Receives bytes of information, in chunks of 1024, from the client socket,
-        until a newline character is reached. Bytes of characters that were received,
-        but not part of the String being terminated by the newline character
-        will be saved in the `self.buffer` for the next receive_line call to read.
+        Messages not terminated by a newline will have one added, before they are
+        encoded. Waits while the companion is behind on receiving what was sent.
 
         Raises:
-            Server.ConnectionBrokenException: If the connection was terminated before a
-            full line was received.
-
-        Returns:
-            str: Decoded string message  sent from the client.
+            Server.ConnectionBrokenException: If the connection was terminated.
         """
 
-        chunks = []
+        if self.closed:
+            raise Server.ConnectionBrokenException("Connection closed")
+        if not self._outgoing:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._outgoing += encode_lines(messages)
+        if self._drained is not None:
+            await asyncio.shield(self._drained)
+            if self.closed:
+                raise Server.ConnectionBrokenException("Connection closed")
 
-        while len(self.buffer) > 0:
-            buffered = self.buffer.pop()
-            if b"\n" in buffered:
-                i = buffered.index(b"\n")
-                chunks.append(buffered[:i])
-                self.buffer.append(buffered[i + 1 :])
-                return b"".join(chunks).decode()
-            chunks.append(buffered)
+    def _flush(self):
+        """Writes the lines sent during this iteration of the event loop."""
 
-        while True:
-            chunk = self.client_socket.recv(1024)
-            if not chunk:
-                raise Server.ConnectionBrokenException()
+        outgoing, self._outgoing = self._outgoing, []
+        if not self.closed:
+            self.transport.writelines(outgoing)
 
-            if b"\n" in chunk:
-                i = chunk.index(b"\n")
-                chunks.append(chunk[:i])
-                self.buffer.append(chunk[i + 1 :])
-                return b"".join(chunks).decode()
-            chunks.append(chunk)
+    async def send_line(self, msg: str):
+        """|coro| Sends a message over the connection to the companion, see `send_lines`."""
 
-    def send_line(self, msg: str):
-        """Sends a message over the socket to the client.
+        await self.send_lines([msg])
 
-        If the message is not terminated by a newline, one will be added, before it is encoded.
+    def close(self):
+        """Closes the connection, once the lines sent are written."""
 
+        if self.transport is not None:
+            if self._outgoing:
+                self._flush()
+            self.transport.close()
 
-        Args:
-            msg (str): Unencoded string message to send over the socket to the client.
 
-        Raises:
-            Server.ConnectionBrokenException: If the connection was terminated before
-            a full line was sent, which is realised when 0 bytes of the message
-            have sent over the socket after a `socket.send` call.
+class Server:
+    """Server of many companion connections at once, each served by a coroutine on the
+    event loop rather than a thread."""
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        handler,
+        *,
+        max_connections: int = 16,
+        idle_timeout: float = 600.0,
+        read_limit: int = 64 * 1024,
+        write_limit: int = 64 * 1024,
+    ):
+        """Creates a server of companion connections, started by `start`.
+
+        Args:
+            hostname (str): Hostname of the server socket.
+            port (int): Port to open the server socket on.
+            handler (Callable[[Connection], Awaitable]): Coroutine function serving a
+                connection, until it returns or the connection is broken.
+            max_connections (int, optional): Connections served at once, further
+                connections are refused. Defaults to 16.
+            idle_timeout (float, optional): Seconds a connection may send nothing for,
+                before it is closed. Defaults to 600.0.
+            read_limit (int, optional): Length in bytes of the longest line that can be
+                received. Defaults to 64 KiB.
+            write_limit (int, optional): Bytes buffered per connection for sending.
+                Defaults to 64 KiB.
         """
 
-        if not msg.endswith("\n"):
-            msg = msg + "\n"
-        msg = msg.encode()
+        self.hostname = hostname
+        self.port = port
+        self.handler = handler
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.read_limit = read_limit
+        self.write_limit = write_limit
+        self.server: asyncio.Server = None
+        self.connections: set[Connection] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    class ConnectionBrokenException(Exception):
+        """Explicit exception raised when the connection to a companion is broken."""
+
+    async def start(self):
+        """|coro| Serves companion connections, until disconnected."""
+
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(
+            lambda: Connection(self), self.hostname, self.port
+        )
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    def connected(self, connection: Connection):
+        """Serves a new connection with the handler, unless at the limit."""
+
+        if len(self.connections) >= self.max_connections:
+            _log.warning("Refused companion %s, at the limit.", connection.address)
+            connection.transport.write(b"503/BUSY\n")
+            connection.close()
+            return
+
+        self.connections.add(connection)
+        _log.info("Companion %s Connected!", connection.address)
+        task = asyncio.get_running_loop().create_task(self._serve(connection))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _serve(self, connection: Connection):
+        """|coro| Runs the handler on a connection, until it is broken."""
+
+        try:
+            await self.handler(connection)
+        except Server.ConnectionBrokenException:
+            pass
+        finally:
+            self.connections.discard(connection)
+            connection.close()
+            _log.info("Companion %s Disconnected!", connection.address)
+
+    def disconnect(self):
+        """Stops accepting connections, and closes every connection."""
+
+        if self.server is not None:
+            self.server.close()
+        for connection in list(self.connections):
+            connection.close()
 
-        total_sent = 0
-        while total_sent < len(msg):
-            sent = self.client_socket.send(msg[total_sent:])
-            if sent == 0:
-                raise Server.ConnectionBrokenException()
-            total_sent = total_sent + sent
+
+class ProtocolError(Exception):
+    """Raised when a companion's request does not follow the protocol."""
+
+
+class UnknownCommandError(ProtocolError):
+    """Raised when a companion requests a command the Console does not support."""
 
 
 class CompanionConsole:
-    """Extension of the Console class that can receive commands
-    over a Socket.
+    """Extension of the Console class that can receive commands over TCP connections,
+    from many companions at once.
+
+    Companions speak either of two protocols, chosen per line:
+
+    1. A command and its arguments separated by spaces, acknowledged with `200/OK`
+       before the command runs.
+    2. A JSON object `{"id": ..., "command": "volume", "args": ["50"]}`, optionally with
+       `"v": 2`. Many requests can be in flight per connection, each answered by a JSON
+       object with the same `id` as soon as its command finishes, in any order:
+       `{"v": 2, "id": ..., "ok": true, "result": ..., "output": "..."}`, with the
+       command's return value and printed output, or `{"v": 2, "id": ..., "ok": false,
+       "error": {"type": "UsageError", "message": "..."}}`. The `hello` command answers
+       with the protocol version and the commands supported.
+
+    Over the second protocol, the `subscribe` command streams the Bot's state changes to
+    the companion, as lines `{"v": 2, "event": {"type": "volume", ...}}` (see
+    `bot.events`), until the `unsubscribe` command or the companion leaves. Its optional
+    args are the subscription's policy, `coalesce` (the default) or `drop_oldest`, and
+    the number of events held for the companion while it is behind on receiving. When
+    events were dropped, an event `{"type": "dropped", "count": ...}` precedes the next.
     """
 
-    def __init__(self, console: Console, hostname: str, port: int):
+    PROTOCOL_VERSION = 2
+    MAX_IN_FLIGHT = 64  # Requests per connection, past which no more are read.
+
+    def __init__(
+        self,
+        console: Console,
+        hostname: str,
+        port: int,
+        events: EventBus = None,
+        **options,
+    ):
         """Creates an extension of the Console class that receives input
-        for commands via a TCP Socket.
+        for commands via TCP connections.
 
         Args:
             console (Console): Console to send input to.
             hostname (str): Hostname of the server socket.
             port (int): Port to open the server socket on.
+            events (EventBus, optional): Events companions can subscribe to. Defaults
+                to None, not supporting the `subscribe` command.
+            **options: Connection limits of the `Server`.
         """
-        self.server = Server(hostname, port)
+        self.server = Server(hostname, port, self.serve, **options)
         self.console = console
+        self.events = events
+        self.subscriptions: dict[Connection, Subscription] = {}
+        self._streams: set[asyncio.Task] = set()
+
+    async def acknowledge(self, connection: Connection, instruction: str) -> list[str]:
+        """|coro| Acknowledges a command of the first protocol.
 
-    def get_socket_input(self) -> list[str]:
-        """Receives input via the socket.
+        The `stats` command is answered over the connection with the playback latency
+        stats, a line per stage, before the acknowledgement.
 
         Raises:
-            Server.ConnectionBrokenException: If the socket connection is broken.
+            Server.ConnectionBrokenException: If the connection is broken.
 
         Returns:
             list: A list containing a command and its arguments.
         """
 
-        instruction = self.server.receive_line()
-        self.server.send_line("200/OK")
-        return instruction.split(" ")
+        args = instruction.split(" ")
+        if args[0].strip().casefold() == "stats":
+            await connection.send_lines(LATENCY.report() + ["200/OK"])
+        else:
+            await connection.send_line("200/OK")
+        return args
+
+    async def serve(self, connection: Connection):
+        """|coro| Receives commands over a connection and sends them to the Console to be
+        executed, until the connection is broken or the Console goes offline."""
+
+        in_flight = asyncio.Semaphore(self.MAX_IN_FLIGHT)
+        requests: set[asyncio.Task] = set()
+
+        def finished(task: asyncio.Task):
+            requests.discard(task)
+            in_flight.release()
+
+        try:
+            await self._serve_requests(connection, in_flight, requests, finished)
+        finally:
+            self.unsubscribe(connection)
+
+    async def _serve_requests(
+        self,
+        connection: Connection,
+        in_flight: asyncio.Semaphore,
+        requests: set[asyncio.Task],
+        finished: typing.Callable[[asyncio.Task], None],
+    ):
+        """|coro| Receives and runs the commands of a connection, for `serve`."""
 
-    async def start(self):
-        """|coro| Starts the CompanionConsole. Awaits a connection.
+        while self.console.online:
+            instruction = await connection.receive_line()
+            if instruction.startswith("{"):
+                request_id, args, error = self.read_request(instruction)
+                command = self.console.get_command(args[0]) if args else None
+                if command is None or not command.is_coroutine:
+                    # Answered without awaiting the Console, so without a task.
+                    await self.respond(connection, request_id, args, error)
+                    continue
+                await in_flight.acquire()
+                task = asyncio.create_task(self.respond(connection, request_id, args))
+                requests.add(task)
+                task.add_done_callback(finished)
+                continue
+
+            command = await self.acknowledge(connection, instruction)
+            try:
+                await self.console.handle_command(command)
+            except Command.UsageError as e:
+                _log.warning(
+                    "Command %s Usage Error: '%s'.", command[0].upper(), e.args[0]
+                )
+
+    def read_request(
+        self, instruction: str
+    ) -> tuple[typing.Any, list[str], ProtocolError]:
+        """Reads a request of the second protocol.
 
-        Once connected, will receive commands over the socket and send them to
-        the Console to be executed.
+        Returns:
+            tuple: The request's id, then its command and arguments, as typed in the
+            Console, or the error making the request invalid.
         """
-        while self.console.online:
-            _log.debug("TCP Socket Open...")
+
+        request_id = None
+        try:
             try:
-                await self.server.connect()
-                _log.info("Companion Connected!")
-                try:
-                    await self.console.start(self.get_socket_input)
-                except Server.ConnectionBrokenException:
-                    _log.info("Companion Disconnected!")
-            except OSError:
-                _log.debug("TCP Socket waiting for connection was interupted.")
+                request = json.loads(instruction)
+            except ValueError as e:
+                raise ProtocolError(f"Invalid JSON: {e}") from e
+            if not isinstance(request, dict):
+                raise ProtocolError("Request must be a JSON object")
+            request_id = request.get("id")
+            return request_id, self.parse_request(request), None
+        except ProtocolError as e:
+            return request_id, None, e
+
+    async def respond(
+        self,
+        connection: Connection,
+        request_id: typing.Any,
+        args: list[str],
+        error: ProtocolError = None,
+    ):
+        """|coro| Runs a request of the second protocol, and sends its response."""
+
+        try:
+            if error is not None:
+                raise error
+            if args[0] == "hello":
+                result, output = self.hello(), ""
+            elif args[0] == "subscribe":
+                result, output = self.subscribe(connection, args), ""
+            elif args[0] == "unsubscribe":
+                result, output = self.unsubscribe(connection), ""
+            else:
+                result, output = await self.execute(args)
+            response = {"ok": True, "result": result, "output": output}
+        except (ProtocolError, Command.UsageError) as e:
+            response = {"ok": False, "error": self.error(e)}
+        except Exception as e:  # noqa: BLE001 - replied to the companion as an error.
+            _log.exception("Command request %s failed.", request_id)
+            response = {"ok": False, "error": self.error(e)}
+
+        response = {"v": self.PROTOCOL_VERSION, "id": request_id, **response}
+        try:
+            await connection.send_line(json.dumps(response, default=str))
+        except Server.ConnectionBrokenException:
+            pass  # The companion left before the command finished.
+
+    def parse_request(self, request: dict) -> list[str]:
+        """Returns the command and arguments of a request, as typed in the Console.
+
+        Raises:
+            ProtocolError: If the request is invalid for this version of the protocol.
+        """
+
+        version = request.get("v", self.PROTOCOL_VERSION)
+        if version != self.PROTOCOL_VERSION:
+            raise ProtocolError(f"Unsupported protocol version {version!r}")
+        command, args = request.get("command"), request.get("args", [])
+        if not isinstance(command, str) or not command.strip():
+            raise ProtocolError("Request must have a command")
+        if not isinstance(args, list):
+            raise ProtocolError("Request args must be a list")
+        return [command.strip().casefold(), *(str(arg) for arg in args)]
+
+    def hello(self) -> dict:
+        """Returns the protocol version, and the commands the Console supports."""
+
+        return {
+            "protocol": self.PROTOCOL_VERSION,
+            "commands": sorted(self.console.commands),
+        }
+
+    def subscribe(self, connection: Connection, args: list[str]) -> dict:
+        """Streams the Bot's events to a companion, replacing its subscription, if any.
+
+        Raises:
+            UnknownCommandError: If there are no events to subscribe to.
+            Command.UsageError: If the policy or size of the subscription is invalid.
+
+        Returns:
+            dict: The subscription's policy and size, and the `seq` of the last event
+            published before it.
+        """
+
+        if self.events is None:
+            raise UnknownCommandError("Command 'subscribe' is not supported")
+        policy = args[1].casefold() if len(args) > 1 else Subscription.COALESCE
+        try:
+            maxsize = int(args[2]) if len(args) > 2 else 256
+            subscription = self.events.subscribe(maxsize, policy)
+        except ValueError as e:
+            raise Command.UsageError(str(e)) from e
+
+        self.unsubscribe(connection)
+        self.subscriptions[connection] = subscription
+        task = asyncio.get_running_loop().create_task(
+            self.stream_events(connection, subscription)
+        )
+        self._streams.add(task)
+        task.add_done_callback(self._streams.discard)
+        return {
+            "policy": subscription.policy,
+            "maxsize": subscription.maxsize,
+            "seq": self.events.seq,
+        }
+
+    def unsubscribe(self, connection: Connection) -> dict:
+        """Stops streaming events to a companion.
+
+        Returns:
+            dict: Whether the companion was subscribed, and the events it was not sent.
+        """
+
+        subscription = self.subscriptions.pop(connection, None)
+        if subscription is None:
+            return {"subscribed": False, "dropped": 0}
+        subscription.close()
+        return {"subscribed": True, "dropped": subscription.dropped}
+
+    async def stream_events(self, connection: Connection, subscription: Subscription):
+        """|coro| Sends the events of a subscription to a companion, until it is closed.
+
+        Events published while sending are held by the subscription, within its bounds,
+        so a companion slow to receive never holds up the sessions publishing events.
+        """
+
+        reported = 0  # Events dropped, that the companion was told of.
+        try:
+            while events := await subscription.get():
+                lines = []
+                if subscription.dropped > reported:
+                    dropped = {
+                        "type": "dropped",
+                        "count": subscription.dropped - reported,
+                    }
+                    reported = subscription.dropped
+                    lines.append(
+                        json.dumps({"v": self.PROTOCOL_VERSION, "event": dropped})
+                    )
+                lines += [
+                    json.dumps(
+                        {"v": self.PROTOCOL_VERSION, "event": event}, default=str
+                    )
+                    for event in events
+                ]
+                await connection.send_lines(lines)
+        except Server.ConnectionBrokenException:
+            pass
+        finally:
+            subscription.close()
+
+    async def execute(self, args: list[str]) -> tuple[typing.Any, str]:
+        """|coro| Runs a command on the Console, returning its result and printed output,
+        see `Console.execute`.
+
+        Raises:
+            UnknownCommandError: If the Console does not support the command.
+            Command.UsageError: If the arguments are invalid for the command.
+        """
+
+        if not self.console.supports(args[0]):
+            raise UnknownCommandError(f"Command '{args[0]}' is not supported")
+        return await self.console.execute(args)
+
+    @staticmethod
+    def error(e: Exception) -> dict:
+        """Returns the error of a response, for an exception."""
+
+        return {"type": type(e).__name__, "message": str(e)}
+
+    async def start(self):
+        """|coro| Starts the CompanionConsole, serving companions until stopped."""
+
+        _log.debug("TCP Socket Open...")
+        await self.server.start()
 
     def stop(self):
-        """Stops the CompanionConsole by disconnecting the socket it is connected to."""
+        """Stops the CompanionConsole by disconnecting every companion."""
 
         self.server.disconnect()
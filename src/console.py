@@ -1,9 +1,13 @@
 """Asynchronous console controls for the Discord bot are managed by this module."""
 
+import contextlib
+import io
 import logging
+import typing
 from inspect import iscoroutinefunction
 
 import utils
+from bot.latency import LATENCY
 from bot.music_client import MusicClient
 
 
@@ -12,45 +16,76 @@ _log.addHandler(utils.HANDLER)
 _log.setLevel(logging.WARNING)
 
 
+def normalise_alias(alias: str) -> str:
+    """Normalises an alias, so aliases match regardless of case and surrounding spaces."""
+    return alias.strip().casefold()
+
+
 class Command:
-    """Wraps a callable function under an alias.
+    """Wraps a callable function under one or more aliases.
 
-    Can be extended from to validate and pass arguments to the callable function.
+    Can be extended from to validate and pass arguments to the callable function, by
+    overriding `parse`.
     """
 
-    def __init__(self, alias: str, command_func: callable):
+    def __init__(self, alias: str, command_func: callable, *aliases: str):
         """Wraps a callable function under an alias.
 
+        Whether the function is a coroutine is checked once, here, not on every call.
+
         Args:
             alias (str): the string that will trigger a match for this Command.
             command_func (callable): the function to be called when this Command is matched.
+            *aliases (str): other strings that will trigger a match for this Command.
         """
-        self.alias = alias.strip().casefold()
+        self.alias = normalise_alias(alias)
+        self.aliases = (self.alias,) + tuple(normalise_alias(a) for a in aliases)
         self.command_func = command_func
+        self.is_coroutine = iscoroutinefunction(command_func)
+        self.calls: int = 0
 
     def match(self, arg: str) -> bool:
         """Checks whether this Command has been matched.
 
         Args:
-            arg (str): The string to check against this Command's alias.
+            arg (str): The string to check against this Command's aliases.
 
         Returns:
             bool: True if the arg matches this Command.
         """
-        return arg.strip().casefold() == self.alias
+        return normalise_alias(arg) in self.aliases
+
+    def parse(self, args: list[str]) -> tuple:
+        """Converts the args of this Command into the arguments of its function.
+
+        Args:
+            args (list[str]): The args received, where args[0] is the alias matched.
+
+        Raises:
+            Command.UsageError: If the args are invalid for this Command.
+
+        Returns:
+            tuple: The arguments to call the function with.
+        """
+        if len(args) > 1:
+            _log.debug("Ignoring unnessary args %s", args)
+        return ()
 
-    async def call(self, args: list[str]):
-        """Calls this Command's function. If the function is a coroutine, it will await it.
+    async def call(self, args: list[str]) -> typing.Any:
+        """Calls this Command's function, with the arguments parsed from `args`.
+        If the function is a coroutine, it will await it.
 
         Args:
-            args (list[str]): Placeholder for arguments to be passed to a callable func.
-            Used when call is overriden by inheritors.
+            args (list[str]): The args received, where args[0] is the alias matched.
+
+        Returns:
+            Any: The result of the function.
         """
-        _log.debug("Ignoring unnessary args %s", args)
-        if iscoroutinefunction(self.command_func):
-            await self.command_func()
-        else:
-            self.command_func()
+        arguments = self.parse(args)
+        self.calls += 1
+        if self.is_coroutine:
+            return await self.command_func(*arguments)
+        return self.command_func(*arguments)
 
     class UsageError(Exception):
         """Raised by an extended Command if the additional arguments received
@@ -61,33 +96,23 @@ class Command:
 class StringArgsCommand(Command):
     """Extended Command that passes many string args to its callable function."""
 
-    async def call(self, args: list[str]):
+    def parse(self, args: list[str]) -> tuple:
         if len(args) < 2:
             raise self.UsageError("Expects atleast one argument")
-
-        if iscoroutinefunction(self.command_func):
-            await self.command_func(args[1:])
-        else:
-            self.command_func(args[1:])
+        return (args[1:],)
 
 
 class IntArgCommand(Command):
     """Extended Command that passes an Integer argument to its callable function."""
 
-    async def call(self, args: list[str]):
+    def parse(self, args: list[str]) -> tuple:
         if len(args) != 2:
             raise self.UsageError("Expects one argument")
 
-        index = args[1]
-
         try:
-            index = int(index)
+            return (int(args[1]),)
         except ValueError as exc:
             raise self.UsageError("Argument must be an Integer") from exc
-        if iscoroutinefunction(self.command_func):
-            await self.command_func(index)
-        else:
-            self.command_func(index)
 
 
 class Console:
@@ -95,40 +120,92 @@ class Console:
 
     def __init__(self):
         """Init..."""
-        self.commands: list[Command] = []
+        self.commands: dict[str, Command] = {}  # By every alias of each Command.
         self.online: bool = True
 
     def add_command(self, command: Command):
         """Adds a Command this Console can support matching against.
 
         To prevent duplication, this method will not add a Command
-        if its alias matches an existing Command in this Console.
+        if any of its aliases matches an existing Command in this Console.
 
         Args:
             command (Command): Command to add.
         """
 
-        for cmd in self.commands:
-            if cmd.match(command.alias):
+        for alias in command.aliases:
+            if alias in self.commands:
                 _log.warning(
-                    "Console already has a Command with the alias '%s'.", command.alias
+                    "Console already has a Command with the alias '%s'.", alias
                 )
                 return
-        self.commands.append(command)
+        for alias in command.aliases:
+            self.commands[alias] = command
+
+    def get_command(self, alias: str) -> Command | None:
+        """Returns the Command matching an alias, if any."""
+
+        return self.commands.get(normalise_alias(alias))
+
+    def supports(self, alias: str) -> bool:
+        """Checks whether this Console handles a command, by its alias."""
+
+        return normalise_alias(alias) in self.commands
 
-    async def handle_command(self, args: list[str]):
+    def command_stats(self) -> dict[str, int]:
+        """Returns the number of times each Command was called, by its first alias."""
+
+        return {command.alias: command.calls for command in self.commands.values()}
+
+    def get_command_stats(self):
+        """Display each Command, its other aliases, and the number of times it was called."""
+
+        _log.info("Retrieving command stats")
+        for command in dict.fromkeys(self.commands.values()):
+            aliases = (
+                f" ({', '.join(command.aliases[1:])})" if command.aliases[1:] else ""
+            )
+            print(f"{command.alias}{aliases}: {command.calls}")
+
+    async def handle_command(self, args: list[str]) -> typing.Any:
         """Calls the appropriate Command from this Console, if any.
 
         Args:
             args (list[str]): A list of arguments for the Command,
             where args[0] is the alias of the Command requested.
+
+        Returns:
+            Any: The result of the Command, None if there is no such Command.
         """
 
-        for cmd in self.commands:
-            if cmd.match(args[0]):
-                await cmd.call(args)
-                return
-        _log.warning("Command '%s' is not supported.", args[0])
+        with LATENCY.time("command"):
+            command = self.get_command(args[0])
+            if command is None:
+                _log.warning("Command '%s' is not supported.", args[0])
+                return None
+            return await command.call(args)
+
+    async def execute(self, args: list[str]) -> tuple[typing.Any, str]:
+        """Calls the appropriate Command from this Console, returning its result and the
+        output it printed.
+
+        Only the output of Commands that are not coroutines is captured, as the output of
+        other coroutines could be printed while a coroutine Command awaits.
+
+        Args:
+            args (list[str]): A list of arguments for the Command,
+            where args[0] is the alias of the Command requested.
+
+        Returns:
+            tuple[Any, str]: The result of the Command, and its output.
+        """
+
+        command = self.get_command(args[0])
+        if command is None or command.is_coroutine:
+            return await self.handle_command(args), ""
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = await self.handle_command(args)
+        return result, output.getvalue()
 
     async def start(self, input_method: callable):
         """Continously receives input and calls Commands
@@ -156,28 +233,38 @@ def __build_console_commands(console: Console, client: MusicClient):
         console (Console): Console to add Commands to.
         client (MusicClient): MusicClient this Console should control.
     """
+    # Guild Controls
+    console.add_command(Command("guilds", client.get_guilds))
+    console.add_command(IntArgCommand("guild", client.select_guild))
     # Voice Channel Controls
     console.add_command(Command("channels", client.get_voice_channels))
-    console.add_command(IntArgCommand("join", client.voice_join))
+    console.add_command(StringArgsCommand("join", client.voice_join))
     console.add_command(Command("leave", client.voice_leave))
     # Audio Controls
     console.add_command(Command("pause", client.audio_pause))
     console.add_command(Command("resume", client.audio_resume))
-    console.add_command(IntArgCommand("volume", client.set_audio_volume))
+    console.add_command(IntArgCommand("volume", client.set_audio_volume, "vol"))
+    console.add_command(Command("buffer", client.get_buffer_stats))
     # Song Controls
-    console.add_command(Command("skip", client.song_skip))
-    console.add_command(Command("prev", client.song_prev))
+    console.add_command(Command("skip", client.song_skip, "next"))
+    console.add_command(Command("prev", client.song_prev, "previous"))
     # Playlist Controls
+    console.add_command(Command("history", client.get_history))
+    console.add_command(Command("cache", client.get_cache_stats))
+    console.add_command(Command("stats", client.get_latency_stats))
+    console.add_command(Command("state", client.get_state))
     console.add_command(StringArgsCommand("queue", client.playlist_queue))
+    console.add_command(StringArgsCommand("import", client.playlist_import))
     console.add_command(Command("start", client.playlist_start))
     console.add_command(Command("stop", client.playlist_stop))
-    console.add_command(Command("clear", client.playlist.clear_all))
+    console.add_command(Command("clear", client.playlist_clear))
     console.add_command(StringArgsCommand("play", client.playlist_play))
     # Playlist Mode Controls
-    console.add_command(Command("shuffle", client.playlist.shuffle_mode))
-    console.add_command(Command("loop", client.playlist.loop_mode))
-    console.add_command(Command("repeat", client.playlist.repeat_mode))
-    console.add_command(Command("normal", client.playlist.no_looping_mode))
+    console.add_command(Command("shuffle", client.playlist_shuffle))
+    console.add_command(IntArgCommand("seed", client.playlist_seed))
+    console.add_command(Command("loop", client.playlist_loop))
+    console.add_command(Command("repeat", client.playlist_repeat))
+    console.add_command(Command("normal", client.playlist_normal))
 
 
 def build_console(client: MusicClient) -> Console:
@@ -191,5 +278,6 @@ def build_console(client: MusicClient) -> Console:
     """
 
     console = Console()
+    console.add_command(Command("commands", console.get_command_stats))
     __build_console_commands(console, client)
     return console
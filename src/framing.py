@@ -0,0 +1,96 @@
+"""Framing of the lines of a byte stream, without copying the bytes around."""
+
+
+class LineFramer:
+    """Receive buffer splitting a byte stream into lines (terminated by '\\n').
+
+    Bytes are received straight into the free space at the end of a growable bytearray,
+    through `get_buffer`, as in an `asyncio.BufferedProtocol`. Only the new bytes are
+    scanned for the last newline, then every complete line is split off in one pass. The
+    bytes of an incomplete line stay in place, until the buffer needs compacting.
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, max_line: int = 64 * 1024):
+        """Creates an empty receive buffer.
+
+        Args:
+            max_line (int, optional): Length in bytes of the longest line that can be
+                received. Defaults to 64 KiB.
+        """
+
+        self.max_line = max_line
+        self._buffer = bytearray(self.READ_SIZE)
+        self._start = 0  # First byte not yet split into a line.
+        self._end = 0  # End of the bytes received.
+
+    def __len__(self) -> int:
+        """Bytes received, of a line not yet complete."""
+
+        return self._end - self._start
+
+    def get_buffer(self, size_hint: int = -1) -> memoryview:
+        """Returns the free space at the end of the buffer, to receive bytes into.
+
+        Moves an incomplete line to the front of the buffer, or into a larger buffer, if
+        less than `READ_SIZE` bytes (or `size_hint` bytes, if larger) are free.
+        """
+
+        size = max(size_hint, self.READ_SIZE)
+        if len(self._buffer) - self._end < size:
+            pending = self._end - self._start
+            buffer = self._buffer
+            if len(buffer) - pending < size:
+                # A new buffer, as the old buffer may still be exported to a memoryview.
+                buffer = bytearray(pending + size)
+            buffer[:pending] = self._buffer[self._start : self._end]
+            self._buffer, self._start, self._end = buffer, 0, pending
+        return memoryview(self._buffer)[self._end :]
+
+    def buffer_updated(self, nbytes: int) -> list[bytes]:
+        """Accounts for `nbytes` received into the buffer from `get_buffer`.
+
+        Raises:
+            ValueError: If an incomplete line is longer than `max_line`.
+
+        Returns:
+            list[bytes]: Every line completed, without their newline characters.
+        """
+
+        scanned, self._end = self._end, self._end + nbytes
+        last = self._buffer.rfind(b"\n", scanned, self._end)
+        if last < 0:
+            if self._end - self._start > self.max_line:
+                raise ValueError(f"Line longer than {self.max_line} bytes")
+            return []
+        with memoryview(self._buffer) as view:
+            lines = bytes(view[self._start : last]).split(b"\n")
+        self._start = last + 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end - self._start > self.max_line:
+            raise ValueError(f"Line longer than {self.max_line} bytes")
+        return lines
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Receives `data`, returning every line completed."""
+
+        lines = []
+        view = memoryview(data)
+        while view:
+            buffer = self.get_buffer(len(view))
+            nbytes = min(len(buffer), len(view))
+            buffer[:nbytes] = view[:nbytes]
+            lines.extend(self.buffer_updated(nbytes))
+            view = view[nbytes:]
+        return lines
+
+
+def encode_lines(messages: list[str]) -> list[bytes]:
+    """Encodes messages into lines, adding the newline of those without one."""
+
+    return [
+        (message if message.endswith("\n") else message + "\n").encode()
+        for message in messages
+    ]
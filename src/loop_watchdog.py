@@ -0,0 +1,93 @@
+"""Watchdog of the event loop, reporting the calls that block it.
+
+A blocked event loop stalls every coroutine, including the heartbeats of the voice
+WebSockets, so the audio of every guild stutters or drops.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+import utils
+from bot.latency import LATENCY
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+class LoopWatchdog:
+    """Measures the lag of the event loop, and logs the stack of calls blocking it.
+
+    A task on the loop wakes every `interval` seconds, recording how late it woke as the
+    `loop_lag` latency stage. With a `threshold`, a thread also checks on the task: if it
+    has not woken `threshold` seconds after it was due, the loop is blocked, and the stack
+    of the loop's thread is logged, once per blocking call.
+    """
+
+    def __init__(self, threshold: float | None = None, interval: float = 0.05):
+        """Creates a watchdog, started on the loop to watch by `start`.
+
+        Args:
+            threshold (float, optional): Seconds of lag past which the stack of the
+                blocking call is logged. Defaults to None, only measuring the lag.
+            interval (float, optional): Seconds between measurements. Defaults to 0.05.
+        """
+
+        self.threshold = threshold
+        self.interval = interval
+        self.lag: float = 0.0  # Last lag measured.
+        self.stalls: int = 0  # Blocking calls reported.
+        self.online = False
+        self._due: float = 0.0  # When the task should next wake.
+        self._thread: threading.Thread = None
+        self._loop_thread_id: int = None
+
+    async def start(self):
+        """|coro| Measures the lag of the running loop, until stopped."""
+
+        self.online = True
+        self._loop_thread_id = threading.get_ident()
+        self._due = time.monotonic() + self.interval
+        if self.threshold is not None:
+            self._thread = threading.Thread(
+                target=self._watch, name="loop-watchdog", daemon=True
+            )
+            self._thread.start()
+
+        while self.online:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(now - self._due, 0.0)
+            LATENCY.record("loop_lag", self.lag)
+            self._due = now + self.interval
+
+    def stop(self):
+        """Stops measuring the lag."""
+
+        self.online = False
+
+    def _watch(self):
+        """|Blocking| Logs the stack of the loop's thread while the loop is blocked."""
+
+        reported = None
+        while self.online:
+            time.sleep(self.interval)
+            due = self._due
+            lag = time.monotonic() - due
+            if lag < self.threshold or due == reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                return  # The loop's thread exited.
+            reported = due
+            self.stalls += 1
+            _log.warning(
+                "Event loop blocked for %.0fms, in:\n%s",
+                lag * 1000,
+                "".join(traceback.format_stack(frame)),
+            )
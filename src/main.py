@@ -13,8 +13,12 @@ import dotenv
 
 import utils
 from bot.music_client import build_client
+from bot.playlist import Playlist
 from companion import CompanionConsole
 from console import Command, build_console
+from loop_watchdog import LoopWatchdog
+from metrics import MetricsServer
+from shards import ShardConsole, ShardSupervisor
 
 
 _log = logging.getLogger(__name__)
@@ -31,8 +35,42 @@ def get_console_input() -> list[str]:
     return instruction.split(" ")
 
 
-def run(token: str, hostname, port: int):
-    """|Blocking| Starts the MusicClient Bot and its console interfaces."""
+def run(
+    token: str,
+    hostname,
+    port: int,
+    history_depth: int = Playlist.DEFAULT_HISTORY_DEPTH,
+    state_dir: str | None = None,
+    extract_processes: int = 0,
+    audio_cache_dir: str | None = None,
+    audio_cache_mb: int = 1024,
+    opus: bool = False,
+    buffer_frames: int = 50,
+    buffer_watermarks: tuple[int, int] | None = None,
+    crossfade: float = 0.0,
+    shards: int = 0,
+    metrics_port: int = 0,
+    watchdog_ms: int = 0,
+):
+    """|Blocking| Starts the MusicClient Bot and its console interfaces.
+
+    If a `state_dir` is given, the playlist of each guild is restored from, and persisted
+    to, a subdirectory of that directory.
+    If `extract_processes` is positive, songs are extracted in that many worker processes.
+    If an `audio_cache_dir` is given, frequently played songs are cached in that directory,
+    up to `audio_cache_mb` megabytes.
+    If `opus`, audio is sent to Discord as Opus from FFMPEG, which applies the volume,
+    passing Opus streams at full volume through.
+    Otherwise `buffer_frames` of audio are read ahead of the audio player, between the
+    `buffer_watermarks`, and consecutive songs play without a gap, or crossfade over
+    `crossfade` seconds.
+    If `shards` is greater than 1, the Bot runs that many shards, each in its own worker
+    process, and the consoles forward commands to the shard of the selected guild.
+    If `metrics_port` is given, Prometheus metrics are served on that port, or on
+    consecutive ports from it, a port per shard.
+    If `watchdog_ms` is given, calls blocking the event loop for longer than that many
+    milliseconds are logged with their stack.
+    """
 
     discord.utils.setup_logging(
         handler=utils.HANDLER,
@@ -40,11 +78,34 @@ def run(token: str, hostname, port: int):
         level=logging.WARNING,
         root=False,
     )
-    client = build_client()
+    client_options = {
+        "history_depth": history_depth,
+        "extract_processes": extract_processes,
+        "audio_cache_dir": audio_cache_dir,
+        "audio_cache_bytes": audio_cache_mb * 1024 * 1024,
+        "opus": opus,
+        "buffer_frames": buffer_frames,
+        "buffer_watermarks": buffer_watermarks,
+        "crossfade": crossfade,
+        "state_dir": state_dir,
+    }
+    if shards > 1:
+        run_sharded(
+            token, hostname, port, shards, client_options, metrics_port, watchdog_ms
+        )
+        return
+
+    client = build_client(**client_options)
     console = build_console(client)
     API = api.APIHandler(client, "__name__")
     _log.info("Opening TCP Socket @ %s/%s", hostname, port)
-    web_console = CompanionConsole(console=console, hostname=hostname, port=port)
+    web_console = CompanionConsole(
+        console=console, hostname=hostname, port=port, events=client.events
+    )
+    watchdog = LoopWatchdog(watchdog_ms / 1000) if watchdog_ms else None
+    metrics = None
+    if metrics_port:
+        metrics = MetricsServer(client, hostname, metrics_port, watchdog, console)
 
     async def shutdown():
         """|coro| Shuts down the Consoles and the Client."""
@@ -54,6 +115,10 @@ def run(token: str, hostname, port: int):
         )
         console.online = False
         web_console.stop()
+        if metrics is not None:
+            metrics.stop()
+        if watchdog is not None:
+            watchdog.stop()
         await client.quit()
         _log.info("BoBo says, 'Tata for now!'.")
 
@@ -71,11 +136,68 @@ def run(token: str, hostname, port: int):
             _log.fatal("Failed while making a login request to Discord.", e.args[0])
             return
 
-        await asyncio.gather(
+        services = [
             client.connect(reconnect=True),
             console.start(get_console_input),
             web_console.start(),
             # API.start(HOSTNAME, API_PORT),    # Disabled for prealpha
+        ]
+        if metrics is not None:
+            services.append(metrics.start())
+        if watchdog is not None:
+            services.append(watchdog.start())
+        await asyncio.gather(*services)
+
+    try:
+        asyncio.run(runner())
+    except KeyboardInterrupt:
+        _log.warning("Received Keyboard Interrupt signal. Service will shutdown.")
+        return
+
+
+def run_sharded(
+    token: str,
+    hostname,
+    port: int,
+    shard_count: int,
+    client_options: dict,
+    metrics_port: int = 0,
+    watchdog_ms: int = 0,
+):
+    """|Blocking| Starts the shards of the MusicClient Bot in worker processes, and the
+    console interfaces forwarding commands to them."""
+
+    supervisor = ShardSupervisor(
+        token,
+        shard_count,
+        client_options,
+        metrics_address=(hostname, metrics_port) if metrics_port else None,
+        watchdog_threshold=watchdog_ms / 1000 if watchdog_ms else None,
+    )
+    console = ShardConsole(supervisor)
+    _log.info("Opening TCP Socket @ %s/%s", hostname, port)
+    web_console = CompanionConsole(console=console, hostname=hostname, port=port)
+
+    async def shutdown():
+        """|coro| Shuts down the Consoles and the shards."""
+
+        _log.debug(
+            "Received shutdown signal. Closing consoles and shutting down shards."
+        )
+        console.online = False
+        web_console.stop()
+        await supervisor.stop()
+        _log.info("BoBo says, 'Tata for now!'.")
+
+    console.add_command(Command("quit", shutdown))
+
+    async def runner():
+        """|coro| Starts the shards, then the consoles."""
+
+        await asyncio.gather(
+            supervisor.start(),
+            console.start(get_console_input),
+            web_console.start(),
         )
 
     try:
@@ -94,11 +216,26 @@ if __name__ == "__main__":
     HOSTNAME = "0.0.0.0"  # Defaults
     PORT = 5000
     API_PORT = 5050
+    HISTORY_DEPTH = Playlist.DEFAULT_HISTORY_DEPTH
+    AUDIO_CACHE_MB = 1024
+    BUFFER_FRAMES = 50
 
     dotenv.load_dotenv()
     bot_token = os.environ.get("DISCORD_BOT_TOKEN", None)
     socket_hostname = os.environ.get("WEBSOCKET_HOSTNAME", HOSTNAME)
     socket_port = os.environ.get("WEBSOCKET_PORT", PORT)
+    history_depth = int(os.environ.get("PLAYLIST_HISTORY_DEPTH", HISTORY_DEPTH))
+    playlist_state_dir = os.environ.get("PLAYLIST_STATE_DIR", None)
+    extract_processes = int(os.environ.get("EXTRACT_PROCESSES", "0"))
+    audio_cache_dir = os.environ.get("AUDIO_CACHE_DIR", None)
+    audio_cache_mb = int(os.environ.get("AUDIO_CACHE_MB", AUDIO_CACHE_MB))
+    opus = os.environ.get("OPUS_PASSTHROUGH", "").casefold() in ("1", "true", "yes")
+    buffer_frames = int(os.environ.get("AUDIO_BUFFER_FRAMES", BUFFER_FRAMES))
+    buffer_watermarks = os.environ.get("AUDIO_BUFFER_WATERMARKS", None)
+    crossfade = float(os.environ.get("CROSSFADE_SECONDS", "0.0"))
+    shards = int(os.environ.get("SHARD_COUNT", "0"))
+    metrics_port = int(os.environ.get("METRICS_PORT", "0"))
+    watchdog_ms = int(os.environ.get("LOOP_WATCHDOG_MS", "0"))
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -126,6 +263,93 @@ if __name__ == "__main__":
         type=int,
         help=f"Set the API PORt to host the API Handler on. Defaults to '{API_PORT}'",
     )
+    parser.add_argument(
+        "-d",
+        "--HISTORY_DEPTH",
+        type=int,
+        help="Set how many recently played songs the playlist remembers. Defaults to"
+        + f" '{HISTORY_DEPTH}'.",
+    )
+    parser.add_argument(
+        "-s",
+        "--STATE_DIR",
+        help="Set a directory to persist the playlist of each guild in, restoring it"
+        + " on startup."
+        + " Disabled by default.",
+    )
+    parser.add_argument(
+        "-e",
+        "--EXTRACT_PROCESSES",
+        type=int,
+        help="Set a number of worker processes to extract songs in, so extraction does"
+        + " not stutter the audio. Defaults to '0', extracting songs on threads.",
+    )
+    parser.add_argument(
+        "-c",
+        "--AUDIO_CACHE_DIR",
+        help="Set a directory to cache the audio of frequently played songs in."
+        + " Disabled by default.",
+    )
+    parser.add_argument(
+        "-m",
+        "--AUDIO_CACHE_MB",
+        type=int,
+        help="Set the maximum size of the audio cache in megabytes. Defaults to"
+        + f" '{AUDIO_CACHE_MB}'.",
+    )
+    parser.add_argument(
+        "-o",
+        "--OPUS",
+        action="store_true",
+        help="Send Opus audio from FFMPEG, which applies the volume, passing Opus"
+        + " streams at full volume through.",
+    )
+    parser.add_argument(
+        "-b",
+        "--BUFFER_FRAMES",
+        type=int,
+        help="Set how many 20ms frames of audio are read ahead of the audio player, to"
+        + f" play smoothly through network hiccups. Defaults to '{BUFFER_FRAMES}', '0'"
+        + " disables the buffer.",
+    )
+    parser.add_argument(
+        "-w",
+        "--BUFFER_WATERMARKS",
+        type=int,
+        nargs=2,
+        metavar=("LOW", "HIGH"),
+        help="Set the frames buffered before playback (re)starts, and the frames the"
+        + " buffer drains to before it is refilled. Defaults to 1/5 and 4/5 of"
+        + " BUFFER_FRAMES.",
+    )
+    parser.add_argument(
+        "-x",
+        "--CROSSFADE",
+        type=float,
+        help="Set how many seconds consecutive songs crossfade over. Defaults to '0',"
+        + " playing songs gaplessly.",
+    )
+    parser.add_argument(
+        "-S",
+        "--SHARDS",
+        type=int,
+        help="Set a number of shards to run the Bot as, each in its own worker process,"
+        + " to serve many guilds across CPU cores. Defaults to '0', running unsharded.",
+    )
+    parser.add_argument(
+        "-M",
+        "--METRICS_PORT",
+        type=int,
+        help="Set a PORT to serve Prometheus metrics on, at `/metrics`. Shards serve"
+        + " on consecutive ports from it. Defaults to '0', disabling metrics.",
+    )
+    parser.add_argument(
+        "-W",
+        "--WATCHDOG_MS",
+        type=int,
+        help="Set a number of milliseconds past which calls blocking the event loop are"
+        + " logged with their stack. Defaults to '0', disabling the watchdog.",
+    )
     args = parser.parse_args()
 
     if args.TOKEN:
@@ -138,9 +362,84 @@ if __name__ == "__main__":
         socket_hostname = args.HOSTNAME
     if args.PORT:
         socket_port = args.PORT
+    if args.HISTORY_DEPTH is not None:
+        history_depth = args.HISTORY_DEPTH
+    if args.STATE_DIR:
+        playlist_state_dir = args.STATE_DIR
+    if args.EXTRACT_PROCESSES is not None:
+        extract_processes = args.EXTRACT_PROCESSES
+    if args.AUDIO_CACHE_DIR:
+        audio_cache_dir = args.AUDIO_CACHE_DIR
+    if args.AUDIO_CACHE_MB is not None:
+        audio_cache_mb = args.AUDIO_CACHE_MB
+    if args.OPUS:
+        opus = True
+    if args.BUFFER_FRAMES is not None:
+        buffer_frames = args.BUFFER_FRAMES
+    if args.BUFFER_WATERMARKS:
+        buffer_watermarks = tuple(args.BUFFER_WATERMARKS)
+    elif buffer_watermarks:
+        try:
+            low_watermark, high_watermark = (
+                int(mark) for mark in buffer_watermarks.split(",")
+            )
+        except ValueError:
+            _log.fatal("`AUDIO_BUFFER_WATERMARKS` must be two integers: `LOW,HIGH`.")
+            sys.exit(2)  # Usage Error.
+        buffer_watermarks = (low_watermark, high_watermark)
+    else:
+        buffer_watermarks = None
+    if args.CROSSFADE is not None:
+        crossfade = args.CROSSFADE
+    if args.SHARDS is not None:
+        shards = args.SHARDS
+    if args.METRICS_PORT is not None:
+        metrics_port = args.METRICS_PORT
+    if args.WATCHDOG_MS is not None:
+        watchdog_ms = args.WATCHDOG_MS
 
     if bot_token is None:
         _log.fatal("Required environment variable `DISCORD_BOT_TOKEN` is missing.")
         sys.exit(5)  # Auth Error.
 
-    run(token=bot_token, hostname=socket_hostname, port=socket_port)
+    if history_depth <= 0:
+        _log.fatal("History depth must be a positive integer.")
+        sys.exit(2)  # Usage Error.
+
+    if buffer_watermarks:
+        low_watermark, high_watermark = buffer_watermarks
+        if low_watermark > high_watermark:
+            _log.fatal("The low buffer watermark must not be above the high one.")
+            sys.exit(2)  # Usage Error.
+        if buffer_frames > 0 and (
+            not 0 < low_watermark <= buffer_frames
+            or not 0 <= high_watermark < buffer_frames
+        ):
+            _log.fatal("Buffer watermarks must be within the buffer's frames.")
+            sys.exit(2)  # Usage Error.
+
+    if crossfade < 0:
+        _log.fatal("Crossfade must not be negative.")
+        sys.exit(2)  # Usage Error.
+
+    if watchdog_ms < 0:
+        _log.fatal("Watchdog threshold must not be negative.")
+        sys.exit(2)  # Usage Error.
+
+    run(
+        token=bot_token,
+        hostname=socket_hostname,
+        port=socket_port,
+        history_depth=history_depth,
+        state_dir=playlist_state_dir,
+        extract_processes=extract_processes,
+        audio_cache_dir=audio_cache_dir,
+        audio_cache_mb=audio_cache_mb,
+        opus=opus,
+        buffer_frames=buffer_frames,
+        buffer_watermarks=buffer_watermarks,
+        crossfade=crossfade,
+        shards=shards,
+        metrics_port=metrics_port,
+        watchdog_ms=watchdog_ms,
+    )
@@ -0,0 +1,240 @@
+"""Prometheus metrics of the Bot, served in the text exposition format.
+
+Metrics are not recorded into a registry of their own. The hot paths only bump plain
+counters (e.g. frames read, cache hits) and the latency histograms of `bot.latency`, which
+are read when the metrics are scraped.
+"""
+
+import asyncio
+import logging
+
+import utils
+from bot.latency import LATENCY, LatencyHistogram
+from bot.music_client import MusicClient
+from bot.yt_source import YTDLSource
+from console import Console
+from loop_watchdog import LoopWatchdog
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(labels: dict) -> str:
+    """Formats the labels of a sample, e.g. `{guild="1"}`."""
+
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+class Exposition:
+    """Builds a scrape's text, a metric family at a time."""
+
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        """Starts a metric family, whose samples follow."""
+
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, labels: dict | None = None):
+        """Adds a sample of the current metric family."""
+
+        self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def histogram(
+        self, name: str, histogram: LatencyHistogram, labels: dict | None = None
+    ):
+        """Adds the cumulative buckets, sum and count of a latency histogram."""
+
+        labels = labels or {}
+        counts = list(histogram.counts)
+        cumulative = 0
+        for bound, count in zip(LatencyHistogram.BOUNDS, counts):
+            cumulative += count
+            self.sample(f"{name}_bucket", cumulative, dict(labels, le=f"{bound:.6g}"))
+        cumulative += counts[-1]
+        self.sample(f"{name}_bucket", cumulative, dict(labels, le="+Inf"))
+        self.sample(f"{name}_sum", histogram.total, labels)
+        self.sample(f"{name}_count", cumulative, labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsServer:
+    """Serves the metrics of a MusicClient over HTTP, on the client's event loop.
+
+    The event loop's lag is read from a `LoopWatchdog`. Without a watchdog of the Bot's,
+    the server runs its own, measuring the lag every `LAG_INTERVAL` seconds.
+    """
+
+    LAG_INTERVAL = 0.5
+
+    def __init__(
+        self,
+        client: MusicClient,
+        hostname: str,
+        port: int,
+        watchdog: LoopWatchdog = None,
+        console: Console = None,
+    ):
+        """Creates a metrics server, started by `start`.
+
+        Args:
+            client (MusicClient): Client to serve the metrics of.
+            hostname (str): Hostname to serve the metrics on.
+            port (int): Port to serve the metrics on, at `/metrics`.
+            watchdog (LoopWatchdog, optional): Watchdog of the client's event loop,
+                started by its owner. Defaults to None, running a watchdog of its own.
+            console (Console, optional): Console to count the calls of each Command of.
+                Defaults to None.
+        """
+
+        self.client = client
+        self.hostname = hostname
+        self.port = port
+        self.server: asyncio.Server = None
+        self.console = console
+        self.owns_watchdog = watchdog is None
+        self.watchdog = watchdog or LoopWatchdog(interval=self.LAG_INTERVAL)
+
+    async def start(self):
+        """|coro| Serves the metrics, until stopped."""
+
+        self.server = await asyncio.start_server(self._handle, self.hostname, self.port)
+        _log.info("Serving metrics @ %s/%s", self.hostname, self.port)
+        services = [self.server.serve_forever()]
+        if self.owns_watchdog:
+            services.append(self.watchdog.start())
+        try:
+            await asyncio.gather(*services)
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        """Stops serving the metrics."""
+
+        if self.owns_watchdog:
+            self.watchdog.stop()
+        if self.server is not None:
+            self.server.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """|coro| Answers an HTTP request, with the metrics if it is for `/metrics`."""
+
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # Headers are not needed.
+            method, path, *_ = request.decode("latin-1").split(" ") + ["", ""]
+            if method in ("GET", "HEAD") and path.split("?")[0] == "/metrics":
+                status, body = "200 OK", self.collect().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            )
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def collect(self) -> str:
+        """Returns the current metrics, in the text exposition format."""
+
+        out = Exposition()
+        sessions = list(self.client.sessions.values())
+
+        out.family(
+            "gm_voice_frames_total",
+            "counter",
+            "Frames of audio sent to voice, per guild.",
+        )
+        for session in sessions:
+            out.sample(
+                "gm_voice_frames_total",
+                session.frames_sent,
+                {"guild": session.guild.id},
+            )
+        out.family(
+            "gm_queue_length", "gauge", "Songs queued in the playlist, per guild."
+        )
+        for session in sessions:
+            out.sample(
+                "gm_queue_length",
+                len(session.playlist.song_queue),
+                {"guild": session.guild.id},
+            )
+        out.family("gm_ffmpeg_processes", "gauge", "FFMPEG processes running.")
+        out.sample("gm_ffmpeg_processes", YTDLSource.ffmpeg_processes())
+
+        info_cache = YTDLSource.info_cache.stats()
+        out.family("gm_info_cache_entries", "gauge", "Songs with cached info.")
+        out.sample("gm_info_cache_entries", info_cache["size"])
+        for name in ("hits", "misses", "evictions", "expirations"):
+            out.family(
+                f"gm_info_cache_{name}_total", "counter", f"Song info cache {name}."
+            )
+            out.sample(f"gm_info_cache_{name}_total", info_cache[name])
+        extractions = YTDLSource.extractions.stats()
+        out.family("gm_extractions_total", "counter", "Song extractions started.")
+        out.sample("gm_extractions_total", extractions["calls"])
+        out.family(
+            "gm_extractions_coalesced_total",
+            "counter",
+            "Song extractions joined to one in flight.",
+        )
+        out.sample("gm_extractions_coalesced_total", extractions["coalesced"])
+        if YTDLSource.audio_cache is not None:
+            audio_cache = YTDLSource.audio_cache.stats()
+            out.family("gm_audio_cache_bytes", "gauge", "Bytes of cached audio.")
+            out.sample("gm_audio_cache_bytes", audio_cache["bytes"])
+            for name in ("hits", "misses"):
+                out.family(
+                    f"gm_audio_cache_{name}_total", "counter", f"Audio cache {name}."
+                )
+                out.sample(f"gm_audio_cache_{name}_total", audio_cache[name])
+
+        out.family("gm_event_loop_lag_seconds", "gauge", "Last lag of the event loop.")
+        out.sample("gm_event_loop_lag_seconds", self.watchdog.lag)
+        out.family(
+            "gm_event_loop_stalls_total",
+            "counter",
+            "Calls that blocked the event loop past the watchdog's threshold.",
+        )
+        out.sample("gm_event_loop_stalls_total", self.watchdog.stalls)
+        out.family("gm_commands_total", "counter", "Console commands handled.")
+        out.sample("gm_commands_total", LATENCY.histogram("command").count)
+        if self.console is not None:
+            out.family(
+                "gm_command_calls_total", "counter", "Calls of each Console command."
+            )
+            for command, calls in self.console.command_stats().items():
+                out.sample("gm_command_calls_total", calls, {"command": command})
+        out.family(
+            "gm_latency_seconds",
+            "histogram",
+            "Latency of each stage of the playback pipeline, see `bot.latency`.",
+        )
+        for stage, histogram in sorted(LATENCY.histograms.items()):
+            out.histogram("gm_latency_seconds", histogram, {"stage": stage})
+        return out.text()
@@ -0,0 +1,483 @@
+"""Sharded deployment of the Bot, across a worker process per shard.
+
+The supervisor process runs the Consoles. Commands are forwarded to the worker process
+of the shard that owns the selected guild, which runs them on its own Console and replies
+with their result, output or error.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+import typing
+
+import discord
+
+import utils
+from bot.music_client import build_client
+from console import Command, Console, IntArgCommand, build_console
+from loop_watchdog import LoopWatchdog
+from metrics import MetricsServer
+
+
+_log = logging.getLogger(__name__)
+_log.addHandler(utils.HANDLER)
+_log.setLevel(logging.INFO)
+
+
+class ShardError(Exception):
+    """Raised when a command forwarded to a shard failed on the shard, or could not be
+    forwarded to it."""
+
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    """Returns the shard that owns a guild, as Discord assigns guilds to shards."""
+
+    return (guild_id >> 22) % shard_count
+
+
+def _run_shard(
+    token: str,
+    shard_id: int,
+    shard_count: int,
+    client_options: dict,
+    commands,
+    events,
+    heartbeat_interval: float,
+    metrics_address: tuple[str, int] | None = None,
+    watchdog_threshold: float | None = None,
+):
+    """|Blocking| Runs a shard of the Bot in a worker process.
+
+    Runs the commands received from the supervisor on the shard's own Console, and sends
+    it heartbeats listing the shard's guilds. Serves the shard's metrics on
+    `metrics_address`, and watches its event loop with a `watchdog_threshold`, if given.
+    """
+
+    discord.utils.setup_logging(
+        handler=utils.HANDLER,
+        formatter=utils.FORMATTER,
+        level=logging.WARNING,
+        root=False,
+    )
+    if client_options.get("audio_cache_dir"):  # The index is not shared between shards.
+        client_options["audio_cache_dir"] = os.path.join(
+            client_options["audio_cache_dir"], f"shard-{shard_id}"
+        )
+    client = build_client(**client_options, shard_id=shard_id, shard_count=shard_count)
+    console = build_console(client)
+    watchdog = LoopWatchdog(watchdog_threshold) if watchdog_threshold else None
+    metrics = None
+    if metrics_address:
+        metrics = MetricsServer(
+            client, *metrics_address, watchdog=watchdog, console=console
+        )
+
+    async def heartbeat():
+        """|coro| Reports the shard is responsive, and its guilds, until it closes."""
+
+        while not client.is_closed():
+            guilds = [(guild.id, guild.name) for guild in client.guilds]
+            events.send(("heartbeat", client.is_ready(), guilds))
+            await asyncio.sleep(heartbeat_interval)
+
+    async def execute(args: list[str]) -> tuple:
+        """|coro| Runs a command on the shard's Console, returning its reply."""
+
+        if not console.supports(args[0]):
+            error = f"Command '{args[0]}' is not supported"
+            return ("UnknownCommandError", error), None, ""
+        try:
+            result, output = await console.execute(args)
+        except Command.UsageError as e:
+            return ("UsageError", str(e)), None, ""
+        except Exception as e:  # noqa: BLE001 - replied to the supervisor as an error.
+            _log.exception("Command %s failed.", args[0].upper())
+            return (type(e).__name__, str(e)), None, ""
+        return None, result, output
+
+    async def serve():
+        """|coro| Runs the supervisor's commands, until it asks the shard to quit."""
+
+        while True:
+            try:
+                kind, guild_id, args, request_id = await asyncio.to_thread(
+                    commands.recv
+                )
+            except EOFError:  # The supervisor exited.
+                kind = "quit"
+            if kind == "quit":
+                if metrics is not None:
+                    metrics.stop()
+                if watchdog is not None:
+                    watchdog.stop()
+                await client.quit()
+                return
+
+            guild = client.get_guild(guild_id) if guild_id is not None else None
+            if guild is not None:
+                client.selected = client.get_session(guild)
+            error, result, output = await execute(args)
+            try:
+                events.send(("reply", request_id, error, result, output))
+            except (pickle.PicklingError, TypeError, AttributeError):
+                events.send(("reply", request_id, error, str(result), output))
+
+    async def runner():
+        """|coro| Logs the shard into Discord then starts coroutine services."""
+
+        await client.login(token)
+        services = [client.connect(reconnect=True), serve(), heartbeat()]
+        if metrics is not None:
+            services.append(metrics.start())
+        if watchdog is not None:
+            services.append(watchdog.start())
+        await asyncio.gather(*services)
+
+    asyncio.run(runner())
+
+
+class ShardProcess:
+    """Worker process running one shard of the Bot, restarted by the supervisor."""
+
+    def __init__(
+        self,
+        token: str,
+        shard_id: int,
+        shard_count: int,
+        client_options: dict,
+        metrics_address: tuple[str, int] | None = None,
+        watchdog_threshold: float | None = None,
+    ):
+        self.token = token
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.client_options = client_options
+        self.metrics_address = metrics_address
+        self.watchdog_threshold = watchdog_threshold
+        self.process: multiprocessing.Process = None
+        self.commands = None
+        self.events = None
+        self.last_heartbeat: float = 0.0
+        self.ready: bool = False
+        self.guilds: list[tuple[int, str]] = []
+        self.restarts: int = 0
+        self._request_ids = itertools.count()
+        self._replies: dict[int, asyncio.Future] = {}  # Awaited, by request id.
+        self._loop: asyncio.AbstractEventLoop = None  # Reading the worker's messages.
+
+    def start(self, heartbeat_interval: float):
+        """Starts the worker process, receiving its messages on the running event loop."""
+
+        context = multiprocessing.get_context("spawn")
+        commands, self.commands = context.Pipe(duplex=False)
+        self.events, events = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_run_shard,
+            args=(
+                self.token,
+                self.shard_id,
+                self.shard_count,
+                dict(self.client_options),
+                commands,
+                events,
+                heartbeat_interval,
+                self.metrics_address,
+                self.watchdog_threshold,
+            ),
+            name=f"shard-{self.shard_id}",
+            daemon=True,
+        )
+        self.process.start()
+        commands.close()
+        events.close()
+        self.last_heartbeat = time.monotonic()
+        self.ready = False
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.events.fileno(), self.poll)
+
+    def poll(self):
+        """Receives the heartbeats and replies the worker sent since the last poll."""
+
+        try:
+            while self.events.poll():
+                self.receive(self.events.recv())
+        except (EOFError, OSError):
+            self._stop_reading()  # The worker exited, found by the health check.
+
+    def receive(self, message: tuple):
+        """Handles a heartbeat or reply of the worker."""
+
+        if message[0] == "heartbeat":
+            _, self.ready, self.guilds = message
+            self.last_heartbeat = time.monotonic()
+            return
+        _, request_id, error, result, output = message
+        reply = self._replies.pop(request_id, None)
+        if reply is not None and not reply.done():
+            reply.set_result((error, result, output))
+
+    async def request(self, guild_id: int, args: list[str]) -> tuple[typing.Any, str]:
+        """|coro| Runs a command on the worker, for a guild.
+
+        Returns:
+            tuple[Any, str]: The result of the command, and its output.
+
+        Raises:
+            Command.UsageError: If the arguments are invalid for the command.
+            ShardError: If the command failed, or the worker is down.
+        """
+
+        request_id = next(self._request_ids)
+        reply = self._replies[request_id] = asyncio.get_running_loop().create_future()
+        if not self.send("command", guild_id, args, request_id):
+            del self._replies[request_id]
+            raise ShardError(f"Shard {self.shard_id} is down")
+        error, result, output = await reply
+        if error is None:
+            return result, output
+        kind, message = error
+        if kind == "UsageError":
+            raise Command.UsageError(message)
+        raise ShardError(f"{kind}: {message}")
+
+    def healthy(self, timeout: float) -> bool:
+        """Whether the worker is alive, and sent a heartbeat within `timeout` seconds."""
+
+        return (
+            self.process.is_alive() and time.monotonic() - self.last_heartbeat < timeout
+        )
+
+    def send(
+        self,
+        kind: str,
+        guild_id: int | None = None,
+        args: list[str] | None = None,
+        request_id: int | None = None,
+    ) -> bool:
+        """Sends a message to the worker, ignored if the worker exited.
+
+        Returns:
+            bool: Whether the message was sent.
+        """
+
+        try:
+            self.commands.send((kind, guild_id, args, request_id))
+        except (BrokenPipeError, OSError):
+            _log.warning("Shard %s is down, its command was dropped.", self.shard_id)
+            return False
+        return True
+
+    def kill(self):
+        """Kills the worker process, failing the commands awaiting its reply."""
+
+        self._stop_reading()
+        self.process.kill()
+        self.process.join()
+        self.commands.close()
+        self.events.close()
+        replies, self._replies = self._replies, {}
+        for reply in replies.values():
+            if not reply.done():
+                reply.set_exception(ShardError(f"Shard {self.shard_id} was restarted"))
+
+    def _stop_reading(self):
+        """Stops receiving the worker's messages on the event loop."""
+
+        if self._loop is not None:
+            self._loop.remove_reader(self.events.fileno())
+            self._loop = None
+
+
+class ShardSupervisor:
+    """Runs the shards of the Bot in worker processes, restarting failed shards.
+
+    Every shard sends a heartbeat each `HEARTBEAT_INTERVAL` seconds. A shard whose process
+    exited, or that sent no heartbeat for `HEARTBEAT_TIMEOUT` seconds (e.g. a blocked event
+    loop), is killed and restarted. Shards are started `IDENTIFY_INTERVAL` seconds apart,
+    as Discord rate limits shards identifying at once.
+    """
+
+    HEARTBEAT_INTERVAL = 5.0
+    HEARTBEAT_TIMEOUT = 30.0
+    IDENTIFY_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        token: str,
+        shard_count: int,
+        client_options: dict,
+        metrics_address: tuple[str, int] | None = None,
+        watchdog_threshold: float | None = None,
+    ):
+        """Creates a supervisor of `shard_count` shards.
+
+        Args:
+            token (str): Bot token to login the shards with.
+            shard_count (int): Number of shards, each run in its own worker process.
+            client_options (dict): Keyword arguments of `build_client` for every shard.
+            metrics_address (tuple[str, int], optional): Hostname and port to serve the
+                metrics of the first shard on, the other shards serving on the ports
+                following it. Defaults to None, serving no metrics.
+            watchdog_threshold (float, optional): Seconds past which calls blocking the
+                event loop of a shard are logged. Defaults to None, not watching.
+        """
+
+        self.shard_count = shard_count
+        self.shards = []
+        for shard_id in range(shard_count):
+            address = None
+            if metrics_address is not None:
+                hostname, port = metrics_address
+                address = (hostname, port + shard_id)
+            self.shards.append(
+                ShardProcess(
+                    token,
+                    shard_id,
+                    shard_count,
+                    client_options,
+                    address,
+                    watchdog_threshold,
+                )
+            )
+        self.selected: int = None  # Guild id.
+        self.online = True
+
+    def shard(self, guild_id: int) -> ShardProcess:
+        """Returns the worker of the shard owning a guild."""
+
+        return self.shards[shard_of(guild_id, self.shard_count)]
+
+    async def start(self):
+        """|coro| Starts the shards, then health checks them until stopped."""
+
+        for shard in self.shards:
+            if not self.online:
+                return
+            shard.start(self.HEARTBEAT_INTERVAL)
+            _log.info("Started shard %s/%s.", shard.shard_id, self.shard_count)
+            await asyncio.sleep(self.IDENTIFY_INTERVAL)
+
+        while self.online:
+            for shard in self.shards:
+                shard.poll()
+                if self.online and not shard.healthy(self.HEARTBEAT_TIMEOUT):
+                    _log.error("Shard %s failed, restarting it.", shard.shard_id)
+                    shard.kill()
+                    shard.restarts += 1
+                    shard.start(self.HEARTBEAT_INTERVAL)
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+
+    async def stop(self, timeout: float = 10.0):
+        """|coro| Asks every shard to quit, killing the shards that do not in time."""
+
+        self.online = False
+        for shard in self.shards:
+            if shard.process is not None:
+                shard.send("quit")
+        for shard in self.shards:
+            if shard.process is not None:
+                await asyncio.to_thread(shard.process.join, timeout)
+                if shard.process.is_alive():
+                    shard.kill()
+
+    # Console Commands
+    def guilds(self) -> list[tuple[int, str]]:
+        """Returns the guilds of every shard, as last reported by their heartbeats."""
+
+        return [guild for shard in self.shards for guild in shard.guilds]
+
+    def get_guilds(self):
+        """Display the guilds of every shard by index, marking the selected guild."""
+
+        _log.info("Retrieving guilds")
+        for index, (guild_id, name) in enumerate(self.guilds()):
+            marker = "*" if guild_id == self.selected else " "
+            print(
+                f"[{index}]{marker} {name} (shard {shard_of(guild_id, self.shard_count)})"
+            )
+
+    def select_guild(self, guild_index: int):
+        """Select the guild whose shard commands are forwarded to, by index."""
+
+        guilds = self.guilds()
+        if not 0 <= guild_index < len(guilds):
+            _log.warning(
+                "Invalid guild index '%s'. Current guilds available: %s.",
+                guild_index,
+                len(guilds),
+            )
+            return
+        self.selected, name = guilds[guild_index]
+        _log.info("Selected '%s'.", name)
+
+    def get_shards(self):
+        """Display the health of every shard."""
+
+        _log.info("Retrieving shards")
+        now = time.monotonic()
+        for shard in self.shards:
+            state = "ready" if shard.ready else "connecting"
+            if shard.process is None or not shard.process.is_alive():
+                state = "down"
+            print(
+                f"[{shard.shard_id}] {state}, {len(shard.guilds)} guilds,"
+                + f" heartbeat {now - shard.last_heartbeat:.1f}s ago,"
+                + f" {shard.restarts} restarts"
+            )
+
+    async def forward(self, args: list[str]) -> tuple[typing.Any, str]:
+        """|coro| Runs a command on the shard owning the selected guild.
+
+        Returns:
+            tuple[Any, str]: The result of the command, and its output.
+
+        Raises:
+            Command.UsageError: If the arguments are invalid for the command.
+            ShardError: If no guild is selected, the command failed, or the shard is down.
+        """
+
+        if self.selected is None:
+            raise ShardError("Select a guild with `guild <index>` to send commands to.")
+        return await self.shard(self.selected).request(self.selected, args)
+
+
+class ShardConsole(Console):
+    """Console that forwards the commands it has no Command for to a shard."""
+
+    def __init__(self, supervisor: ShardSupervisor):
+        super().__init__()
+        self.supervisor = supervisor
+        self.add_command(Command("guilds", supervisor.get_guilds))
+        self.add_command(IntArgCommand("guild", supervisor.select_guild))
+        self.add_command(Command("shards", supervisor.get_shards))
+
+    def supports(self, alias: str) -> bool:
+        return True  # Forwarded to the shard, which may or may not support it.
+
+    async def handle_command(self, args: list[str]):
+        command = self.get_command(args[0])
+        if command is not None:
+            return await command.call(args)
+        try:
+            result, output = await self.supervisor.forward(args)
+        except ShardError as e:
+            _log.warning("%s", e)
+            return None
+        print(output, end="")
+        return result
+
+    async def execute(self, args: list[str]) -> tuple[typing.Any, str]:
+        """Runs a command, forwarding it to a shard if this Console has no Command for it,
+        see `Console.execute`.
+
+        Raises:
+            ShardError: If the forwarded command failed, or could not be forwarded.
+        """
+
+        if self.get_command(args[0]) is not None:
+            return await super().execute(args)
+        return await self.supervisor.forward(args)
@@ -6,7 +6,9 @@ Contains the default logging formatter and handler for the project.
 import asyncio
 import functools
 import logging
+import re
 import typing
+from urllib.parse import parse_qs, urlsplit, urlunsplit
 
 
 FORMATTER = logging.Formatter(
@@ -26,3 +28,43 @@ def to_thread(func: typing.Callable):
         return await asyncio.to_thread(func, *args, **kwargs)
 
     return wrapper
+
+
+_YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com"}
+# Fast path for the common YouTube urls, which avoids the cost of parsing the url.
+_YOUTUBE_URL = re.compile(
+    r"https?://(?:(?:www\.|m\.|music\.)?youtube\.com/watch\?v=|youtu\.be/)"
+    + r"([\w-]+)(?:[&?#]|$)",
+    re.IGNORECASE,
+)
+
+
+def canonical_url(url: str) -> str:
+    """Normalise a song url, so different urls of the same song compare equal.
+
+    YouTube video urls (including `youtu.be` short links) become `youtube:<video id>`.
+    Other urls have their scheme and host lowercased, any `www.` prefix, fragment and
+    trailing slash removed. Strings that are not urls (e.g. search terms) are only stripped.
+    """
+
+    url = url.strip()
+    match = _YOUTUBE_URL.match(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.netloc:
+        return url
+
+    host = parts.netloc.lower().removeprefix("www.")
+    video_id = None
+    if host == "youtu.be":
+        video_id = parts.path.strip("/")
+    elif host in _YOUTUBE_HOSTS and parts.path == "/watch":
+        video_id = parse_qs(parts.query).get("v", [None])[0]
+    if video_id:
+        return f"youtube:{video_id}"
+
+    return urlunsplit(
+        (parts.scheme.lower(), host, parts.path.rstrip("/"), parts.query, "")
+    )
@@ -0,0 +1,93 @@
+"""Measures the throughput of the companion protocols: splitting received bytes into
+lines, and commands answered per second, with companions pipelining commands or waiting
+for each answer before sending the next command.
+
+Run from `src/`: PYTHONPATH=. python ../tests/bench_companion.py
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from companion import CompanionConsole
+from console import Command, Console
+from framing import LineFramer
+
+LINES = 200_000
+COMMANDS = 20_000
+COMPANIONS = 4
+CHUNK = 64 * 1024
+
+
+def bench_framing():
+    data = b"volume 50\n" * LINES
+    chunks = [data[i : i + CHUNK] for i in range(0, len(data), CHUNK)]
+
+    framer = LineFramer()
+    start = time.perf_counter()
+    count = sum(len(framer.feed(chunk)) for chunk in chunks)
+    seconds = time.perf_counter() - start
+    print(f"{'LineFramer':>22}: {count / seconds / 1e6:6.2f}M lines/s")
+
+    async def stream_reader():
+        reader = asyncio.StreamReader(limit=CHUNK)
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        start = time.perf_counter()
+        count = 0
+        while await reader.readline():
+            count += 1
+        return count, time.perf_counter() - start
+
+    count, seconds = asyncio.run(stream_reader())
+    print(f"{'StreamReader.readline':>22}: {count / seconds / 1e6:6.2f}M lines/s")
+
+
+def bench_commands():
+    console = Console()
+    console.add_command(Command("noop", lambda: None))
+    request = json.dumps({"id": 0, "command": "noop"}).encode() + b"\n"
+
+    async def pipelined(reader, writer, line: bytes):
+        writer.write(line * COMMANDS)
+        for _ in range(COMMANDS):
+            await reader.readline()
+
+    async def stop_and_wait(reader, writer, line: bytes):
+        for _ in range(COMMANDS // 10):
+            writer.write(line)
+            await reader.readline()
+
+    async def run(name: str, companion, line: bytes, commands: int):
+        server = CompanionConsole(console, "127.0.0.1", 0)
+        task = asyncio.create_task(server.start())
+        while server.server.server is None:
+            await asyncio.sleep(0)
+        port = server.server.server.sockets[0].getsockname()[1]
+        connections = [
+            await asyncio.open_connection("127.0.0.1", port) for _ in range(COMPANIONS)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*(companion(*c, line) for c in connections))
+        seconds = time.perf_counter() - start
+        for _, writer in connections:
+            writer.close()
+        server.stop()
+        await task
+        print(f"{name:>22}: {commands * COMPANIONS / seconds:8.0f} commands/s")
+
+    async def main():
+        await run("text, pipelined", pipelined, b"noop\n", COMMANDS)
+        await run("text, stop-and-wait", stop_and_wait, b"noop\n", COMMANDS // 10)
+        await run("JSON, pipelined", pipelined, request, COMMANDS)
+        await run("JSON, stop-and-wait", stop_and_wait, request, COMMANDS // 10)
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    bench_framing()
+    bench_commands()
@@ -0,0 +1,37 @@
+"""Compares the cost of scaling a frame with `GainTransformer` and with discord.py's
+`PCMVolumeTransformer`, which needs `audioop` (removed in Python 3.13).
+
+Run from `src/`: PYTHONPATH=. python ../tests/bench_gain.py
+"""
+
+import timeit
+
+import discord
+import numpy as np
+
+from bot.gain import GainTransformer
+
+FRAMES = 50_000  # 1000 seconds of audio.
+
+
+class FakePCM(discord.AudioSource):
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        samples = rng.integers(-20000, 20000, GainTransformer.SAMPLES, dtype=np.int16)
+        self.frame = samples.tobytes()
+
+    def read(self) -> bytes:
+        return self.frame
+
+
+def bench(name: str, source: discord.AudioSource):
+    seconds = timeit.timeit(source.read, number=FRAMES)
+    print(f"{name:>22}: {seconds / FRAMES * 1e6:6.2f}us per 20ms frame")
+
+
+if __name__ == "__main__":
+    bench("GainTransformer", GainTransformer(FakePCM(), volume=0.5))
+    try:
+        bench("PCMVolumeTransformer", discord.PCMVolumeTransformer(FakePCM(), 0.5))
+    except ImportError:
+        print("PCMVolumeTransformer: audioop is not available.")
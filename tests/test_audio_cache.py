@@ -0,0 +1,85 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from bot.audio_cache import AudioCache
+
+
+class TestAudioCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def write(path: str, data: bytes):
+        with open(path, "wb") as file:
+            file.write(data)
+
+    async def download(self, url: str, directory: str):
+        path = os.path.join(directory, f"{url}.webm")
+        await asyncio.to_thread(self.write, path, url.encode() * 10)
+        return path, {"title": url.upper()}
+
+    async def play(self, cache: AudioCache, *urls: str):
+        for url in urls:
+            if cache.lookup(url) is None:
+                cache.record_play(url, url)
+            await asyncio.sleep(0.01)
+
+    def test_cached_after_plays(self):
+        async def run():
+            cache = AudioCache(self.directory.name, 1000, self.download)
+            await self.play(cache, "a")
+            self.assertIsNone(cache.lookup("a"))
+            await self.play(cache, "a")
+            path, title = cache.lookup("a")
+            self.assertEqual(title, "A")
+            self.assertTrue(os.path.exists(path))
+            await cache.close()
+
+        asyncio.run(run())
+        reopened = AudioCache(self.directory.name, 1000, self.download)
+        self.assertIsNotNone(reopened.lookup("a"))
+
+    def test_lru_eviction(self):
+        async def run():
+            cache = AudioCache(self.directory.name, 20, self.download)
+            await self.play(cache, "a", "a", "b", "b")
+            cache.lookup("a")
+            await self.play(cache, "c", "c")
+            self.assertIsNotNone(cache.lookup("a"))
+            self.assertIsNone(cache.lookup("b"))
+            self.assertIsNotNone(cache.lookup("c"))
+            self.assertEqual(cache.size, 20)
+
+        asyncio.run(run())
+
+    def test_failed_download(self):
+        async def download(url: str, directory: str):
+            await self.download(url, directory)  # Leaves a partial file behind.
+            raise RuntimeError("Download failed")
+
+        async def run():
+            cache = AudioCache(self.directory.name, 1000, download, min_plays=1)
+            with self.assertLogs("bot.audio_cache", "ERROR"):
+                await self.play(cache, "a")
+            self.assertIsNone(cache.lookup("a"))
+            self.assertEqual(os.listdir(cache.temp_dir), [])
+            await cache.close()
+
+        asyncio.run(run())
+
+    def test_forgets_least_played(self):
+        async def run():
+            cache = AudioCache(self.directory.name, 1000, self.download, min_plays=3)
+            cache.MAX_TRACKED_PLAYS = 4
+            await self.play(cache, "a", "a", "b", "c", "d", "e")
+            await self.play(cache, "a")
+            self.assertIsNotNone(cache.lookup("a"))
+            await cache.close()
+
+        asyncio.run(run())
@@ -0,0 +1,103 @@
+import unittest
+
+import discord
+
+from bot.channels import ChannelRegistry
+from bot.music_client import MusicClient
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channels=()):
+        self.id = guild_id
+        self.voice_channels = list(channels)
+
+
+class FakeVoiceChannel(discord.VoiceChannel):
+    def __init__(self, channel_id: int, name: str, guild: FakeGuild):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+def build_guild(guild_id: int, *names: str) -> FakeGuild:
+    guild = FakeGuild(guild_id)
+    guild.voice_channels = [
+        FakeVoiceChannel(guild_id * 100 + index, name, guild)
+        for index, name in enumerate(names)
+    ]
+    return guild
+
+
+class TestChannelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ChannelRegistry()
+        self.first = build_guild(1, "General", "Music")
+        self.second = build_guild(2, "Music")
+        self.registry.add_guild(self.first)
+        self.registry.add_guild(self.second)
+
+    def test_lookup(self):
+        self.assertEqual(len(self.registry), 3)
+        self.assertIs(self.registry.get(101), self.first.voice_channels[1])
+        self.assertIsNone(self.registry.get(999))
+        self.assertIs(self.registry.find("general"), self.first.voice_channels[0])
+        self.assertIsNone(self.registry.find("lobby"))
+
+    def test_find_prefers_guild(self):
+        self.assertIs(self.registry.find("music"), self.first.voice_channels[1])
+        self.assertIs(self.registry.find("music", 2), self.second.voice_channels[0])
+
+    def test_readd_guild_keeps_positions(self):
+        before = self.registry.channels()
+        self.registry.add_guild(build_guild(1, "General", "Music"))
+        after = self.registry.channels()
+        self.assertEqual(len(after), 3)
+        self.assertEqual([c.id for c in after], [c.id for c in before])
+
+    def test_rename(self):
+        channel = self.first.voice_channels[0]
+        renamed = FakeVoiceChannel(channel.id, "Lobby", self.first)
+        self.registry.update(channel, renamed)
+        self.assertIsNone(self.registry.find("general"))
+        self.assertIs(self.registry.find("lobby"), renamed)
+        self.assertEqual(self.registry.channels().index(renamed), 0)
+
+    def test_create_and_delete(self):
+        channel = FakeVoiceChannel(102, "Lobby", self.first)
+        self.registry.add(channel)
+        self.assertEqual(self.registry.channels(1)[-1], channel)
+        self.registry.add(object())  # Not a voice channel.
+        self.assertEqual(len(self.registry), 4)
+
+        self.registry.remove(channel)
+        self.assertNotIn(102, self.registry)
+        self.assertIsNone(self.registry.find("lobby"))
+
+    def test_remove_guild(self):
+        self.registry.remove_guild(self.first)
+        self.assertEqual(self.registry.channels(), self.second.voice_channels)
+        self.assertIs(self.registry.find("music", 1), self.second.voice_channels[0])
+
+    def test_at(self):
+        channels = self.registry.channels()
+        for index, channel in enumerate(channels):
+            self.assertIs(self.registry.at(index), channel)
+        self.assertIsNone(self.registry.at(len(channels)))
+        self.assertIsNone(self.registry.at(-1))
+
+    def test_find_channel_prefers_name_over_index(self):
+        client = MusicClient(intents=discord.Intents.default())
+        client.channels = self.registry
+        numbered = FakeVoiceChannel(300, "1", build_guild(3))
+        self.registry.add(numbered)
+        self.assertIs(client.find_channel("1"), numbered)
+        self.assertIs(client.find_channel("0"), self.first.voice_channels[0])
+        self.assertIs(client.find_channel("200"), self.second.voice_channels[0])
+        self.assertIsNone(client.find_channel("9"))
+
+
+if __name__ == "__main__":
+    unittest.main()
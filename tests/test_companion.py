@@ -0,0 +1,164 @@
+import asyncio
+import json
+import unittest
+
+from bot.events import EventBus
+from companion import CompanionConsole
+from console import Command, Console, IntArgCommand
+
+
+class TestCompanionConsole(unittest.TestCase):
+    def setUp(self):
+        self.console = Console()
+        self.called = []
+        self.events = EventBus()
+        self.console.add_command(Command("skip", lambda: self.called.append("skip")))
+
+    def serve(self, scenario, **options):
+        async def main():
+            companion = CompanionConsole(
+                self.console, "127.0.0.1", 0, self.events, **options
+            )
+            task = asyncio.create_task(companion.start())
+            while companion.server.server is None:
+                await asyncio.sleep(0)
+            port = companion.server.server.sockets[0].getsockname()[1]
+            try:
+                await scenario(lambda: asyncio.open_connection("127.0.0.1", port))
+            finally:
+                companion.stop()
+                await task
+
+        asyncio.run(main())
+
+    def test_many_companions(self):
+        async def scenario(connect):
+            first, second = await connect(), await connect()
+            for reader, writer in (first, second):
+                writer.write(b"skip\n")
+            for reader, writer in (first, second):
+                self.assertEqual(await reader.readline(), b"200/OK\n")
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.called, ["skip", "skip"])
+            for _, writer in (first, second):
+                writer.close()
+
+        self.serve(scenario)
+
+    def test_connection_limit(self):
+        async def scenario(connect):
+            _, first = await connect()
+            reader, second = await connect()
+            self.assertEqual(await reader.readline(), b"503/BUSY\n")
+            self.assertEqual(await reader.read(), b"")
+            first.close()
+            second.close()
+
+        self.serve(scenario, max_connections=1)
+
+    def test_idle_timeout(self):
+        async def scenario(connect):
+            reader, writer = await connect()
+            self.assertEqual(await asyncio.wait_for(reader.read(), 1), b"")
+            writer.close()
+
+        self.serve(scenario, idle_timeout=0.05)
+
+    def test_pipelined_requests(self):
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "slow"
+
+        def listing():
+            print("a")
+            return 2
+
+        self.console.add_command(Command("slow", slow))
+        self.console.add_command(Command("list", listing))
+        self.console.add_command(IntArgCommand("volume", lambda volume: volume))
+
+        async def scenario(connect):
+            reader, writer = await connect()
+            requests = [
+                {"id": 1, "command": "slow"},
+                {"id": 2, "command": "LIST", "v": 2},
+                {"id": 3, "command": "volume", "args": ["loud"]},
+                {"id": 4, "command": "dance"},
+                {"id": 5, "command": "list", "v": 1},
+            ]
+            writer.write(b"".join(json.dumps(r).encode() + b"\n" for r in requests))
+            writer.write(b"{oops\n")
+            responses = [json.loads(await reader.readline()) for _ in range(5)]
+            release.set()
+            responses.append(json.loads(await reader.readline()))
+            writer.close()
+
+            by_id = {response["id"]: response for response in responses}
+            self.assertEqual([response["id"] for response in responses][-1], 1)
+            self.assertEqual(by_id[1]["result"], "slow")
+            self.assertEqual(
+                by_id[2], {"v": 2, "id": 2, "ok": True, "result": 2, "output": "a\n"}
+            )
+            self.assertEqual(by_id[3]["error"]["type"], "UsageError")
+            self.assertEqual(by_id[4]["error"]["type"], "UnknownCommandError")
+            self.assertEqual(by_id[5]["error"]["type"], "ProtocolError")
+            self.assertEqual(by_id[None]["error"]["type"], "ProtocolError")
+
+        self.serve(scenario)
+
+    def test_subscribe(self):
+        async def scenario(connect):
+            reader, writer = await connect()
+            writer.write(
+                b'{"id": 1, "command": "subscribe", "args": ["coalesce", 2]}\n'
+            )
+            response = json.loads(await reader.readline())
+            self.assertEqual(
+                response["result"], {"policy": "coalesce", "maxsize": 2, "seq": 0}
+            )
+
+            for volume in (10, 20):
+                self.events.publish("volume", 1, volume=volume)
+            self.events.publish("track_start", 1, title="a", url="u")
+            event = json.loads(await reader.readline())
+            self.assertEqual(event["event"]["volume"], 20)
+            event = json.loads(await reader.readline())
+            self.assertEqual(event["event"]["title"], "a")
+
+            for guild in (1, 2, 3):
+                self.events.publish("volume", guild, volume=50)
+            lines = [json.loads(await reader.readline()) for _ in range(3)]
+            self.assertEqual(lines[0]["event"], {"type": "dropped", "count": 1})
+            self.assertEqual([line["event"]["guild"] for line in lines[1:]], [2, 3])
+
+            writer.write(b'{"id": 2, "command": "unsubscribe"}\n')
+            response = json.loads(await reader.readline())
+            self.assertEqual(response["result"], {"subscribed": True, "dropped": 1})
+            self.assertFalse(self.events.subscriptions)
+
+            writer.write(b'{"id": 3, "command": "subscribe", "args": ["block"]}\n')
+            response = json.loads(await reader.readline())
+            self.assertEqual(response["error"]["type"], "UsageError")
+            writer.write(b'{"id": 4, "command": "subscribe"}\n')
+            await reader.readline()
+            writer.close()
+            await asyncio.sleep(0.01)
+            self.assertFalse(self.events.subscriptions)
+
+        self.serve(scenario)
+
+    def test_hello(self):
+        async def scenario(connect):
+            reader, writer = await connect()
+            writer.write(b'{"id": "h", "command": "hello"}\n')
+            response = json.loads(await reader.readline())
+            writer.close()
+            self.assertEqual(response["result"], {"protocol": 2, "commands": ["skip"]})
+
+        self.serve(scenario)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from console import Command, Console, IntArgCommand, StringArgsCommand
+
+
+class TestConsole(unittest.TestCase):
+
+    def setUp(self):
+        self.console = Console()
+        self.called = []
+
+    def handle(self, line: str):
+        asyncio.run(self.console.handle_command(line.split(" ")))
+
+    def test_aliases(self):
+        self.console.add_command(
+            Command("skip", lambda: self.called.append("skip"), "Next")
+        )
+        self.handle("SKIP")
+        self.handle("next")
+        self.assertEqual(self.called, ["skip", "skip"])
+        self.assertEqual(self.console.command_stats(), {"skip": 2})
+
+    def test_duplicate_alias(self):
+        first = Command("skip", lambda: None)
+        self.console.add_command(first)
+        with self.assertLogs("console", level="WARNING"):
+            self.console.add_command(Command("next", lambda: None, "Skip"))
+        self.assertIs(self.console.get_command("skip"), first)
+        self.assertIsNone(self.console.get_command("next"))
+
+    def test_arguments(self):
+        async def queue(urls):
+            self.called.append(urls)
+
+        self.console.add_command(StringArgsCommand("queue", queue))
+        self.console.add_command(IntArgCommand("volume", self.called.append))
+        self.handle("queue a b")
+        self.handle("volume 50")
+        self.assertEqual(self.called, [["a", "b"], 50])
+
+    def test_usage_errors(self):
+        command = IntArgCommand("volume", self.called.append)
+        self.console.add_command(command)
+        with self.assertRaises(Command.UsageError):
+            self.handle("volume loud")
+        with self.assertRaises(Command.UsageError):
+            self.handle("volume")
+        self.assertEqual(command.calls, 0)
+
+    def test_unsupported(self):
+        with self.assertLogs("console", level="WARNING"):
+            self.handle("dance")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from bot.events import EventBus, Subscription
+
+
+class TestEventBus(unittest.TestCase):
+    def setUp(self):
+        self.bus = EventBus()
+
+    def test_publish_without_subscribers(self):
+        self.bus.publish("volume", 1, volume=50)
+        self.assertEqual(self.bus.seq, 0)
+
+    def test_drop_oldest(self):
+        subscription = self.bus.subscribe(2, Subscription.DROP_OLDEST)
+        for volume in (10, 20, 30):
+            self.bus.publish("volume", 1, volume=volume)
+        events = subscription.get_nowait()
+        self.assertEqual([event["volume"] for event in events], [20, 30])
+        self.assertEqual([event["seq"] for event in events], [2, 3])
+        self.assertEqual(subscription.dropped, 1)
+
+    def test_coalesce(self):
+        subscription = self.bus.subscribe()
+        self.bus.publish("volume", 1, volume=10)
+        self.bus.publish("queue", 1, mutation="add", length=1)
+        self.bus.publish("volume", 2, volume=70)
+        self.bus.publish("volume", 1, volume=20)
+        events = subscription.get_nowait()
+        self.assertEqual(
+            [(event["type"], event["guild"]) for event in events],
+            [("queue", 1), ("volume", 2), ("volume", 1)],
+        )
+        self.assertEqual(
+            events[-1], {"type": "volume", "guild": 1, "seq": 4, "volume": 20}
+        )
+        self.assertEqual((subscription.coalesced, subscription.dropped), (1, 0))
+
+    def test_coalesce_full(self):
+        subscription = self.bus.subscribe(1)
+        self.bus.publish("volume", 1, volume=10)
+        self.bus.publish("volume", 1, volume=20)
+        self.bus.publish("queue", 1, mutation="add", length=1)
+        self.assertEqual(
+            [event["type"] for event in subscription.get_nowait()], ["queue"]
+        )
+        self.assertEqual(subscription.dropped, 1)
+
+    def test_invalid_subscription(self):
+        with self.assertRaises(ValueError):
+            self.bus.subscribe(policy="block")
+        with self.assertRaises(ValueError):
+            self.bus.subscribe(0)
+        self.assertFalse(self.bus.subscriptions)
+
+    def test_get_waits_until_published_or_closed(self):
+        async def main():
+            subscription = self.bus.subscribe()
+            waiting = asyncio.create_task(subscription.get())
+            await asyncio.sleep(0)
+            self.bus.publish("voice", 1, channel="music", channel_id=2)
+            self.assertEqual((await waiting)[0]["channel"], "music")
+
+            waiting = asyncio.create_task(subscription.get())
+            await asyncio.sleep(0)
+            subscription.close()
+            self.assertEqual(await waiting, [])
+            self.assertFalse(self.bus.subscriptions)
+
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+
+from bot.extractor import ExtractionError, ProcessPoolExtractor
+
+
+def _init_stub(ytdl_options: dict):
+    pass
+
+
+def _extract_stub(url: str, download: bool) -> dict:
+    """Extracts in a way chosen by the url: `sleep:<seconds>`, `crash` or `fail`."""
+
+    if url.startswith("sleep:"):
+        time.sleep(float(url.split(":")[1].partition("?")[0]))
+    elif url == "crash":
+        os._exit(1)
+    elif url == "fail":
+        raise ValueError("Unsupported URL")
+    return {"url": url, "pid": os.getpid()}
+
+
+class StubExtractor(ProcessPoolExtractor):
+    worker_initializer = staticmethod(_init_stub)
+    worker_function = staticmethod(_extract_stub)
+
+
+class TestProcessPoolExtractor(unittest.TestCase):
+
+    def run_extractor(self, scenario, **options):
+        extractor = StubExtractor({}, **options)
+        extractor.warm()
+        try:
+            asyncio.run(scenario(extractor))
+        finally:
+            extractor.close()
+        return extractor
+
+    def test_extract(self):
+        async def scenario(extractor):
+            info = await extractor.extract("a")
+            self.assertEqual(info["url"], "a")
+            self.assertNotEqual(info["pid"], os.getpid())
+            with self.assertRaises(ValueError):
+                await extractor.extract("fail")
+            self.assertEqual((await extractor.extract("b"))["pid"], info["pid"])
+
+        extractor = self.run_extractor(scenario, max_workers=1)
+        self.assertEqual(extractor.restarts, 0)
+
+    def test_waiting_for_a_worker_is_not_timed(self):
+        async def scenario(extractor):
+            infos = await asyncio.gather(
+                *(extractor.extract(f"sleep:0.2?{i}") for i in range(3))
+            )
+            self.assertEqual(len({info["pid"] for info in infos}), 1)
+
+        extractor = self.run_extractor(scenario, max_workers=1, timeout=0.5)
+        self.assertEqual(extractor.restarts, 0)
+
+    def test_hung_worker_is_killed_alone(self):
+        async def scenario(extractor):
+            with self.assertLogs("bot.extractor", "WARNING"):
+                hung, other = await asyncio.gather(
+                    extractor.extract("sleep:10"),
+                    extractor.extract("sleep:0.2"),
+                    return_exceptions=True,
+                )
+            self.assertIsInstance(hung, ExtractionError)
+            self.assertEqual(other["url"], "sleep:0.2")
+            self.assertEqual(len(extractor._workers), 1)
+            self.assertEqual((await extractor.extract("a"))["url"], "a")
+
+        extractor = self.run_extractor(scenario, max_workers=2, timeout=0.5)
+        self.assertEqual(extractor.restarts, 1)
+
+    def test_crashed_worker_is_replaced(self):
+        async def scenario(extractor):
+            with (
+                self.assertLogs("bot.extractor", "WARNING"),
+                self.assertRaises(ExtractionError),
+            ):
+                await extractor.extract("crash")
+            self.assertEqual((await extractor.extract("a"))["url"], "a")
+
+        extractor = self.run_extractor(scenario, max_workers=1)
+        self.assertEqual(extractor.restarts, 1)
+
+    def test_cancelled_while_spawning(self):
+        extractor = StubExtractor({}, max_workers=1)
+        spawn = extractor._spawn
+        spawned = []
+
+        def slow_spawn():
+            time.sleep(0.2)
+            spawned.append(spawn())
+            return spawned[-1]
+
+        async def scenario():
+            task = asyncio.create_task(extractor.extract("a"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            while not spawned:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+
+        try:
+            with (
+                mock.patch.object(extractor, "_spawn", slow_spawn),
+                self.assertLogs("bot.extractor", "WARNING"),
+            ):
+                asyncio.run(scenario())
+            self.assertEqual(extractor._workers, set())
+            self.assertEqual(extractor._idle, [])
+            spawned[0].process.join(5)
+            self.assertFalse(spawned[0].process.is_alive())
+        finally:
+            extractor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
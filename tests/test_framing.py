@@ -0,0 +1,51 @@
+import unittest
+
+from framing import LineFramer, encode_lines
+
+
+class TestLineFramer(unittest.TestCase):
+
+    def test_lines_across_chunks(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"skip\nvol"), [b"skip"])
+        self.assertEqual(len(framer), 3)
+        self.assertEqual(framer.feed(b"ume 50\nqueue a\n"), [b"volume 50", b"queue a"])
+        self.assertEqual(len(framer), 0)
+        self.assertEqual(framer.feed(b"\n"), [b""])
+
+    def test_receives_into_buffer(self):
+        framer = LineFramer()
+        buffer = framer.get_buffer(-1)
+        buffer[:11] = b"skip\npause\n"
+        self.assertEqual(framer.buffer_updated(11), [b"skip", b"pause"])
+
+    def test_grows_for_long_lines(self):
+        framer = LineFramer(max_line=1024 * 1024)
+        line = b"x" * (3 * LineFramer.READ_SIZE)
+        lines = []
+        for start in range(0, len(line), 1000):
+            lines += framer.feed(line[start : start + 1000])
+        self.assertEqual(lines, [])
+        self.assertEqual(framer.feed(b"\nnext"), [line])
+        self.assertEqual(framer.feed(b"\n"), [b"next"])
+
+    def test_compacts_incomplete_line(self):
+        framer = LineFramer()
+        chunk = b"a\n" * (LineFramer.READ_SIZE // 2 - 1) + b"b"
+        self.assertEqual(len(framer.feed(chunk)), LineFramer.READ_SIZE // 2 - 1)
+        self.assertEqual(framer.feed(b"c\n"), [b"bc"])
+
+    def test_line_too_long(self):
+        framer = LineFramer(max_line=8)
+        with self.assertRaises(ValueError):
+            framer.feed(b"123456789")
+        framer = LineFramer(max_line=8)
+        with self.assertRaises(ValueError):
+            framer.feed(b"1\n123456789")
+
+    def test_encode_lines(self):
+        self.assertEqual(encode_lines(["200/OK", "a\n"]), [b"200/OK\n", b"a\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
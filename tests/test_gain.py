@@ -0,0 +1,69 @@
+import unittest
+
+import discord
+import numpy as np
+
+from bot.gain import GainTransformer
+
+
+class FakePCM(discord.AudioSource):
+    """Plays the same frame forever."""
+
+    def __init__(self, frame: bytes):
+        self.frame = frame
+
+    def read(self) -> bytes:
+        return self.frame
+
+
+def frame_of(value: int) -> bytes:
+    return np.full(GainTransformer.SAMPLES, value, dtype=np.int16).tobytes()
+
+
+def samples(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.int16)
+
+
+class TestGainTransformer(unittest.TestCase):
+
+    def test_unity_passthrough(self):
+        frame = frame_of(1000)
+        source = GainTransformer(FakePCM(frame))
+        self.assertIs(source.read(), frame)
+
+    def test_scales(self):
+        source = GainTransformer(FakePCM(frame_of(1000)), volume=0.5)
+        self.assertTrue((samples(source.read()) == 500).all())
+
+    def test_clips(self):
+        source = GainTransformer(FakePCM(frame_of(30000)), volume=2.0)
+        self.assertTrue((samples(source.read()) == 32767).all())
+        source = GainTransformer(FakePCM(frame_of(-30000)), volume=2.0)
+        self.assertTrue((samples(source.read()) == -32768).all())
+
+    def test_ramp(self):
+        source = GainTransformer(FakePCM(frame_of(1000)))
+        source.volume = 0.5
+        self.assertEqual(source.volume, 0.5)
+
+        first = samples(source.read())
+        self.assertEqual(first[0], 1000)  # Continues from the previous gain.
+        self.assertEqual(first[-1], 900)
+        self.assertTrue((np.diff(first) <= 0).all())
+
+        for _ in range(GainTransformer.ramp_frames - 1):
+            ramped = samples(source.read())
+        self.assertEqual(ramped[-1], 500)
+        self.assertTrue((samples(source.read()) == 500).all())
+
+    def test_rejects_opus(self):
+        class FakeOpus(FakePCM):
+            def is_opus(self) -> bool:
+                return True
+
+        with self.assertRaises(discord.ClientException):
+            GainTransformer(FakeOpus(b""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from bot.history import PlayHistory
+
+
+class TestPlayHistory(unittest.TestCase):
+
+    def test_bounded(self):
+        history = PlayHistory(3)
+        for url in "abcde":
+            history.append(url)
+
+        self.assertEqual(len(history), 3)
+        self.assertEqual(list(history), ["c", "d", "e"])
+        self.assertEqual(history[0], "c")
+        self.assertEqual(history[-1], "e")
+
+    def test_pop(self):
+        history = PlayHistory(2)
+        history.append("a")
+        history.append("b")
+        history.append("c")
+
+        self.assertEqual(history.pop(), "c")
+        history.append("d")
+        self.assertEqual(list(history), ["b", "d"])
+        self.assertEqual(history.pop(), "d")
+        self.assertEqual(history.pop(), "b")
+        with self.assertRaises(IndexError):
+            history.pop()
@@ -0,0 +1,37 @@
+import unittest
+
+from bot.info_cache import InfoCache
+
+
+class TestInfoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = InfoCache(2, default_ttl=100, margin=10, clock=lambda: self.now)
+
+    def test_lru(self):
+        self.cache.put("a", {"url": "a"})
+        self.cache.put("b", {"url": "b"})
+        self.cache.get("a")
+        self.cache.put("c", {"url": "c"})
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_signed_expiry(self):
+        url = "https://rr1.googlevideo.com/videoplayback?expire=1500&id=x"
+        self.cache.put("a", {"url": url, "duration": 200})
+
+        self.now = 1289.0
+        self.assertIsNotNone(self.cache.get("a"))
+        self.now = 1290.0  # 1500 - 200 duration - 10 margin
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.expirations, 1)
+
+    def test_expired_not_cached(self):
+        url = "https://rr1.googlevideo.com/videoplayback/expire/1100/id/x"
+        self.cache.put("a", {"url": url, "duration": 200})
+        self.assertEqual(len(self.cache), 0)
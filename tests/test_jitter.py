@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+import discord
+
+from bot.jitter import JitterBuffer
+
+
+class FakePCM(discord.AudioSource):
+    """Plays numbered frames, stalling before the frames in `stalls` until released."""
+
+    def __init__(self, count: int, stalls=()):
+        self.frames = [bytes([index]) * 3840 for index in range(1, count + 1)]
+        self.stalls = set(stalls)
+        self.release = threading.Event()
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        if not self.frames:
+            return b""
+        if len(self.frames) in self.stalls:
+            self.release.wait()
+        return self.frames.pop(0)
+
+    def cleanup(self):
+        self.cleaned_up = True
+        self.release.set()
+
+
+def wait_for_level(buffer: JitterBuffer, level: int):
+    deadline = time.monotonic() + 1
+    while buffer.level < level and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+class TestJitterBuffer(unittest.TestCase):
+
+    def test_plays_every_frame(self):
+        source = FakePCM(100)
+        buffer = JitterBuffer(source, depth=8, low_watermark=2, high_watermark=4)
+        played = []
+        while frame := buffer.read():
+            if frame != bytes(3840):
+                played.append(frame[0])
+        self.assertEqual(played, list(range(1, 101)))
+        self.assertEqual(buffer.frames, 100)
+
+    def test_prebuffers_to_low_watermark(self):
+        source = FakePCM(10, stalls=[7])  # Stalls after 3 frames.
+        buffer = JitterBuffer(source, depth=8, low_watermark=4, high_watermark=4)
+        wait_for_level(buffer, 3)
+        self.assertEqual(buffer.read(), bytes(3840))
+        self.assertEqual(buffer.underruns, 0)
+
+        source.release.set()
+        wait_for_level(buffer, 4)
+        self.assertEqual(buffer.read()[0], 1)
+
+    def test_underrun(self):
+        source = FakePCM(10, stalls=[6])  # Stalls after 4 frames.
+        buffer = JitterBuffer(source, depth=8, low_watermark=2, high_watermark=4)
+        wait_for_level(buffer, 4)
+        self.assertEqual([buffer.read()[0] for _ in range(4)], [1, 2, 3, 4])
+
+        self.assertEqual(buffer.read(), bytes(3840))
+        self.assertEqual(buffer.underruns, 1)
+        self.assertEqual(buffer.read(), bytes(3840))  # Rebuffering, not another underrun.
+        self.assertEqual(buffer.underruns, 1)
+
+        source.release.set()
+        wait_for_level(buffer, 2)
+        self.assertEqual(buffer.read()[0], 5)
+
+    def test_ends_after_draining(self):
+        source = FakePCM(3)
+        buffer = JitterBuffer(source, depth=8, low_watermark=4, high_watermark=4)
+        buffer._reader.join(1)
+        self.assertEqual([buffer.read()[0] for _ in range(3)], [1, 2, 3])
+        self.assertEqual(buffer.read(), b"")
+        self.assertEqual(buffer.underruns, 0)
+
+    def test_cleanup(self):
+        source = FakePCM(10, stalls=[10])
+        buffer = JitterBuffer(source, depth=8, low_watermark=2, high_watermark=4)
+        buffer.cleanup()
+        buffer._reader.join(1)
+        self.assertTrue(source.cleaned_up)
+        self.assertFalse(buffer._reader.is_alive())
+
+    def test_invalid_watermarks(self):
+        source = FakePCM(1)
+        with self.assertRaises(ValueError):
+            JitterBuffer(source, depth=8, low_watermark=9, high_watermark=4)
+        self.assertTrue(source.cleaned_up)
+        with self.assertRaises(ValueError):
+            JitterBuffer(FakePCM(1), depth=8, low_watermark=2, high_watermark=8)
+
+
+if __name__ == "__main__":
+    unittest.main()
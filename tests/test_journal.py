@@ -0,0 +1,87 @@
+import asyncio
+import tempfile
+import unittest
+
+from bot.journal import PlaylistJournal
+from bot.playlist import Playlist
+
+
+class TestPlaylistJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def restored(self) -> Playlist:
+        playlist = Playlist()
+        PlaylistJournal(self.directory.name).restore(playlist)
+        return playlist
+
+    def test_replay(self):
+        journal = PlaylistJournal(self.directory.name)
+        playlist = Playlist(seed=1)
+        journal.attach(playlist)
+        for url in "abcdef":
+            playlist.add(url)
+        playlist.shuffle_mode()
+        playlist.loop_mode()
+        playlist.next()
+        playlist.next()
+        playlist.add(playlist.prev(), index=0)
+        asyncio.run(journal.flush())
+
+        restored = self.restored()
+        self.assertEqual(restored.snapshot(), playlist.snapshot())
+        self.assertEqual(restored.next(), playlist.next())
+
+    def test_replay_after_snapshot(self):
+        journal = PlaylistJournal(self.directory.name)
+        playlist = Playlist(seed=2)
+        journal.attach(playlist)
+        for url in "abcd":
+            playlist.add(url)
+        asyncio.run(journal.flush())  # Writes the snapshot the journal starts from.
+        playlist.shuffle_mode()
+        playlist.next()
+        playlist.add("e", index=1)
+        playlist.loop_mode()
+        asyncio.run(journal.flush())
+
+        restored = Playlist()
+        self.assertEqual(PlaylistJournal(self.directory.name).restore(restored), 4)
+        self.assertEqual(restored.snapshot(), playlist.snapshot())
+        self.assertEqual(restored.next(), playlist.next())
+
+    def test_peek_recorded_once(self):
+        journal = PlaylistJournal(self.directory.name)
+        playlist = Playlist(seed=3)
+        journal.attach(playlist)
+        for url in "abcdef":
+            playlist.add(url)
+        playlist.shuffle_mode()
+        recorded = len(journal._pending)
+        peeked = playlist.upcoming(3)
+        self.assertEqual(playlist.upcoming(3), peeked)
+        self.assertEqual(playlist.upcoming(2), peeked[:2])
+        self.assertEqual(len(journal._pending), recorded + 1)  # Only the draw.
+        asyncio.run(journal.flush())
+
+        restored = self.restored()
+        self.assertEqual(restored.snapshot(), playlist.snapshot())
+        self.assertEqual(restored.next(), playlist.next())
+
+    def test_compaction(self):
+        journal = PlaylistJournal(self.directory.name, compact_every=3)
+        playlist = Playlist()
+        journal.attach(playlist)
+        for url in "abcd":
+            playlist.add(url)
+        asyncio.run(journal.flush())
+        playlist.next()
+        asyncio.run(journal.flush())
+
+        with open(journal.journal_path, encoding="utf-8") as file:
+            self.assertEqual(len(file.readlines()), 1)
+        self.assertEqual(self.restored().snapshot(), playlist.snapshot())
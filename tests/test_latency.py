@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+
+from bot.jitter import JitterBuffer
+from bot.latency import FirstFrameTimer, LatencyHistogram, LatencyRecorder
+
+
+class FakeSource:
+    def read(self) -> bytes:
+        return b"\x00"
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        pass
+
+
+class BlockedSource(FakeSource):
+    """Source whose frames are only read once `unblocked` is set."""
+
+    def __init__(self):
+        self.unblocked = threading.Event()
+
+    def read(self) -> bytes:
+        self.unblocked.wait()
+        return super().read()
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        stats = histogram.stats()
+        self.assertEqual(stats["count"], 1000)
+        self.assertAlmostEqual(stats["mean"], 0.5005)
+        self.assertEqual(stats["max"], 1.0)
+        # Estimates are accurate to within a bucket.
+        self.assertAlmostEqual(stats["p50"], 0.5, delta=0.5 * 0.42)
+        self.assertAlmostEqual(stats["p95"], 0.95, delta=0.95 * 0.42)
+        self.assertLessEqual(stats["p99"], stats["max"])
+        self.assertLessEqual(stats["p50"], stats["p95"])
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().percentile(99), 0.0)
+
+    def test_overflow(self):
+        histogram = LatencyHistogram()
+        histogram.record(100.0)
+        self.assertGreater(histogram.percentile(50), LatencyHistogram.BOUNDS[-1])
+        self.assertEqual(histogram.percentile(100), 100.0)
+
+
+class TestLatencyRecorder(unittest.TestCase):
+
+    def test_time(self):
+        recorder = LatencyRecorder()
+        with self.assertRaises(ValueError), recorder.time("stage"):
+            raise ValueError()
+        self.assertEqual(recorder.histogram("stage").count, 1)
+        self.assertTrue(recorder.report()[0].startswith("stage: n=1 mean="))
+
+    def test_first_frame(self):
+        recorder = LatencyRecorder()
+        timer = FirstFrameTimer(FakeSource(), recorder=recorder)
+        self.assertEqual(timer.read(), b"\x00")
+        timer.read()
+        self.assertEqual(recorder.histogram("first_frame").count, 1)
+        self.assertNotIn("time_to_first_audio", recorder.histograms)
+
+        timer = FirstFrameTimer(FakeSource(), requested_at=0.0, recorder=recorder)
+        timer.read()
+        self.assertEqual(recorder.histogram("time_to_first_audio").count, 1)
+
+    def test_first_frame_after_prebuffering(self):
+        recorder = LatencyRecorder()
+        source = BlockedSource()
+        buffer = JitterBuffer(source, depth=4, low_watermark=2, high_watermark=2)
+        timer = FirstFrameTimer(buffer, requested_at=0.0, recorder=recorder)
+        self.assertNotEqual(timer.read(), b"\x00")  # Silence while buffering.
+        self.assertNotIn("first_frame", recorder.histograms)
+
+        source.unblocked.set()
+        while buffer.level < 2:
+            time.sleep(0.001)
+        self.assertEqual(timer.read(), b"\x00")
+        self.assertEqual(recorder.histogram("first_frame").count, 1)
+        self.assertEqual(recorder.histogram("time_to_first_audio").count, 1)
+        timer.cleanup()
+
+    def test_restart(self):
+        recorder = LatencyRecorder()
+        timer = FirstFrameTimer(FakeSource(), recorder=recorder)
+        timer.read()
+        timer.restart()  # e.g. the mixer advanced to its next song.
+        timer.read()
+        timer.read()
+        self.assertEqual(recorder.histogram("first_frame").count, 2)
+        self.assertEqual(recorder.histogram("time_to_first_audio").count, 1)
+        self.assertEqual(timer.frames, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
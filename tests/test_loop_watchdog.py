@@ -0,0 +1,47 @@
+import asyncio
+import time
+import unittest
+
+from bot.latency import LATENCY
+from loop_watchdog import LoopWatchdog
+
+
+def block_the_loop():
+    time.sleep(0.2)
+
+
+class TestLoopWatchdog(unittest.TestCase):
+
+    def test_reports_blocking_call(self):
+        watchdog = LoopWatchdog(threshold=0.05, interval=0.01)
+
+        async def main():
+            task = asyncio.create_task(watchdog.start())
+            await asyncio.sleep(0.05)
+            block_the_loop()
+            await asyncio.sleep(0.05)
+            watchdog.stop()
+            await task
+
+        with self.assertLogs("loop_watchdog", level="WARNING") as logs:
+            asyncio.run(main())
+        self.assertEqual(watchdog.stalls, 1)
+        self.assertIn("block_the_loop", logs.output[0])
+        self.assertGreaterEqual(LATENCY.histogram("loop_lag").max, 0.15)
+
+    def test_measures_without_threshold(self):
+        watchdog = LoopWatchdog(interval=0.01)
+
+        async def main():
+            task = asyncio.create_task(watchdog.start())
+            await asyncio.sleep(0.05)
+            watchdog.stop()
+            await task
+
+        asyncio.run(main())
+        self.assertIsNone(watchdog._thread)
+        self.assertEqual(watchdog.stalls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+
+import discord
+
+from bot.latency import LatencyHistogram
+from bot.music_client import MusicClient
+from metrics import Exposition, MetricsServer
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class TestExposition(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.0001)
+        histogram.record(100.0)
+        out = Exposition()
+        out.histogram("latency_seconds", histogram, {"stage": "a"})
+        lines = out.text().splitlines()
+        self.assertEqual(lines[0], 'latency_seconds_bucket{stage="a",le="0.0005"} 1')
+        self.assertIn('latency_seconds_bucket{stage="a",le="+Inf"} 2', lines)
+        self.assertEqual(lines[-1], 'latency_seconds_count{stage="a"} 2')
+
+    def test_escapes_labels(self):
+        out = Exposition()
+        out.sample("metric", 1, {"name": 'a "b"\n'})
+        self.assertEqual(out.text(), 'metric{name="a \\"b\\"\\n"} 1\n')
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MusicClient(intents=discord.Intents.default())
+
+    def test_collect(self):
+        session = self.client.get_session(FakeGuild(7))
+        session.playlist.extend(["a", "b"])
+        text = MetricsServer(self.client, "127.0.0.1", 0).collect()
+        self.assertIn('gm_queue_length{guild="7"} 2', text)
+        self.assertIn('gm_voice_frames_total{guild="7"} 0', text)
+        self.assertIn("# TYPE gm_latency_seconds histogram", text)
+
+    def test_serves_metrics(self):
+        async def scrape(path: str) -> bytes:
+            server = MetricsServer(self.client, "127.0.0.1", 0)
+            task = asyncio.create_task(server.start())
+            while server.server is None:
+                await asyncio.sleep(0)
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            server.stop()
+            await task
+            return response
+
+        response = asyncio.run(scrape("/metrics"))
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b"gm_ffmpeg_processes 0\n", response)
+        response = asyncio.run(scrape("/"))
+        self.assertTrue(response.startswith(b"HTTP/1.1 404 Not Found\r\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
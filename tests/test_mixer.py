@@ -0,0 +1,87 @@
+import unittest
+
+import discord
+import numpy as np
+
+from bot.mixer import TrackMixer
+
+
+class FakeTrack(discord.AudioSource):
+    """Plays `count` frames of a constant sample value."""
+
+    def __init__(self, value: int, count: int, duration: float | None = None):
+        self.frame = np.full(TrackMixer.SAMPLES, value, dtype=np.int16).tobytes()
+        self.left = count
+        self.data = {"duration": duration}
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        if self.left <= 0:
+            return b""
+        self.left -= 1
+        return self.frame
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+def level(data: bytes) -> int:
+    return int(np.frombuffer(data, dtype=np.int16)[-1])
+
+
+class TestTrackMixer(unittest.TestCase):
+
+    def test_gapless(self):
+        first, second = FakeTrack(100, 3), FakeTrack(200, 2)
+        advanced = []
+        mixer = TrackMixer(first, on_advance=advanced.append)
+        mixer.queue(second)
+
+        played = []
+        while data := mixer.read():
+            played.append(level(data))
+        self.assertEqual(played, [100, 100, 100, 200, 200])
+        self.assertEqual(advanced, [second])
+        self.assertTrue(first.cleaned_up)
+
+    def test_ends_without_next(self):
+        mixer = TrackMixer(FakeTrack(100, 1))
+        self.assertEqual(level(mixer.read()), 100)
+        self.assertEqual(mixer.read(), b"")
+
+    def test_crossfade(self):
+        first = FakeTrack(1000, 10, duration=10 / TrackMixer.FRAMES_PER_SECOND)
+        second = FakeTrack(-1000, 10)
+        advanced = []
+        mixer = TrackMixer(first, crossfade_frames=4, on_advance=advanced.append)
+        mixer.queue(second)
+
+        played = []
+        while data := mixer.read():
+            played.append(level(data))
+        self.assertEqual(played[:6], [1000] * 6)
+        self.assertEqual(played[6:10], [500, 0, -500, -1000])  # Faded at frame ends.
+        self.assertEqual(played[10:], [-1000] * 6)
+        self.assertEqual(advanced, [second])
+        self.assertTrue(first.cleaned_up)
+
+    def test_discard_next(self):
+        first, second = FakeTrack(100, 1), FakeTrack(200, 1)
+        mixer = TrackMixer(first)
+        mixer.queue(second)
+        mixer.discard_next()
+        self.assertTrue(second.cleaned_up)
+        mixer.read()
+        self.assertEqual(mixer.read(), b"")
+
+    def test_queue_after_cleanup(self):
+        mixer = TrackMixer(FakeTrack(100, 1))
+        mixer.cleanup()
+        track = FakeTrack(200, 1)
+        mixer.queue(track)
+        self.assertTrue(track.cleaned_up)
+        self.assertIsNone(mixer.next)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -66,3 +66,104 @@ class TestMusicQueue(unittest.TestCase):
                 "Should throw an error! There is no previous song before 'a'.")
         except Playlist.ExhaustedException:
             pass
+
+    def test_prev_steps_back(self):
+        playlist = Playlist()
+        playlist.add("a")
+        playlist.add("b")
+        playlist.add("c")
+        playlist.next()
+        playlist.next()
+        playlist.next()  # Playing c
+
+        # Mirrors `GuildSession.song_prev`, which queues the previous song then skips.
+        playlist.add(playlist.prev(), index=0)
+        self.assertEqual(playlist.next(), "b")
+        playlist.add(playlist.prev(), index=0)
+        self.assertEqual(playlist.next(), "a")
+        self.assertEqual(list(playlist.song_queue), ["b", "c"])
+
+    def test_shuffle_next(self):
+        playlist = Playlist(seed=42)
+        for url in "abcdef":
+            playlist.add(url)
+        playlist.shuffle_mode()
+
+        peeked = playlist.upcoming(3)
+        played = [playlist.next() for _ in range(6)]
+        self.assertEqual(played[:3], peeked)
+        self.assertEqual(sorted(played), list("abcdef"))
+        with self.assertRaises(Playlist.ExhaustedException):
+            playlist.next()
+
+    def test_shuffle_seed(self):
+        orders = []
+        for _ in range(2):
+            playlist = Playlist()
+            for url in "abcdefgh":
+                playlist.add(url)
+            playlist.shuffle_mode(seed=7)
+            orders.append([playlist.next() for _ in range(8)])
+        self.assertEqual(orders[0], orders[1])
+
+    def test_shuffle_loop_rounds(self):
+        playlist = Playlist()
+        for url in "abcde":
+            playlist.add(url)
+        playlist.shuffle_mode()
+        playlist.loop_mode()
+
+        for _ in range(3):
+            played = [playlist.next() for _ in range(5)]
+            self.assertEqual(sorted(played), list("abcde"))
+
+    def test_shuffle_add(self):
+        playlist = Playlist()
+        for url in "abc":
+            playlist.add(url)
+        playlist.shuffle_mode()
+        playlist.next()
+        playlist.add("d")
+        playlist.add("e", index=0)
+
+        self.assertEqual(playlist.next(), "e")
+        played = [playlist.next() for _ in range(3)]
+        self.assertIn("d", played)
+
+    def test_shuffle_add_to_empty_queue(self):
+        firsts = set()
+        for seed in range(20):
+            playlist = Playlist(seed=seed)
+            playlist.shuffle_mode()
+            for url in "abcde":
+                playlist.add(url)
+            firsts.add(playlist.next())
+        self.assertGreater(len(firsts), 1)
+
+    def test_shuffle_loop_add_at_round_boundary(self):
+        firsts = set()
+        for seed in range(20):
+            playlist = Playlist(seed=seed)
+            for url in "abcd":
+                playlist.add(url)
+            playlist.shuffle_mode()
+            playlist.loop_mode()
+            played = [playlist.next() for _ in range(4)]
+            playlist.add("e")
+            played = [playlist.next() for _ in range(5)]
+            self.assertEqual(sorted(played), list("abcde"))
+            firsts.add(played[0])
+        self.assertGreater(len(firsts), 1)
+
+    def test_extend_unique(self):
+        playlist = Playlist()
+        playlist.add("https://youtu.be/a")
+        added = playlist.extend(
+            ["https://www.youtube.com/watch?v=a", "https://youtu.be/b", "https://youtu.be/b"],
+            unique=True,
+        )
+
+        self.assertEqual(added, 1)
+        self.assertEqual(list(playlist.song_queue), ["https://youtu.be/a", "https://youtu.be/b"])
+        playlist.next()
+        self.assertFalse(playlist.contains("https://youtu.be/a"))
@@ -0,0 +1,78 @@
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from bot.audio_cache import AudioCache
+from bot.info_cache import InfoCache
+from bot.playlist import Playlist
+from bot.prefetch import Prefetcher
+from bot.yt_source import YTDLSource
+
+
+class TestPrefetcher(unittest.TestCase):
+
+    def test_prefetches_upcoming(self):
+        resolved = []
+
+        async def resolve(url):
+            resolved.append(url)
+
+        async def run():
+            playlist = Playlist()
+            prefetcher = Prefetcher(playlist, resolve, depth=2)
+            playlist.shuffle_mode()
+            playlist.extend(["a", "b", "c", "d"])
+            await asyncio.sleep(0.01)
+            self.assertTrue(prefetcher._task.done())  # Resolved before they are played.
+            return [playlist.next(), playlist.next()]
+
+        played = asyncio.run(run())
+        self.assertEqual(resolved, played)
+
+    def test_refreshed_on_change(self):
+        resolved = []
+
+        async def resolve(url):
+            await asyncio.sleep(0.01)
+            resolved.append(url)
+
+        async def run():
+            playlist = Playlist()
+            Prefetcher(playlist, resolve, depth=1)
+            playlist.add("a")
+            await asyncio.sleep(0)
+            playlist.add("b", index=0)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+        # The shielded resolution of 'a' completes, then 'b' is prefetched.
+        self.assertEqual(sorted(resolved), ["a", "b"])
+
+
+class TestYTDLSourcePrefetch(unittest.TestCase):
+
+    def test_extracts_uncached_songs_only(self):
+        extracted = []
+
+        async def extract(url, *, loop=None, stream=False):
+            extracted.append(url)
+
+        async def download(url, directory):
+            raise OSError("Not downloaded")
+
+        with tempfile.TemporaryDirectory() as directory:
+            audio_cache = AudioCache(directory, 1000, download)
+            info_cache = InfoCache()
+            info_cache.put("https://a", {"url": "https://stream/a"})
+            with (
+                mock.patch.object(YTDLSource, "extract", extract),
+                mock.patch.object(YTDLSource, "info_cache", info_cache),
+                mock.patch.object(YTDLSource, "audio_cache", audio_cache),
+            ):
+                asyncio.run(YTDLSource.prefetch("https://b"))  # The cache is empty.
+                asyncio.run(YTDLSource.prefetch("https://a"))
+                audio_cache._entries["https://c"] = ("c.webm", 1, "C")
+                asyncio.run(YTDLSource.prefetch("https://c"))
+
+        self.assertEqual(extracted, ["https://b"])
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+import unittest
+
+import utils
+from bot.queue_file import read_queue_file
+
+
+class TestQueueFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, content: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def test_newline(self):
+        path = self.write("songs.txt", "a\n\n  b  \nc")
+        self.assertEqual(list(read_queue_file(path)), ["a", "b", "c"])
+
+    def test_m3u(self):
+        path = self.write("songs.m3u", "#EXTM3U\n#EXTINF:123,Song A\na\n#EXTINF:-1,Song B\nb\n")
+        self.assertEqual(list(read_queue_file(path)), ["a", "b"])
+
+    def test_json(self):
+        path = self.write("songs.json", json.dumps(["a", {"url": "b"}, {"title": "c"}]))
+        self.assertEqual(list(read_queue_file(path)), ["a", "b"])
+
+    def test_canonical_url(self):
+        self.assertEqual(
+            utils.canonical_url("https://www.youtube.com/watch?v=abc&t=10"),
+            utils.canonical_url("https://youtu.be/abc"),
+        )
+        self.assertEqual(
+            utils.canonical_url("HTTPS://Example.com/song/"),
+            "https://example.com/song",
+        )
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import discord
+
+from bot.journal import PlaylistJournal
+from bot.mixer import TrackMixer
+from bot.music_client import MusicClient
+from bot.playlist import Playlist
+from bot.yt_source import YTDLSource
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class TestGuildSessions(unittest.TestCase):
+    def setUp(self):
+        self.client = MusicClient(intents=discord.Intents.default())
+
+    def test_session_per_guild(self):
+        first = self.client.get_session(FakeGuild(1))
+        second = self.client.get_session(FakeGuild(2))
+        self.assertIsNot(first, second)
+        self.assertIsNot(first.playlist, second.playlist)
+        self.assertIs(self.client.get_session(FakeGuild(1)), first)
+
+    def test_routes_to_selected_session(self):
+        first = self.client.get_session(FakeGuild(1))
+        second = self.client.get_session(FakeGuild(2))
+
+        self.client.selected = first
+        self.client.playlist_queue(["a"])
+        self.client.set_audio_volume(20)
+        self.client.selected = second
+        self.client.playlist_queue(["b", "c"])
+        self.client.playlist_loop()
+
+        self.assertEqual(list(first.playlist.song_queue), ["a"])
+        self.assertEqual(list(second.playlist.song_queue), ["b", "c"])
+        self.assertEqual((first.volume, second.volume), (0.2, 0.5))
+        self.assertEqual((first.playlist.loop, second.playlist.loop), (False, True))
+
+    def test_publishes_state_changes(self):
+        session = self.client.get_session(FakeGuild(1))
+        subscription = self.client.events.subscribe(policy="drop_oldest")
+        session.playlist_queue(["a", "b"])
+        session.playlist.loop_mode()
+        session.set_audio_volume(30)
+
+        events = subscription.get_nowait()
+        self.assertEqual(
+            [event["type"] for event in events], ["queue", "mode", "volume"]
+        )
+        self.assertEqual((events[0]["mutation"], events[0]["length"]), ("extend", 2))
+        self.assertEqual(events[1]["loop"], True)
+        self.assertEqual(events[2]["volume"], 30)
+        self.assertEqual(
+            session.state(),
+            {
+                "guild": 1,
+                "seq": 3,
+                "title": None,
+                "length": 2,
+                "shuffle": False,
+                "loop": True,
+                "repeat": False,
+                "volume": 30,
+                "channel": None,
+                "channel_id": None,
+            },
+        )
+
+    def test_import(self):
+        session = self.client.selected = self.client.get_session(FakeGuild(1))
+        session.playlist_queue(["a"])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "my unique songs.txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("a\nb\nc\n")
+            asyncio.run(self.client.playlist_import(["--unique", *path.split(" ")]))
+        self.assertEqual(list(session.playlist.song_queue), ["a", "b", "c"])
+
+    def test_failed_import(self):
+        self.client.selected = self.client.get_session(FakeGuild(1))
+        with self.assertLogs("bot.session", "INFO") as logs:
+            asyncio.run(self.client.playlist_import(["missing.txt"]))
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("Failed to import", logs.output[0])
+
+    def test_restores_before_connecting(self):
+        async def restore(state_dir: str) -> list[str]:
+            journal = PlaylistJournal(os.path.join(state_dir, "1"))
+            journal.attach(Playlist())
+            journal.playlist.extend(["a", "b"])
+            await journal.flush()
+
+            client = MusicClient(intents=discord.Intents.default(), state_dir=state_dir)
+            client.loop = asyncio.get_running_loop()
+            await client.setup_hook()
+            with mock.patch.object(PlaylistJournal, "restore") as restore:
+                session = client.get_session(FakeGuild(1))
+            restore.assert_not_called()
+            await session.close()
+            return list(session.playlist.song_queue)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(asyncio.run(restore(directory)), ["a", "b"])
+
+    def test_no_session_selected(self):
+        with self.assertLogs("bot.music_client", "WARNING"):
+            self.assertIsNone(self.client.playlist_queue(["a"]))
+
+
+class FakeTrack(discord.AudioSource):
+    def __init__(self, title: str):
+        self.title = title
+        self.volume = 0.5
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        return b""
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class FakeVoiceClient:
+    def __init__(self):
+        self.stopped = 0
+
+    def is_playing(self) -> bool:
+        return True
+
+    def stop(self):
+        self.stopped += 1
+
+
+class TestGaplessPlayback(unittest.TestCase):
+    def setUp(self):
+        self.client = MusicClient(intents=discord.Intents.default())
+        self.session = self.client.get_session(FakeGuild(1))
+        self.session.voice_client = FakeVoiceClient()
+        self.session.playlist_queue(["a", "b", "c"])
+        self.session.playlist.next()
+        self.mixer = self.session.mixer = TrackMixer(FakeTrack("a"))
+        self.track = self.session._queued_track = FakeTrack("b")
+        self.session._queued_url = "b"
+
+    def test_advances_playlist(self):
+        self.session._advanced(self.mixer, self.track)
+        self.assertEqual(self.session.playlist.current_song, "b")
+        self.assertIs(self.session.player, self.track)
+        self.assertEqual(self.session.voice_client.stopped, 0)
+
+    def test_stopped_player_advances_playlist(self):
+        asyncio.run(self.session.song_skip())
+        self.session._advanced(self.mixer, self.track)
+        self.assertEqual(self.session.playlist.current_song, "a")
+
+    def test_replaced_mixer(self):
+        self.session.mixer = None
+        self.session._advanced(self.mixer, self.track)
+        self.assertEqual(self.session.playlist.current_song, "a")
+
+    def test_restreams_changed_playlist(self):
+        self.session.playlist.add("d", index=0)
+        self.session._advanced(self.mixer, self.track)
+        self.assertEqual(self.session.playlist.current_song, "d")
+        self.assertEqual(self.session._restream_url, "d")
+        self.assertEqual(self.session.voice_client.stopped, 1)
+        self.assertIsNone(self.session.mixer)
+
+    def test_ignores_stale_player_callback(self):
+        with mock.patch.object(self.session, "stream_next") as stream_next:
+            asyncio.run(self.session._played(object(), None, 0.0))
+        stream_next.assert_not_called()
+        self.assertEqual(self.session.playlist.current_song, "a")
+
+    def test_queues_changed_upcoming_song(self):
+        async def queue():
+            self.client.loop = asyncio.get_running_loop()
+            self.session._queued_url = self.session._queued_track = None
+            self.session._queue_next()
+            await self.session._queue_task
+            self.session.playlist.extend(["d"])
+            self.session._queue_next()
+            self.session.playlist.add("e", index=0)
+            await self.session._queue_task
+
+        opened = []
+
+        async def from_url(url, **_):
+            opened.append(url)
+            return FakeTrack(url)
+
+        with (
+            mock.patch.object(YTDLSource, "from_url", from_url),
+            mock.patch.object(YTDLSource, "record_play") as record_play,
+        ):
+            asyncio.run(queue())
+        self.assertEqual(opened, ["b", "e"])
+        record_play.assert_not_called()
+        self.assertEqual(self.session._queued_url, "e")
+
+
+if __name__ == "__main__":
+    unittest.main()
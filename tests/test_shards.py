@@ -0,0 +1,102 @@
+import asyncio
+import multiprocessing
+import unittest
+from unittest import mock
+
+from companion import CompanionConsole
+from console import Command
+from shards import ShardConsole, ShardError, ShardSupervisor, shard_of
+
+
+class TestShardSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = ShardSupervisor("token", 2, {})
+        self.sent = []
+        self.replies = {}  # Reply of the shards to each command, by command.
+        for shard in self.supervisor.shards:
+            shard.send = lambda *message, shard=shard: self.reply(shard, *message)
+        # Guild ids owned by shard 0 and shard 1.
+        self.supervisor.shards[0].guilds = [(0 << 22, "first")]
+        self.supervisor.shards[1].guilds = [(1 << 22, "second")]
+
+    def reply(self, shard, kind, guild_id, args, request_id) -> bool:
+        """Stands in for the worker of `shard`, replying to its command."""
+        self.sent.append((shard.shard_id, kind, guild_id, args))
+        reply = self.replies.get(args[0], (None, None, ""))
+        asyncio.get_running_loop().call_soon(
+            shard.receive, ("reply", request_id, *reply)
+        )
+        return True
+
+    def test_shard_of(self):
+        self.assertEqual(shard_of(81384788765712384, 1), 0)
+        self.assertEqual(shard_of(81384788765712384, 2), 0)
+        self.assertEqual(shard_of(5 << 22, 4), 1)
+
+    def test_forwards_to_owning_shard(self):
+        console = ShardConsole(self.supervisor)
+        asyncio.run(console.handle_command(["guild", "1"]))
+        asyncio.run(console.handle_command(["skip"]))
+        asyncio.run(console.handle_command(["guild", "0"]))
+        asyncio.run(console.handle_command(["volume", "20"]))
+        self.assertEqual(
+            self.sent,
+            [(1, "command", 1 << 22, ["skip"]), (0, "command", 0, ["volume", "20"])],
+        )
+
+    def test_no_guild_selected(self):
+        console = ShardConsole(self.supervisor)
+        with self.assertLogs("shards", "WARNING"):
+            asyncio.run(console.handle_command(["skip"]))
+        self.assertEqual(self.sent, [])
+
+    def test_returns_shard_results(self):
+        companion = CompanionConsole(ShardConsole(self.supervisor), "localhost", 0)
+        self.supervisor.selected = 1 << 22
+        self.replies["history"] = (None, ["a"], "[0] - a\n")
+        self.replies["volume"] = (("UsageError", "Expects one argument"), None, "")
+        self.replies["dance"] = (("UnknownCommandError", "Not supported"), None, "")
+
+        async def execute(args: list[str]):
+            return await companion.execute(args)
+
+        self.assertEqual(asyncio.run(execute(["history"])), (["a"], "[0] - a\n"))
+        with self.assertRaises(Command.UsageError):
+            asyncio.run(execute(["volume"]))
+        with self.assertRaisesRegex(ShardError, "UnknownCommandError"):
+            asyncio.run(execute(["dance"]))
+
+    def test_receives_replies(self):
+        async def request():
+            shard = self.supervisor.shards[0]
+            shard.events, events = multiprocessing.Pipe(duplex=False)
+            del shard.send
+            shard.commands, commands = multiprocessing.Pipe()
+            reply = asyncio.create_task(shard.request(0, ["skip"]))
+            await asyncio.sleep(0)
+            _, _, _, request_id = commands.recv()
+            events.send(("heartbeat", True, [(0, "first")]))
+            events.send(("reply", request_id, None, 5, ""))
+            shard.poll()
+            self.assertTrue(shard.ready)
+            return await reply
+
+        self.assertEqual(asyncio.run(request()), (5, ""))
+
+    def test_fails_requests_of_killed_shard(self):
+        async def request():
+            shard = self.supervisor.shards[0]
+            shard.send = lambda *message: True
+            reply = asyncio.create_task(shard.request(0, ["skip"]))
+            await asyncio.sleep(0)
+            shard.process = shard.commands = shard.events = mock.Mock()
+            shard.kill()
+            return await reply
+
+        with self.assertRaisesRegex(ShardError, "restarted"):
+            asyncio.run(request())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from bot.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_coalesces(self):
+        flight = SingleFlight()
+        started = []
+
+        async def work():
+            started.append(None)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(run()), ["result"] * 3)
+        self.assertEqual(len(started), 1)
+        self.assertEqual(flight.stats(), {"calls": 1, "coalesced": 2, "in_flight": 0})
+
+    def test_cancelled_caller(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            first = asyncio.ensure_future(flight.do("key", work))
+            second = asyncio.ensure_future(flight.do("key", work))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "result")
+
+    def test_error_shared(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise ValueError("failed")
+
+        async def run():
+            return await asyncio.gather(
+                flight.do("key", work), flight.do("key", work), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(len(flight), 0)
@@ -0,0 +1,51 @@
+import random
+import unittest
+
+from bot.song_queue import SongQueue
+
+
+class TestSongQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.block_size = SongQueue.BLOCK_SIZE
+        SongQueue.BLOCK_SIZE = 4  # Small blocks to exercise splitting and trimming.
+
+    def tearDown(self):
+        SongQueue.BLOCK_SIZE = self.block_size
+
+    def test_ends(self):
+        queue = SongQueue(["b", "c"])
+        queue.appendleft("a")
+        queue.append("d")
+
+        self.assertEqual(list(queue), ["a", "b", "c", "d"])
+        self.assertEqual(queue.popleft(), "a")
+        self.assertEqual(queue.pop(), "d")
+        self.assertEqual(len(queue), 2)
+
+    def test_matches_list(self):
+        rng = random.Random(0)
+        queue, expected = SongQueue(), []
+        for i in range(2000):
+            op = rng.randrange(5)
+            if op == 0 or not expected:
+                index = rng.randint(-len(expected) - 1, len(expected) + 1)
+                queue.insert(index, str(i))
+                expected.insert(index, str(i))
+            elif op == 1:
+                queue.append(str(i))
+                expected.append(str(i))
+            elif op == 2:
+                queue.appendleft(str(i))
+                expected.insert(0, str(i))
+            else:
+                index = rng.randrange(len(expected))
+                self.assertEqual(queue.pop(index), expected.pop(index))
+            self.assertEqual(len(queue), len(expected))
+        self.assertEqual(list(queue), expected)
+        self.assertEqual([queue[i] for i in range(len(queue))], expected)
+
+    def test_pop_empty(self):
+        queue = SongQueue()
+        with self.assertRaises(IndexError):
+            queue.pop()
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import unittest
+from unittest import mock
+
+import discord
+
+from bot.yt_source import YTDLOpusSource, YTDLSource
+
+
+class TestOpusMode(unittest.TestCase):
+
+    def setUp(self):
+        self.spawned = []
+
+        def spawn(source, args, **kwargs):
+            self.spawned.append(args)
+            return mock.MagicMock(stdout=io.BytesIO())
+
+        patches = [
+            mock.patch.object(discord.player.FFmpegAudio, "_spawn_process", spawn),
+            mock.patch.object(YTDLSource, "opus", True),
+            mock.patch.object(YTDLSource, "buffer_options", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def build(self, data: dict, volume: float = 1.0) -> discord.AudioSource:
+        return asyncio.run(YTDLSource._build("song.webm", data=data, volume=volume))
+
+    def test_ffmpeg_args(self):
+        self.assertEqual(
+            YTDLOpusSource.ffmpeg_args("opus"), {"codec": "opus", "options": "-vn"}
+        )
+        self.assertEqual(
+            YTDLOpusSource.ffmpeg_args("mp4a.40.2"), {"codec": None, "options": "-vn"}
+        )
+        self.assertEqual(
+            YTDLOpusSource.ffmpeg_args("opus", 0.5),
+            {"codec": None, "options": "-vn -filter:a volume=0.5"},
+        )
+
+    def test_opus_passed_through_at_full_volume(self):
+        source = self.build({"acodec": "opus"})
+        self.assertIsInstance(source, YTDLOpusSource)
+        args = self.spawned[-1]
+        self.assertEqual(args[args.index("-c:a") + 1], "copy")
+        self.assertFalse(any("volume" in arg for arg in args))
+
+    def test_volume_applied_by_ffmpeg(self):
+        source = self.build({"acodec": "opus"}, volume=0.25)
+        args = self.spawned[-1]
+        self.assertEqual(args[args.index("-c:a") + 1], "libopus")
+        self.assertEqual(args[args.index("-filter:a") + 1], "volume=0.25")
+        self.assertEqual(source.volume, 0.25)
+
+    def test_other_codecs_encoded(self):
+        self.build({"acodec": "mp4a.40.2"})
+        args = self.spawned[-1]
+        self.assertEqual(args[args.index("-c:a") + 1], "libopus")
+
+    def test_probed_codec(self):
+        probe = mock.AsyncMock(return_value=("opus", 160))
+        with mock.patch.object(discord.FFmpegOpusAudio, "probe", probe):
+            source = self.build({})
+        self.assertIsInstance(source, YTDLOpusSource)
+        probe.assert_awaited_once_with("song.webm")
+
+    def test_failed_probe_decodes_to_pcm(self):
+        probe = mock.AsyncMock(return_value=(None, None))
+        with (
+            mock.patch.object(discord.FFmpegOpusAudio, "probe", probe),
+            self.assertLogs("bot.yt_source", "ERROR"),
+        ):
+            source = self.build({})
+        self.assertIsInstance(source, YTDLSource)
+        self.assertNotIn("-c:a", self.spawned[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()